@@ -0,0 +1,47 @@
+from functools import partial, wraps
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from core.shortcuts import aget_object_or_404
+from quotes.models import ArchivedInvoice, Invoice
+
+
+def invoice_owner_required(view_func=None, *, allow_archived=False):
+    """Resolve the ``number`` URL kwarg to an invoice owned by the logged-in user.
+
+    Ownership is a plain ``user_id`` match; orphan invoices are claimed when the
+    account is verified (see ``Invoice.claim_for_user``). The wrapped view is
+    called as ``view(request, invoice)``; async views are supported.
+
+    With ``allow_archived=True`` an invoice that has been archived is restored
+    from ``ArchivedInvoice`` as a read-only instance (``invoice.is_archived``).
+    """
+    if view_func is None:
+        return partial(invoice_owner_required, allow_archived=allow_archived)
+
+    if iscoroutinefunction(view_func):
+        @login_required
+        @wraps(view_func)
+        async def _awrapped(request, number, *args, **kwargs):
+            user = await request.auser()
+            try:
+                invoice = await Invoice.objects.select_related('quote').aget(number=number, user=user)
+            except Invoice.DoesNotExist:
+                if not allow_archived:
+                    raise Http404("No Invoice matches the given query.")
+                invoice = (await aget_object_or_404(ArchivedInvoice.objects.all(), number=number, user=user)).restore()
+            return await view_func(request, invoice, *args, **kwargs)
+        return _awrapped
+
+    @login_required
+    @wraps(view_func)
+    def _wrapped(request, number, *args, **kwargs):
+        try:
+            invoice = Invoice.objects.select_related('quote').get(number=number, user=request.user)
+        except Invoice.DoesNotExist:
+            if not allow_archived:
+                raise Http404("No Invoice matches the given query.")
+            invoice = get_object_or_404(ArchivedInvoice, number=number, user=request.user).restore()
+        return view_func(request, invoice, *args, **kwargs)
+    return _wrapped
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_email_unique_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailverification',
+            index=models.Index(fields=['user', 'verified_at'], name='emailverif_user_verified_idx'),
+        ),
+    ]
@@ -11,6 +11,10 @@ class EmailVerification(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Pending-verification lookups per user (resend, login checks)
+            models.Index(fields=["user", "verified_at"], name="emailverif_user_verified_idx"),
+        ]
 
     def __str__(self):
         return f"Verification for {self.user.username} ({'verified' if self.verified_at else 'pending'})"
@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (
     register, UserLoginView, logout_view, profile, verify_email, verify_sent, resend_verification,
-    invoices_list, invoice_detail, invoice_payment_methods, pay_invoice, invoice_pay_success, invoice_pay_cancel, stripe_webhook
+    invoices_list, invoice_detail, invoice_timeline, invoice_payment_methods, pay_invoice, invoice_pay_success, invoice_pay_cancel, stripe_webhook
 )
 
 app_name = 'accounts'
@@ -16,6 +16,7 @@ urlpatterns = [
     path('resend-verification/', resend_verification, name='resend_verification'),
     path('invoices/', invoices_list, name='invoices'),
     path('invoices/<str:number>/', invoice_detail, name='invoice_detail'),
+    path('invoices/<str:number>/timeline/', invoice_timeline, name='invoice_timeline'),
     path('invoices/<str:number>/payment-methods/', invoice_payment_methods, name='invoice_payment_methods'),
     path('invoices/<str:number>/pay/', pay_invoice, name='invoice_pay'),
     path('invoices/<str:number>/pay/success/', invoice_pay_success, name='invoice_pay_success'),
@@ -10,18 +10,25 @@ from django.urls import reverse
 from django.core.mail import send_mail
 from django.conf import settings
 from .models import EmailVerification
+from .decorators import invoice_owner_required
 from django.utils import timezone
-from django.db.models import Q
-from quotes.models import Invoice, InvoicePayment
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.db.models import Q, prefetch_related_objects
+from datetime import datetime
+from quotes.models import Invoice, InvoiceEvent, InvoicePayment
+from quotes.payments import compute_stripe_fee, stripe_client, summarize_payments
 from decimal import Decimal, ROUND_HALF_UP
-try:
-    from core.models import CompanyDetails
-except Exception:
-    CompanyDetails = None
+from core.company import company_profile
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponse
+import asyncio
 import stripe
-from django.conf import settings
+import time
+from core.metrics import WEBHOOK_DURATION, WEBHOOK_LAG, WEBHOOK_REQUESTS
+from core.cache import get_versions
+from core.replica import read_from_replica
+from core.shortcuts import arender
+from asgiref.sync import sync_to_async
 
 CUSTOMER_GROUP_NAME = 'Customer'
 
@@ -90,6 +97,7 @@ def verify_email(request, token):
         user = verification.user
         user.is_active = True
         user.save(update_fields=['is_active'])
+        Invoice.claim_for_user(user)
         messages.success(request, 'Email verified. You can now log in.')
     else:
         messages.info(request, 'Email already verified.')
@@ -125,118 +133,151 @@ def resend_verification(request):
     return redirect('accounts:verify_sent')
 
 
-@login_required
-def invoices_list(request):
-    qs = Invoice.objects.filter(
-        Q(user=request.user) | Q(user__isnull=True, client_email__iexact=request.user.email)
-    ).order_by('-created_at')
-    return render(request, 'accounts/invoices_list.html', {'invoices': qs})
+INVOICES_PAGE_SIZE = 25
+
+
+def _encode_invoice_cursor(invoice):
+    raw = f"{invoice.created_at.isoformat()}|{invoice.pk}"
+    return urlsafe_base64_encode(raw.encode())
 
 
+def _decode_invoice_cursor(cursor):
+    try:
+        created_at, pk = urlsafe_base64_decode(cursor).decode().split('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+@read_from_replica
 @login_required
-def invoice_detail(request, number):
-    invoice = get_object_or_404(
-        Invoice,
-        Q(number=number) & (Q(user=request.user) | Q(user__isnull=True, client_email__iexact=request.user.email))
+def invoices_list(request):
+    # Keyset pagination over (created_at, id) so each page is one indexed range scan
+    qs = (
+        Invoice.objects.filter(user=request.user)
+        .select_related('quote')
+        .with_payment_totals()
+        .order_by('-created_at', '-id')
     )
-    payments = invoice.payments.all().order_by('created_at')
-    outstanding = invoice.total - sum(p.amount for p in payments.filter(status=InvoicePayment.COMPLETED))
-    can_pay = invoice.status != Invoice.PAID and outstanding > 0
+    position = _decode_invoice_cursor(request.GET.get('after', ''))
+    if position:
+        created_at, pk = position
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    invoices = list(qs[:INVOICES_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(invoices) > INVOICES_PAGE_SIZE:
+        invoices = invoices[:INVOICES_PAGE_SIZE]
+        next_cursor = _encode_invoice_cursor(invoices[-1])
+    return render(request, 'accounts/invoices_list.html', {
+        'invoices': invoices,
+        'next_cursor': next_cursor,
+        'is_first_page': position is None,
+    })
+
+
+@read_from_replica
+@invoice_owner_required(allow_archived=True)
+def invoice_detail(request, invoice):
+    prefetch_related_objects([invoice], 'assigned_to', 'events', 'quote__items')
+    summary = summarize_payments(invoice)
     return render(request, 'accounts/invoice_detail.html', {
         'invoice': invoice,
-        'payments': payments,
-        'outstanding': outstanding,
-        'can_pay': can_pay,
+        'payments': summary.payments,
+        'outstanding': summary.outstanding,
+        'can_pay': summary.can_pay,
         'stripe_public_key': settings.STRIPE_PUBLIC_KEY,
     })
 
 
-def _compute_stripe_fee(amount: Decimal) -> Decimal:
-    if amount <= 0:
-        return Decimal('0.00')
-    percent = Decimal(str(getattr(settings, 'STRIPE_FEE_PERCENT', '2.9')))
-    fixed = Decimal(str(getattr(settings, 'STRIPE_FEE_FIXED', '0.20')))
-    gross_up = bool(getattr(settings, 'STRIPE_FEE_GROSS_UP', True))
-    if gross_up:
-        # Solve for gross so that net after fees equals amount
-        gross = (amount + fixed) / (Decimal('1.00') - (percent / Decimal('100')))
-        fee = (gross - amount).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    else:
-        fee = (amount * (percent / Decimal('100')) + fixed).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    return max(fee, Decimal('0.00'))
-
-
-def _get_bank_details():
-    details = {
-        'bank_name': getattr(settings, 'COMPANY_BANK_NAME', ''),
-        'account_name': getattr(settings, 'COMPANY_BANK_ACCOUNT_NAME', ''),
-        'account_number': getattr(settings, 'COMPANY_BANK_ACCOUNT_NUMBER', ''),
-        'sort_code': getattr(settings, 'COMPANY_BANK_SORT_CODE', ''),
-        'iban': getattr(settings, 'COMPANY_BANK_IBAN', ''),
-        'bic': getattr(settings, 'COMPANY_BANK_BIC', ''),
-    }
-    # If CompanyDetails model has bank fields, prefer those
-    if CompanyDetails:
-        try:
-            cd = CompanyDetails.get()
-            if cd:
-                for k in list(details.keys()):
-                    if hasattr(cd, k) and getattr(cd, k):
-                        details[k] = getattr(cd, k)
-        except Exception:
-            pass
-    return details
+EVENT_LABELS = dict(InvoiceEvent.TYPE_CHOICES)
 
 
-@login_required
-def invoice_payment_methods(request, number):
-    invoice = get_object_or_404(
-        Invoice,
-        Q(number=number) & (Q(user=request.user) | Q(user__isnull=True, client_email__iexact=request.user.email))
-    )
-    payments = invoice.payments.all().order_by('created_at')
-    total_completed = sum(p.amount for p in payments.filter(status=InvoicePayment.COMPLETED))
-    outstanding = (invoice.total - total_completed)
-    stripe_available = bool(settings.STRIPE_PUBLIC_KEY and settings.STRIPE_SECRET_KEY)
-    stripe_fee = _compute_stripe_fee(outstanding) if stripe_available and outstanding > 0 else Decimal('0.00')
-    card_total = (outstanding + stripe_fee).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-    bank = _get_bank_details()
-    completed_payments = [p for p in payments if p.status == InvoicePayment.COMPLETED]
-    pending_payments = [p for p in payments if p.status == InvoicePayment.PENDING]
-    failed_payments = [p for p in payments if p.status == InvoicePayment.FAILED]
+async def _events_after(invoice_id, since):
+    # Served by the (invoice, id) index: only rows newer than what the client has
+    return [
+        {
+            'id': e['id'],
+            'type': e['type'],
+            'label': EVENT_LABELS.get(e['type'], e['type']),
+            'message': e['message'],
+            'created_at': e['created_at'].isoformat(),
+        }
+        async for e in InvoiceEvent.objects.filter(invoice_id=invoice_id, id__gt=since)
+        .order_by('id').values('id', 'type', 'message', 'created_at')
+    ]
+
+
+@read_from_replica
+@invoice_owner_required
+async def invoice_timeline(request, invoice):
+    """Order-tracking events after ``?since=<event id>`` as JSON.
+
+    With ``?wait=<seconds>`` the request is held until a new event arrives or
+    the wait runs out (long-poll). Waiting watches the invoice's cache version,
+    which every ``InvoiceEvent`` save bumps, instead of re-running the query.
+    """
+    try:
+        since = max(int(request.GET.get('since', 0)), 0)
+        wait = min(max(float(request.GET.get('wait', 0)), 0), settings.TIMELINE_MAX_WAIT_SECONDS)
+    except ValueError:
+        return JsonResponse({'error': 'since and wait must be numbers'}, status=400)
+    if 'wsgi.version' in request.META:
+        wait = 0  # never park a sync worker
+
+    deps = [('invoice', invoice.pk)]
+    deadline = time.monotonic() + wait
+    while True:
+        # Read the version before querying so an event saved in between still ends the wait
+        versions = await sync_to_async(get_versions)(deps) if wait else None
+        events = await _events_after(invoice.pk, since)
+        if events or time.monotonic() >= deadline:
+            break
+        while time.monotonic() < deadline and await sync_to_async(get_versions)(deps) == versions:
+            await asyncio.sleep(settings.TIMELINE_POLL_SECONDS)
+
+    return JsonResponse({
+        'invoice': invoice.number,
+        'status': invoice.status,
+        'build_date': invoice.build_date,
+        'shipping_date': invoice.shipping_date,
+        'events': events,
+        'last_id': events[-1]['id'] if events else since,
+    })
+
+
+@read_from_replica
+@invoice_owner_required
+def invoice_payment_methods(request, invoice):
+    summary = summarize_payments(invoice)
+    bank = company_profile().bank
     return render(request, 'accounts/invoice_payment_methods.html', {
         'invoice': invoice,
-        'outstanding': outstanding,
+        'outstanding': summary.outstanding,
         'invoice_total': invoice.total,
-        'already_paid': total_completed,
-        'stripe_available': stripe_available,
-        'stripe_fee': stripe_fee,
-        'card_total': card_total,
+        'already_paid': summary.total_completed,
+        'stripe_available': summary.stripe_available,
+        'stripe_fee': summary.stripe_fee,
+        'card_total': summary.card_total,
         'bank': bank,
         'stripe_percent': settings.STRIPE_FEE_PERCENT,
         'stripe_fixed': settings.STRIPE_FEE_FIXED,
         'stripe_gross_up': settings.STRIPE_FEE_GROSS_UP,
-        'payments': payments,
-        'completed_payments': completed_payments,
-        'pending_payments': pending_payments,
-        'failed_payments': failed_payments,
+        'payments': summary.payments,
+        'completed_payments': summary.completed,
+        'pending_payments': summary.pending,
+        'failed_payments': summary.failed,
     })
 
 
-@login_required
-def pay_invoice(request, number):
-    invoice = get_object_or_404(
-        Invoice,
-        Q(number=number) & (Q(user=request.user) | Q(user__isnull=True, client_email__iexact=request.user.email))
-    )
+@invoice_owner_required
+async def pay_invoice(request, invoice):
     if invoice.status == Invoice.PAID:
         messages.info(request, 'Invoice already paid.')
         return redirect('accounts:invoice_detail', number=invoice.number)
 
-    stripe.api_key = settings.STRIPE_SECRET_KEY
     # Outstanding amount
-    total_completed = sum(p.amount for p in invoice.payments.filter(status=InvoicePayment.COMPLETED))
-    outstanding = (invoice.total - total_completed)
+    summary = await sync_to_async(summarize_payments)(invoice)
+    outstanding = summary.outstanding
     if outstanding <= 0:
         messages.info(request, 'Nothing to pay.')
         return redirect('accounts:invoice_detail', number=invoice.number)
@@ -244,7 +285,7 @@ def pay_invoice(request, number):
     success_url = request.build_absolute_uri(reverse('accounts:invoice_pay_success', args=[invoice.number]))
     cancel_url = request.build_absolute_uri(reverse('accounts:invoice_pay_cancel', args=[invoice.number]))
     # Add Stripe processing fee to charge when using card
-    fee = _compute_stripe_fee(outstanding)
+    fee = compute_stripe_fee(outstanding)
     charge_total = (outstanding + fee).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     line_items = [
         {
@@ -270,17 +311,18 @@ def pay_invoice(request, number):
             'quantity': 1,
         })
 
-    session = stripe.checkout.Session.create(
-        mode='payment',
-        payment_method_types=['klarna', 'card', 'afterpay_clearpay',],
-        line_items=line_items,
-        success_url=success_url + '?session_id={CHECKOUT_SESSION_ID}',
-        cancel_url=cancel_url,
-        metadata={'invoice_number': invoice.number, 'includes_card_fee': str(fee)},
-    )
+    # Awaited so the worker keeps serving other requests while Stripe responds
+    session = await stripe_client().v1.checkout.sessions.create_async(params={
+        'mode': 'payment',
+        'payment_method_types': ['klarna', 'card', 'afterpay_clearpay',],
+        'line_items': line_items,
+        'success_url': success_url + '?session_id={CHECKOUT_SESSION_ID}',
+        'cancel_url': cancel_url,
+        'metadata': {'invoice_number': invoice.number, 'includes_card_fee': str(fee)},
+    })
 
     # Record pending payment
-    InvoicePayment.objects.create(
+    await InvoicePayment.objects.acreate(
         invoice=invoice,
         method='card',
         amount=charge_total,
@@ -291,39 +333,37 @@ def pay_invoice(request, number):
     return redirect(session.url)
 
 
-@login_required
-def invoice_pay_success(request, number):
-    invoice = get_object_or_404(
-        Invoice,
-        Q(number=number) & (Q(user=request.user) | Q(user__isnull=True, client_email__iexact=request.user.email))
-    )
+@invoice_owner_required
+async def invoice_pay_success(request, invoice):
     session_id = request.GET.get('session_id')
     if session_id and settings.STRIPE_SECRET_KEY:
-        stripe.api_key = settings.STRIPE_SECRET_KEY
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
+            session = await stripe_client().v1.checkout.sessions.retrieve_async(session_id)
             if session.payment_status == 'paid':
                 # Mark corresponding payment completed if not already
-                payment = invoice.payments.filter(provider_reference=session.id, status=InvoicePayment.PENDING).first()
+                payment = await invoice.payments.filter(provider_reference=session.id, status=InvoicePayment.PENDING).afirst()
                 if payment:
                     payment.status = InvoicePayment.COMPLETED
-                    payment.save(update_fields=['status'])
+                    await payment.asave(update_fields=['status'])
         except Exception:
             pass
-    return render(request, 'accounts/invoice_pay_success.html', {'invoice': invoice})
+    return await arender(request, 'accounts/invoice_pay_success.html', {'invoice': invoice})
 
 
-@login_required
-def invoice_pay_cancel(request, number):
-    invoice = get_object_or_404(
-        Invoice,
-        Q(number=number) & (Q(user=request.user) | Q(user__isnull=True, client_email__iexact=request.user.email))
-    )
+@invoice_owner_required
+def invoice_pay_cancel(request, invoice):
     return render(request, 'accounts/invoice_pay_cancel.html', {'invoice': invoice})
 
 
 @csrf_exempt
 def stripe_webhook(request):
+    with WEBHOOK_DURATION.labels('stripe').time():
+        response = _handle_stripe_webhook(request)
+    WEBHOOK_REQUESTS.labels('stripe', str(response.status_code)).inc()
+    return response
+
+
+def _handle_stripe_webhook(request):
     # Verify signature
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
@@ -335,6 +375,8 @@ def stripe_webhook(request):
     except Exception:
         return HttpResponse(status=400)
 
+    if event.get('created'):
+        WEBHOOK_LAG.labels('stripe').observe(max(time.time() - event['created'], 0))
     if event['type'] == 'checkout.session.completed':
         data = event['data']['object']
         invoice_number = data.get('metadata', {}).get('invoice_number')
@@ -0,0 +1,81 @@
+"""Versioned cache keys.
+
+Cached values are keyed by the current *version* of everything they were built
+from. Saving or deleting a model bumps its version (see the ``signals``
+modules), so the next lookup misses and recomputes; stale entries are never
+read again and simply age out. Nothing has to enumerate or delete old keys.
+
+    key = versioned_key("invoice-pdf", [("invoice", inv.pk), ("quote", inv.quote_id), ("company",)])
+    pdf = cache.get(key)
+
+A dependency is ``(namespace,)`` for a collection-wide version or
+``(namespace, id)`` for one object.
+"""
+import time
+from functools import partial
+from django.core.cache import cache
+from django.db import transaction
+from .replica import primary
+
+VERSION_PREFIX = "ver"
+# Entries are unreachable once a dependency is bumped; expire them eventually to reclaim space
+DEFAULT_TIMEOUT = 24 * 60 * 60
+
+
+def _version_key(namespace: str, ident=None) -> str:
+	return f"{VERSION_PREFIX}:{namespace}" if ident is None else f"{VERSION_PREFIX}:{namespace}:{ident}"
+
+
+def _new_version() -> int:
+	# Time-based so a version evicted from the cache never comes back with an old value
+	return time.time_ns()
+
+
+def get_versions(deps) -> list[int]:
+	"""Current versions for ``deps`` in one cache round trip, creating missing ones."""
+	keys = [_version_key(*dep) for dep in deps]
+	found = cache.get_many(keys)
+	missing = {key: _new_version() for key in keys if key not in found}
+	if missing:
+		cache.set_many(missing, timeout=None)
+		found.update(missing)
+	return [found[key] for key in keys]
+
+
+def bump(namespace: str, ident=None) -> None:
+	"""Invalidate everything cached against ``(namespace, ident)``."""
+	key = _version_key(namespace, ident)
+	try:
+		cache.incr(key)
+	except ValueError:
+		cache.set(key, _new_version(), timeout=None)
+
+
+def bump_on_commit(namespace: str, ident=None) -> None:
+	"""Bump once the current transaction commits.
+
+	Bumping earlier would let a concurrent request rebuild the entry from the
+	not-yet-committed (old) rows and cache it under the new version.
+	"""
+	transaction.on_commit(partial(bump, namespace, ident))
+
+
+def versioned_key(name: str, deps, *parts) -> str:
+	versions = get_versions(deps)
+	stamp = ".".join(str(v) for v in versions)
+	return ":".join([name, stamp, *(str(p) for p in parts)])
+
+
+def get_or_set(name: str, deps, compute, *parts, timeout=None):
+	"""Return the cached value for ``name`` at the current ``deps`` versions, computing it on a miss.
+
+	``compute`` reads from the primary: the versions are bumped as the primary
+	commits, and a lagging replica would store the old value under the new version.
+	"""
+	key = versioned_key(name, deps, *parts)
+	value = cache.get(key)
+	if value is None:
+		with primary():
+			value = compute()
+		cache.set(key, value, timeout if timeout is not None else DEFAULT_TIMEOUT)
+	return value
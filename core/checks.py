@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+	backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+	if backend.endswith("LocMemCache"):
+		return [Warning(
+			"The default cache is per-process memory.",
+			hint="Set CACHE_URL to redis:// so cache invalidation reaches every worker.",
+			id="core.W001",
+		)]
+	return []
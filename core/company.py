@@ -0,0 +1,81 @@
+"""Company profile used on invoices and the payment pages.
+
+``company_profile()`` merges the ``CompanyDetails`` row with the ``COMPANY_*``
+settings fallbacks and keeps the result in process memory. Each call checks
+the shared ``("company",)`` version stamp (one cache read); saving or deleting
+``CompanyDetails`` bumps it (``core.signals``), so every worker reloads on its
+next call. The reload reads the primary, like ``core.cache.get_or_set``.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from django.conf import settings
+from .cache import get_versions
+from .models import CompanyDetails
+from .replica import primary
+
+BANK_FIELDS = ("bank_name", "account_name", "account_number", "sort_code", "iban", "bic")
+BANK_SETTINGS = {
+	"bank_name": "COMPANY_BANK_NAME",
+	"account_name": "COMPANY_BANK_ACCOUNT_NAME",
+	"account_number": "COMPANY_BANK_ACCOUNT_NUMBER",
+	"sort_code": "COMPANY_BANK_SORT_CODE",
+	"iban": "COMPANY_BANK_IBAN",
+	"bic": "COMPANY_BANK_BIC",
+}
+
+
+@dataclass(frozen=True)
+class CompanyProfile:
+	"""Shared between requests: treat ``bank`` as read-only."""
+
+	name: str
+	lines: tuple = ()
+	email: str = ""
+	phone: str = ""
+	vat: str = ""
+	logo_path: Path | None = None
+	bank: dict = field(default_factory=dict)
+
+
+def _default_logo():
+	return Path(getattr(settings, "COMPANY_LOGO_PATH", Path(settings.BASE_DIR) / "static" / "logo.png"))
+
+
+def build_profile(cd: CompanyDetails | None) -> CompanyProfile:
+	bank = {key: getattr(settings, name, "") for key, name in BANK_SETTINGS.items()}
+	if cd is None:
+		return CompanyProfile(
+			name=getattr(settings, "COMPANY_NAME", "Prebuilt Computers UK"),
+			lines=tuple(getattr(settings, "COMPANY_ADDRESS_LINES", ["123 Tech Park", "Innovation Way", "London, UK"])),
+			email=getattr(settings, "COMPANY_EMAIL", "support@prebuiltcomputers.uk"),
+			phone=getattr(settings, "COMPANY_PHONE", "+44 (0)20 0000 0000"),
+			vat=getattr(settings, "COMPANY_VAT_NUMBER", "GB000000000"),
+			logo_path=_default_logo(),
+			bank=bank,
+		)
+	# Bank fields set on the model win over the settings
+	bank.update({key: getattr(cd, key) for key in BANK_FIELDS if getattr(cd, key)})
+	return CompanyProfile(
+		name=cd.name,
+		lines=tuple(line for line in [cd.address_line1, cd.address_line2, cd.city, cd.postcode, cd.country] if line),
+		email=cd.email or getattr(settings, "COMPANY_EMAIL", ""),
+		phone=cd.phone or getattr(settings, "COMPANY_PHONE", ""),
+		vat=cd.vat_number or getattr(settings, "COMPANY_VAT_NUMBER", ""),
+		logo_path=Path(cd.logo_path) if cd.logo_path else _default_logo(),
+		bank=bank,
+	)
+
+
+_cached = (None, None)  # (version, CompanyProfile)
+
+
+def company_profile() -> CompanyProfile:
+	global _cached
+	version, = get_versions([("company",)])
+	cached_version, profile = _cached
+	if cached_version != version:
+		# A lagging replica would keep old bank details under the new version
+		with primary():
+			profile = build_profile(CompanyDetails.get())
+		_cached = (version, profile)
+	return profile
@@ -0,0 +1,69 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+	help = (
+		"Measure per-request connection cost: a new connection per request (CONN_MAX_AGE=0), "
+		"a persistent connection with a health check, and psycopg's pool (Postgres only)."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--iterations", type=int, default=200)
+		parser.add_argument("--database", default="default")
+
+	def handle(self, *args, **opts):
+		conn = connections[opts["database"]]
+		n = opts["iterations"]
+		report = {"vendor": conn.vendor, "host": str(conn.settings_dict.get("HOST") or conn.settings_dict.get("NAME")), "iterations": n, "modes": {}}
+
+		def select_one(raw):
+			raw.execute("SELECT 1").fetchone()
+
+		# A fresh connection per request: what CONN_MAX_AGE=0 does
+		params = conn.get_connection_params()
+		params.pop("pool", None)
+		report["modes"]["new_connection"] = self._time(n, lambda: self._fresh(conn, params, select_one))
+
+		# One connection reused; the extra SELECT 1 is the CONN_HEALTH_CHECKS liveness check
+		raw = conn.get_new_connection(params)
+		try:
+			report["modes"]["persistent"] = self._time(n, lambda: (select_one(raw), select_one(raw)))
+		finally:
+			raw.close()
+
+		if conn.vendor == "postgresql":
+			try:
+				from psycopg_pool import ConnectionPool
+			except ImportError:
+				report["modes"]["pool"] = "psycopg_pool not installed"
+			else:
+				with ConnectionPool(kwargs=params, min_size=1, max_size=4, open=True) as pool:
+					pool.wait()
+
+					def pooled():
+						with pool.connection() as pooled_conn:
+							select_one(pooled_conn)
+
+					report["modes"]["pool"] = self._time(n, pooled)
+
+		self.stdout.write(json.dumps(report, indent=2))
+
+	def _fresh(self, conn, params, select_one):
+		raw = conn.get_new_connection(params)
+		try:
+			select_one(raw)
+		finally:
+			raw.close()
+
+	def _time(self, n, call):
+		from .run_load_test import summarize
+		latencies = []
+		started = time.perf_counter()
+		for _ in range(n):
+			begun = time.perf_counter()
+			call()
+			latencies.append((time.perf_counter() - begun) * 1000)
+		return summarize(latencies, 0, time.perf_counter() - started)
@@ -0,0 +1,93 @@
+import json
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE quote (id INTEGER PRIMARY KEY, is_public INTEGER, reservation_session_key TEXT, reservation_started_at REAL, payload TEXT);
+CREATE TABLE session (session_key TEXT PRIMARY KEY, session_data TEXT, expire_date REAL);
+CREATE INDEX quote_public ON quote (is_public);
+"""
+
+
+def _connect(path: str, pragmas: dict | None):
+	# Mirrors what Django's SQLite backend does with and without the settings.SQLITE_PRAGMAS profile
+	conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+	conn.execute("PRAGMA foreign_keys = ON")
+	for name, value in (pragmas or {}).items():
+		conn.execute(f"PRAGMA {name}={value}")
+	return conn
+
+
+def _worker(path: str, pragmas: dict | None, seconds: float, write_ratio: float, rows: int, seed: int):
+	"""Run a reservation/session style workload until the deadline; return (latencies_ms, errors).
+
+	Runs in a spawned process, so it must not touch Django settings or models.
+	"""
+	rng = random.Random(seed)
+	conn = _connect(path, pragmas)
+	begin = "BEGIN IMMEDIATE" if pragmas else "BEGIN"
+	latencies, errors = [], 0
+	deadline = time.perf_counter() + seconds
+	while time.perf_counter() < deadline:
+		quote_id = rng.randrange(1, rows + 1)
+		started = time.perf_counter()
+		try:
+			if rng.random() < write_ratio:
+				# Reserve a quote and save the session in one transaction, like the accept view
+				conn.execute(begin)
+				conn.execute("SELECT reservation_session_key, reservation_started_at FROM quote WHERE id = ?", (quote_id,)).fetchone()
+				conn.execute("UPDATE quote SET reservation_session_key = ?, reservation_started_at = ? WHERE id = ?", (f"s{seed}", time.time(), quote_id))
+				conn.execute(
+					"INSERT INTO session (session_key, session_data, expire_date) VALUES (?, ?, ?) "
+					"ON CONFLICT(session_key) DO UPDATE SET session_data = excluded.session_data, expire_date = excluded.expire_date",
+					(f"s{seed}-{quote_id % 50}", "x" * 200, time.time() + 3600),
+				)
+				conn.execute("COMMIT")
+			else:
+				conn.execute("SELECT * FROM quote WHERE id = ?", (quote_id,)).fetchone()
+				conn.execute("SELECT COUNT(*) FROM quote WHERE is_public = 1 AND reservation_started_at > ?", (time.time() - 900,)).fetchone()
+		except sqlite3.OperationalError:
+			errors += 1
+			if conn.in_transaction:
+				conn.execute("ROLLBACK")
+			continue
+		latencies.append((time.perf_counter() - started) * 1000)
+	conn.close()
+	return latencies, errors
+
+
+class Command(BaseCommand):
+	help = "Compare the tuned SQLite profile (WAL, BEGIN IMMEDIATE, pragmas) with SQLite defaults under concurrent writers."
+
+	def add_arguments(self, parser):
+		parser.add_argument("--workers", type=int, default=3, help="Concurrent processes, like gunicorn workers")
+		parser.add_argument("--seconds", type=float, default=5.0, help="Duration per profile")
+		parser.add_argument("--write-ratio", type=float, default=0.3)
+		parser.add_argument("--rows", type=int, default=10_000)
+
+	def handle(self, *args, **opts):
+		from .run_load_test import summarize
+		report = {"sqlite_version": sqlite3.sqlite_version, "workers": opts["workers"], "seconds": opts["seconds"], "write_ratio": opts["write_ratio"], "profiles": {}}
+		with tempfile.TemporaryDirectory() as tmp:
+			for name, pragmas in (("default", None), ("tuned", settings.SQLITE_PRAGMAS)):
+				path = str(Path(tmp) / f"{name}.sqlite3")
+				conn = _connect(path, pragmas)
+				conn.executescript(SCHEMA)
+				conn.executemany(
+					"INSERT INTO quote (id, is_public, payload) VALUES (?, ?, ?)",
+					((n, n % 3 == 0, "p" * 500) for n in range(1, opts["rows"] + 1)),
+				)
+				conn.close()
+				args = [(path, pragmas, opts["seconds"], opts["write_ratio"], opts["rows"], seed) for seed in range(opts["workers"])]
+				with multiprocessing.get_context("spawn").Pool(opts["workers"]) as pool:
+					results = pool.starmap(_worker, args)
+				latencies = [ms for worker_latencies, _ in results for ms in worker_latencies]
+				errors = sum(worker_errors for _, worker_errors in results)
+				report["profiles"][name] = summarize(latencies, errors, opts["seconds"])
+		self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,163 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from quotes.models import Invoice
+
+SERVERS = {
+	# What production ran before: one request at a time per worker
+	"sync": ["pbcuk.wsgi:application"],
+	"asgi": ["pbcuk.asgi:application", "--worker-class", "uvicorn_worker.UvicornWorker"],
+}
+
+
+def _free_port() -> int:
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+
+def _stub_stripe(delay: float) -> ThreadingHTTPServer:
+	"""A local stand-in for api.stripe.com that answers every call after ``delay`` seconds."""
+
+	class Handler(BaseHTTPRequestHandler):
+		def _answer(self):
+			time.sleep(delay)
+			body = json.dumps({"id": "cs_bench", "object": "checkout.session", "payment_status": "unpaid", "url": "https://checkout.stripe.test/cs_bench"}).encode()
+			self.send_response(200)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		do_GET = do_POST = _answer
+
+		def log_message(self, *args):
+			pass
+
+	server = ThreadingHTTPServer(("127.0.0.1", _free_port()), Handler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+
+class Command(BaseCommand):
+	help = (
+		"Start one gunicorn worker of each kind (sync WSGI, uvicorn ASGI) against this database and "
+		"report throughput and latency at increasing concurrency. Stripe is replaced by a local stub "
+		"that answers after --stripe-delay-ms, so the payment-return page shows what a slow upstream costs."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--servers", default="sync,asgi", help=f"Comma-separated subset of: {', '.join(SERVERS)}")
+		parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated client concurrency levels")
+		parser.add_argument("--duration", type=float, default=5.0, help="Seconds per (server, page, concurrency)")
+		parser.add_argument("--stripe-delay-ms", type=int, default=300)
+		parser.add_argument("--prefix", default="perf", help="Prefix used by seed_perf_data")
+		parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+
+	def handle(self, *args, **opts):
+		from .run_load_test import summarize
+
+		servers = [s.strip() for s in opts["servers"].split(",") if s.strip()]
+		unknown = set(servers) - set(SERVERS)
+		if unknown:
+			raise CommandError(f"Unknown server kind(s): {', '.join(sorted(unknown))}")
+		levels = [int(c) for c in opts["concurrency"].split(",")]
+
+		invoice = (
+			Invoice.objects.filter(user__username__startswith=f"{opts['prefix']}-customer-")
+			.select_related("user", "quote").first()
+		)
+		if invoice is None:
+			raise CommandError("No portal invoices found; run seed_perf_data first.")
+		login = Client()
+		login.force_login(invoice.user)
+		cookie = f"{settings.SESSION_COOKIE_NAME}={login.cookies[settings.SESSION_COOKIE_NAME].value}"
+		pages = {
+			"home": "/",
+			"quote": f"/q/{invoice.quote.token}/",
+			"pay_success": f"/accounts/invoices/{invoice.number}/pay/success/?session_id=cs_bench",
+		}
+
+		stub = _stub_stripe(opts["stripe_delay_ms"] / 1000)
+		report = {"stripe_delay_ms": opts["stripe_delay_ms"], "duration_s": opts["duration"], "servers": {}}
+		try:
+			for kind in servers:
+				port = _free_port()
+				process = self._start(kind, port, f"http://127.0.0.1:{stub.server_port}")
+				try:
+					base = f"http://127.0.0.1:{port}"
+					self._wait_ready(base, process)
+					report["servers"][kind] = {
+						page: {str(c): self._drive(base + path, cookie, c, opts["duration"], summarize) for c in levels}
+						for page, path in pages.items()
+					}
+				finally:
+					process.terminate()
+					process.wait(timeout=10)
+		finally:
+			stub.shutdown()
+
+		output = json.dumps(report, indent=2)
+		if opts["output"]:
+			with open(opts["output"], "w") as fh:
+				fh.write(output)
+		else:
+			self.stdout.write(output)
+
+	def _start(self, kind, port, stripe_base):
+		env = {**os.environ, "STRIPE_API_BASE": stripe_base, "METRICS_ENABLED": "0"}
+		env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+		command = [sys.executable, "-m", "gunicorn", *SERVERS[kind], "--workers", "1", "--bind", f"127.0.0.1:{port}", "--log-level", "warning"]
+		return subprocess.Popen(command, env=env, cwd=settings.BASE_DIR)
+
+	def _wait_ready(self, base, process, timeout=30):
+		deadline = time.monotonic() + timeout
+		while time.monotonic() < deadline:
+			if process.poll() is not None:
+				raise CommandError(f"Server exited with status {process.returncode}")
+			try:
+				urllib.request.urlopen(base + "/accounts/login/", timeout=1).close()
+				return
+			except (urllib.error.URLError, ConnectionError, TimeoutError):
+				time.sleep(0.2)
+		raise CommandError(f"Server at {base} did not start within {timeout}s")
+
+	def _drive(self, url, cookie, concurrency, duration, summarize):
+		latencies, errors, lock = [], [0], threading.Lock()
+		stop_at = time.monotonic() + duration
+
+		def worker():
+			while time.monotonic() < stop_at:
+				request = urllib.request.Request(url, headers={"Cookie": cookie})
+				start = time.perf_counter()
+				try:
+					with urllib.request.urlopen(request, timeout=60) as response:
+						response.read()
+					ok = True
+				except (urllib.error.URLError, ConnectionError, TimeoutError):
+					ok = False
+				elapsed = (time.perf_counter() - start) * 1000
+				with lock:
+					if ok:
+						latencies.append(elapsed)
+					else:
+						errors[0] += 1
+
+		started = time.monotonic()
+		threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return summarize(latencies, errors[0], time.monotonic() - started)
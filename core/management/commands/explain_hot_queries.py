@@ -0,0 +1,102 @@
+import re
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from accounts.models import EmailVerification
+from quotes.models import Invoice, InvoicePayment, Quote
+from core.queries import record_query_shapes
+
+# Plan lines that mean "read the whole table"
+SCAN_PATTERNS = {
+	"sqlite": re.compile(r"^SCAN (?!CONSTANT ROW)(\w+)(?!.*\bUSING\b.*\bINDEX\b)"),
+	"postgresql": re.compile(r"Seq Scan on (\w+)"),
+}
+# Single-row or tiny tables where a scan is the right plan
+SCAN_ALLOWED = {"core_companydetails", "django_content_type", "auth_permission", "auth_group", "django_site"}
+
+
+class _Skip(Exception):
+	pass
+
+
+class Command(BaseCommand):
+	help = (
+		"Run the hot view/admin code paths, EXPLAIN every distinct query they issue and flag full-table scans. "
+		"Run against realistic volumes (seed_perf_data) and, on Postgres, after ANALYZE."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--verbose-plans", action="store_true", help="Print the plan of every query, not just flagged ones")
+		parser.add_argument("--fail-on-scan", action="store_true", help="Exit non-zero if any sequential scan is found (for CI)")
+
+	def handle(self, *args, **opts):
+		pattern = SCAN_PATTERNS.get(connection.vendor)
+		if pattern is None:
+			raise CommandError(f"Unsupported database vendor: {connection.vendor}")
+		flagged = 0
+		for label, run in self._hot_paths():
+			with transaction.atomic():
+				with record_query_shapes() as recorder:
+					try:
+						run()
+					except _Skip as skip:
+						self.stdout.write(f"- {label}: skipped ({skip})")
+						continue
+				for sql, params in recorder.samples.values():
+					if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+						continue
+					plan = self._explain(sql, params)
+					scans = [m.group(1) for line in plan for m in [pattern.search(line.strip())] if m and m.group(1) not in SCAN_ALLOWED]
+					if scans:
+						flagged += 1
+						self.stdout.write(self.style.WARNING(f"! {label}: full scan of {', '.join(sorted(set(scans)))}"))
+						self.stdout.write(f"    {sql}")
+					if scans or opts["verbose_plans"]:
+						self.stdout.writelines(f"    | {line}\n" for line in plan)
+				# Views like the accept page write reservations; leave the data as we found it
+				transaction.set_rollback(True)
+			self.stdout.write(f"- {label}: {len(recorder.samples)} distinct queries")
+		if flagged:
+			message = f"{flagged} queries use a full table scan"
+			if opts["fail_on_scan"]:
+				raise CommandError(message)
+			self.stdout.write(self.style.WARNING(message))
+		else:
+			self.stdout.write(self.style.SUCCESS("No full table scans in hot queries"))
+
+	def _explain(self, sql, params):
+		with connection.cursor() as cursor:
+			cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+			return [str(row[-1]) for row in cursor.fetchall()]
+
+	def _hot_paths(self):
+		anonymous = Client(HTTP_HOST="localhost", raise_request_exception=False)
+		quote = Quote.objects.filter(is_public=True).only("token").first()
+		invoice = Invoice.objects.filter(user__isnull=False).select_related("user").only("number", "user").first()
+		staff = User.objects.filter(is_superuser=True, is_active=True).first()
+		customer = Client(HTTP_HOST="localhost", raise_request_exception=False)
+		admin = Client(HTTP_HOST="localhost", raise_request_exception=False)
+		if invoice:
+			customer.force_login(invoice.user)
+		if staff:
+			admin.force_login(staff)
+
+		def need(value, reason):
+			if not value:
+				raise _Skip(reason)
+			return value
+
+		yield "home", lambda: anonymous.get("/")
+		yield "public_quote_detail", lambda: anonymous.get(f"/q/{need(quote, 'no public quote').token}/")
+		yield "public_quote_accept", lambda: anonymous.get(f"/q/{need(quote, 'no public quote').token}/accept/")
+		yield "portal invoices", lambda: need(invoice, "no customer invoice") and customer.get("/accounts/invoices/")
+		yield "portal invoice_detail", lambda: customer.get(f"/accounts/invoices/{need(invoice, 'no customer invoice').number}/")
+		yield "portal invoice timeline", lambda: customer.get(f"/accounts/invoices/{need(invoice, 'no customer invoice').number}/timeline/?since=1")
+		yield "stripe payment lookup", lambda: InvoicePayment.objects.filter(invoice=need(invoice, "no invoice"), provider_reference="cs_test_lookup").first()
+		yield "claim orphan invoices", lambda: Invoice.claim_for_user(need(invoice, "no customer invoice").user)
+		yield "pending verification", lambda: EmailVerification.objects.filter(user=need(invoice, "no customer").user, verified_at__isnull=True).first()
+		yield "admin quotes (public)", lambda: need(staff, "no superuser") and admin.get("/admin/quotes/quote/?is_public__exact=1")
+		yield "admin invoices (unpaid)", lambda: need(staff, "no superuser") and admin.get("/admin/quotes/invoice/?status__exact=unpaid")
+		yield "bookkeeping sync feed", lambda: need(staff, "no superuser") and admin.get("/q/invoice/sync/")
+		yield "admin invoice change", lambda: need(staff, "no superuser") and admin.get(f"/admin/quotes/invoice/{need(invoice, 'no invoice').pk}/change/")
@@ -0,0 +1,177 @@
+import json
+import random
+import statistics
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from quotes.models import Quote, Invoice
+
+
+def summarize(latencies_ms: list[float], errors: int, wall_seconds: float) -> dict:
+	"""p50/p95/p99/max latency (ms) and throughput for one scenario."""
+	ordered = sorted(latencies_ms)
+	if len(ordered) > 1:
+		cuts = statistics.quantiles(ordered, n=100, method="inclusive")
+		p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+	else:
+		p50 = p95 = p99 = ordered[0] if ordered else 0.0
+	return {
+		"requests": len(ordered),
+		"errors": errors,
+		"p50_ms": round(p50, 2),
+		"p95_ms": round(p95, 2),
+		"p99_ms": round(p99, 2),
+		"max_ms": round(ordered[-1], 2) if ordered else 0.0,
+		"throughput_rps": round(len(ordered) / wall_seconds, 1) if wall_seconds else 0.0,
+	}
+
+
+class Command(BaseCommand):
+	help = "Drive the key public and portal flows in-process and report latency percentiles as JSON."
+
+	def add_arguments(self, parser):
+		parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+		parser.add_argument("--concurrency", type=int, default=8, help="Worker threads (one test client each)")
+		parser.add_argument("--race-quotes", type=int, default=20, help="Quotes used for the concurrent reservation scenario")
+		parser.add_argument("--prefix", default="perf", help="Prefix used by seed_perf_data")
+		parser.add_argument("--seed", type=int, default=1)
+		parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+
+	def handle(self, *args, **opts):
+		self.rng = random.Random(opts["seed"])
+		self.concurrency = max(1, opts["concurrency"])
+		self.host = next((h for h in settings.ALLOWED_HOSTS if h not in ("*",) and not h.startswith(".")), "localhost")
+		cutoff = timezone.now() - timedelta(minutes=Quote.RESERVATION_DURATION)
+		public = list(
+			Quote.objects.filter(is_public=True, valid_until__gte=timezone.localdate())
+			.exclude(status__in=[Quote.ACCEPTED, Quote.DECLINED, Quote.EXPIRED])
+			.exclude(reservation_started_at__gte=cutoff)
+			.values_list("pk", "token")[:5000]
+		)
+		invoices = list(
+			Invoice.objects.filter(user__username__startswith=f"{opts['prefix']}-customer-")
+			.values_list("user_id", "number")[:5000]
+		)
+		if not public or not invoices:
+			raise CommandError("No seeded data found; run seed_perf_data first")
+		owners = {}
+		for user_id, number in invoices:
+			owners.setdefault(user_id, []).append(number)
+		users = User.objects.in_bulk(list(owners))
+
+		race = public[:opts["race_quotes"]]
+		browse = public[opts["race_quotes"]:] or public
+		snapshot = list(Quote.objects.filter(pk__in=[pk for pk, _ in public]).values_list("pk", "reservation_session_key", "reservation_started_at"))
+
+		n = opts["requests"]
+		report = {
+			"started_at": timezone.now().isoformat(),
+			"database": connection.vendor,
+			"requests_per_scenario": n,
+			"concurrency": self.concurrency,
+			"data": {
+				"quotes": Quote.objects.count(),
+				"invoices": Invoice.objects.count(),
+			},
+			"scenarios": {},
+		}
+		try:
+			scenarios = report["scenarios"]
+			scenarios["home"] = self._scenario(n, lambda client, rng: client.get("/"))
+			scenarios["quote_detail"] = self._scenario(n, lambda client, rng: client.get(f"/q/{rng.choice(browse)[1]}/"))
+			scenarios["quote_accept"] = self._scenario(n, lambda client, rng: client.get(f"/q/{rng.choice(browse)[1]}/accept/"), ok=(200, 302))
+
+			def login(client, rng):
+				user = users[rng.choice(list(users))]
+				client.force_login(user)
+				client.invoice_numbers = owners[user.pk]
+
+			scenarios["portal_invoices"] = self._scenario(n, lambda client, rng: client.get("/accounts/invoices/"), setup=login)
+			scenarios["portal_invoice_detail"] = self._scenario(
+				n, lambda client, rng: client.get(f"/accounts/invoices/{rng.choice(client.invoice_numbers)}/"), setup=login,
+			)
+			report["reservation_race"] = self._reservation_race(race)
+		finally:
+			self._restore_reservations(snapshot)
+
+		body = json.dumps(report, indent=2)
+		if opts["output"]:
+			with open(opts["output"], "w") as fh:
+				fh.write(body + "\n")
+			self.stdout.write(self.style.SUCCESS(f"Wrote {opts['output']}"))
+		else:
+			self.stdout.write(body)
+
+	def _scenario(self, count, request, setup=None, ok=(200,)):
+		local = threading.local()
+		seeds = [self.rng.random() for _ in range(self.concurrency)]
+		seed_index = iter(range(self.concurrency))
+		lock = threading.Lock()
+
+		def worker_client():
+			if not hasattr(local, "client"):
+				with lock:
+					local.rng = random.Random(seeds[next(seed_index)])
+				local.client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+				if setup:
+					setup(local.client, local.rng)
+			return local.client
+
+		def one(_):
+			client = worker_client()
+			started = time.perf_counter()
+			try:
+				status = request(client, local.rng).status_code
+			except Exception:
+				status = None
+			return (time.perf_counter() - started) * 1000, status in ok
+
+		started = time.perf_counter()
+		with ThreadPoolExecutor(self.concurrency) as pool:
+			results = list(pool.map(one, range(count)))
+		wall = time.perf_counter() - started
+		return summarize([ms for ms, _ in results], sum(1 for _, good in results if not good), wall)
+
+	def _reservation_race(self, quotes):
+		"""Hit each quote's accept page from ``concurrency`` sessions at once; exactly one should win."""
+		latencies, errors, winners_per_quote = [], 0, []
+		started = time.perf_counter()
+		for _, token in quotes:
+			barrier = threading.Barrier(self.concurrency)
+
+			def attempt(_):
+				client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+				barrier.wait()
+				begun = time.perf_counter()
+				try:
+					status = client.get(f"/q/{token}/accept/").status_code
+				except Exception:
+					status = None
+				return (time.perf_counter() - begun) * 1000, status
+
+			with ThreadPoolExecutor(self.concurrency) as pool:
+				results = list(pool.map(attempt, range(self.concurrency)))
+			latencies += [ms for ms, _ in results]
+			errors += sum(1 for _, status in results if status not in (200, 302))
+			winners_per_quote.append(sum(1 for _, status in results if status == 200))
+		summary = summarize(latencies, errors, time.perf_counter() - started)
+		summary.update({
+			"quotes": len(quotes),
+			"attempts_per_quote": self.concurrency,
+			"acquired": sum(winners_per_quote),
+			"conflicts": sum(self.concurrency - w for w in winners_per_quote) - errors,
+			"quotes_with_multiple_winners": sum(1 for w in winners_per_quote if w > 1),
+		})
+		return summary
+
+	def _restore_reservations(self, snapshot):
+		"""Put reservations back as they were so repeated runs see the same data."""
+		quotes = [Quote(pk=pk, reservation_session_key=key, reservation_started_at=at) for pk, key, at in snapshot]
+		Quote.objects.bulk_update(quotes, ["reservation_session_key", "reservation_started_at"], batch_size=500)
@@ -0,0 +1,168 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from quotes.models import Quote, QuoteItem, QuoteAcceptance, Invoice, InvoicePayment, InvoiceEvent, ProspectiveClient
+
+PARTS = [
+	("AMD Ryzen 7 7800X3D", Decimal("339.99")),
+	("Intel Core i5-14600K", Decimal("279.99")),
+	("NVIDIA RTX 4070 Super", Decimal("589.99")),
+	("AMD Radeon RX 7800 XT", Decimal("479.99")),
+	("32GB DDR5-6000 kit", Decimal("104.99")),
+	("2TB NVMe SSD", Decimal("129.99")),
+	("B650 motherboard", Decimal("169.99")),
+	("850W Gold PSU", Decimal("109.99")),
+	("Mid-tower case", Decimal("89.99")),
+	("240mm AIO cooler", Decimal("94.99")),
+	("Windows 11 Home licence", Decimal("99.99")),
+	("Assembly and testing", Decimal("60.00")),
+]
+PERF_PASSWORD = "perf"
+
+
+class Command(BaseCommand):
+	help = "Bulk-generate a large, realistic data set for load testing (see run_load_test)."
+
+	def add_arguments(self, parser):
+		parser.add_argument("--quotes", type=int, default=100_000)
+		parser.add_argument("--items-per-quote", type=int, default=10)
+		parser.add_argument("--invoices", type=int, default=50_000, help="How many of the quotes are accepted and invoiced")
+		parser.add_argument("--users", type=int, default=500, help="Portal customers that own the invoices")
+		parser.add_argument("--reserved-percent", type=int, default=10, help="Share of public quotes with an active reservation")
+		parser.add_argument("--batch-size", type=int, default=2000)
+		parser.add_argument("--prefix", default="perf", help="Marks generated rows so they can be found and flushed")
+		parser.add_argument("--seed", type=int, default=1)
+		parser.add_argument("--flush", action="store_true", help="Delete rows from a previous run with the same prefix first")
+
+	def handle(self, *args, **opts):
+		if opts["invoices"] > opts["quotes"]:
+			raise CommandError("--invoices cannot exceed --quotes")
+		prefix = opts["prefix"]
+		existing = Quote.objects.filter(reference__startswith=f"Q-{prefix}-")
+		if existing.exists():
+			if not opts["flush"]:
+				raise CommandError(f"Data with prefix '{prefix}' already exists; pass --flush to replace it")
+			self._flush(prefix)
+
+		self.rng = random.Random(opts["seed"])
+		self.now = timezone.now()
+		started = time.perf_counter()
+		users = self._create_users(prefix, opts["users"])
+		batch_size = opts["batch_size"]
+		created = 0
+		for start in range(0, opts["quotes"], batch_size):
+			stop = min(start + batch_size, opts["quotes"])
+			with transaction.atomic():
+				self._create_batch(prefix, range(start, stop), opts, users)
+			created = stop
+			self.stdout.write(f"  {created}/{opts['quotes']} quotes")
+		self.stdout.write(self.style.SUCCESS(
+			f"Seeded {created} quotes, {created * opts['items_per_quote']} items, {opts['invoices']} invoices "
+			f"and {len(users)} users in {time.perf_counter() - started:.1f}s"
+		))
+
+	def _flush(self, prefix):
+		with transaction.atomic():
+			# Cascades to items, acceptances, invoices, payments and events
+			Quote.objects.filter(reference__startswith=f"Q-{prefix}-").delete()
+			ProspectiveClient.objects.filter(email__endswith=f"@{prefix}.example.com").delete()
+			User.objects.filter(username__startswith=f"{prefix}-customer-").delete()
+
+	def _create_users(self, prefix, count):
+		password = make_password(PERF_PASSWORD)  # hash once; hashing per user would dominate the run
+		return User.objects.bulk_create(
+			User(username=f"{prefix}-customer-{n}", email=f"customer{n}@{prefix}.example.com", password=password, first_name="Perf", last_name=f"Customer {n}")
+			for n in range(count)
+		)
+
+	def _create_batch(self, prefix, indexes, opts, users):
+		rng = self.rng
+		invoiced = [i < opts["invoices"] for i in indexes]
+		clients = ProspectiveClient.objects.bulk_create(
+			ProspectiveClient(name=f"Client {i}", email=f"client{i}@{prefix}.example.com", phone=f"07{i:09d}")
+			for i in indexes
+		)
+		quotes = []
+		for i, client, is_invoiced in zip(indexes, clients, invoiced):
+			public = not is_invoiced and rng.random() < 0.6
+			reserved = public and rng.randrange(100) < opts["reserved_percent"]
+			quotes.append(Quote(
+				reference=f"Q-{prefix}-{i:07d}",
+				title=f"{rng.choice(['Gaming', 'Streaming', 'Workstation', 'Office'])} PC {i}",
+				client=client,
+				status=Quote.ACCEPTED if is_invoiced else rng.choice([Quote.DRAFT, Quote.SENT, Quote.SENT, Quote.DECLINED]),
+				is_public=public,
+				valid_until=self.now.date() + timedelta(days=rng.randint(-10, 60)),
+				reservation_session_key=f"{prefix}-session-{i}" if reserved else None,
+				reservation_started_at=self.now - timedelta(minutes=rng.randint(0, Quote.RESERVATION_DURATION - 1)) if reserved else None,
+			))
+		quotes = Quote.objects.bulk_create(quotes)
+
+		items = []
+		totals = {}
+		for quote in quotes:
+			subtotal = vat = Decimal("0")
+			for _ in range(opts["items_per_quote"]):
+				description, price = rng.choice(PARTS)
+				quantity = rng.choice([1, 1, 1, 2])
+				vat_rate = Decimal("20.00") if rng.random() < 0.5 else Decimal("0")
+				items.append(QuoteItem(quote=quote, description=description, quantity=quantity, unit_price=price, vat_rate=vat_rate))
+				subtotal += price * quantity
+				vat += (price * quantity * vat_rate / Decimal("100")).quantize(Decimal("0.01"))
+			totals[quote.pk] = (subtotal, vat)
+		QuoteItem.objects.bulk_create(items, batch_size=opts["batch_size"])
+
+		accepted = [q for q, is_invoiced in zip(quotes, invoiced) if is_invoiced]
+		if not accepted:
+			return
+		acceptances, invoices = [], []
+		for quote in accepted:
+			n = int(quote.reference.rsplit("-", 1)[1])
+			user = users[n % len(users)] if users and n % 5 else None  # every fifth invoice is a guest checkout
+			email = user.email if user else f"guest{n}@{prefix}.example.com"
+			acceptances.append(QuoteAcceptance(
+				quote=quote, full_name=f"Customer {n}", email=email, phone=f"07{n:09d}",
+				address_line1=f"{n} High Street", city=rng.choice(["London", "Leeds", "Bristol", "Glasgow"]), postcode="AB1 2CD",
+			))
+			subtotal, vat = totals[quote.pk]
+			paid = rng.random() < 0.6
+			invoices.append(Invoice(
+				quote=quote,
+				user=user,
+				assigned_to=None,
+				number=f"INV-{prefix}-{n:07d}",
+				client_name=f"Customer {n}",
+				client_email=email,
+				subtotal=subtotal,
+				delivery_price=quote.delivery_price,
+				vat_amount=vat,
+				total=subtotal + vat + quote.delivery_price,
+				status=Invoice.PAID if paid else Invoice.UNPAID,
+				paid_at=self.now - timedelta(days=rng.randint(0, 365)) if paid else None,
+			))
+		QuoteAcceptance.objects.bulk_create(acceptances)
+		invoices = Invoice.objects.bulk_create(invoices)
+
+		payments, events = [], []
+		for invoice in invoices:
+			if rng.random() < 0.2:
+				payments.append(InvoicePayment(invoice=invoice, method="card", amount=invoice.total, status=InvoicePayment.FAILED, provider="stripe"))
+			if invoice.status == Invoice.PAID:
+				payments.append(InvoicePayment(
+					invoice=invoice, method=rng.choice(["card", "bank-transfer"]), amount=invoice.total,
+					status=InvoicePayment.COMPLETED, provider="stripe", provider_reference=f"cs_{prefix}_{invoice.number}",
+				))
+				events.append(InvoiceEvent(invoice=invoice, type=InvoiceEvent.PAID, message=f"Payment completed for {invoice.number}."))
+				events.append(InvoiceEvent(invoice=invoice, type=InvoiceEvent.STOCK_OK, message="Items confirmed in stock"))
+				if rng.random() < 0.5:
+					events.append(InvoiceEvent(invoice=invoice, type=InvoiceEvent.BUILD_SCHEDULED, message="Build scheduled"))
+			elif rng.random() < 0.3:
+				payments.append(InvoicePayment(invoice=invoice, method="bank-transfer", amount=invoice.total, status=InvoicePayment.PENDING))
+		InvoicePayment.objects.bulk_create(payments, batch_size=opts["batch_size"])
+		InvoiceEvent.objects.bulk_create(events, batch_size=opts["batch_size"])
@@ -0,0 +1,72 @@
+"""Prometheus metrics shared by every app.
+
+Metric objects are process-global. When ``PROMETHEUS_MULTIPROC_DIR`` is set in
+the environment before the first import (see ``gunicorn.conf.py``),
+prometheus_client stores values in per-worker mmap files and ``render()``
+aggregates them, so ``/metrics`` reports the whole gunicorn pool rather than
+whichever worker happened to serve the scrape.
+"""
+import os
+from prometheus_client import (
+	CONTENT_TYPE_LATEST,
+	REGISTRY,
+	CollectorRegistry,
+	Counter,
+	Histogram,
+	generate_latest,
+	multiprocess,
+)
+
+HTTP_REQUESTS = Counter(
+	"pbcuk_http_requests_total",
+	"HTTP requests handled, by resolved view name, method and status code.",
+	["view", "method", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+	"pbcuk_http_request_duration_seconds",
+	"Time spent handling a request, by resolved view name.",
+	["view"],
+	buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+QUOTE_RESERVATIONS = Counter(
+	"pbcuk_quote_reservation_attempts_total",
+	"Quote acceptance reservation attempts, by outcome (acquired, held, conflict, expired).",
+	["outcome"],
+)
+INVOICE_PDF_RENDER = Histogram(
+	"pbcuk_invoice_pdf_render_seconds",
+	"Time spent rendering an invoice PDF.",
+	buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+WEBHOOK_REQUESTS = Counter(
+	"pbcuk_webhook_requests_total",
+	"Inbound payment webhooks, by source and outcome.",
+	["source", "outcome"],
+)
+WEBHOOK_DURATION = Histogram(
+	"pbcuk_webhook_handling_seconds",
+	"Time spent handling an inbound payment webhook.",
+	["source"],
+	buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+WEBHOOK_LAG = Histogram(
+	"pbcuk_webhook_lag_seconds",
+	"Delay between the provider creating an event and us receiving it.",
+	["source"],
+	buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+PAYMENTS_APPLIED = Counter(
+	"pbcuk_payments_applied_total",
+	"Invoice payments that became completed, by provider.",
+	["provider"],
+)
+
+
+def render():
+	"""Return ``(body, content_type)`` for the current metrics exposition."""
+	if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+		registry = CollectorRegistry()
+		multiprocess.MultiProcessCollector(registry)
+	else:
+		registry = REGISTRY
+	return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,296 @@
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+logger = logging.getLogger("pbcuk.timing")
+
+_current_timing = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+	"""Per-request counters filled in by the DB execute wrapper and template hook."""
+
+	def __init__(self):
+		self.query_count = 0
+		self.db_time = 0.0
+		self.template_time = 0.0
+		self._template_depth = 0
+
+	def record_query(self, execute, sql, params, many, context):
+		start = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.db_time += time.perf_counter() - start
+			self.query_count += 1
+
+
+def _instrument_template_rendering():
+	"""Time top-level template renders. Installed once, only when timing is enabled."""
+	from django.template.backends.django import Template
+
+	if getattr(Template.render, "_timed", False):
+		return
+	original_render = Template.render
+
+	def render(self, context=None, request=None):
+		timing = _current_timing.get()
+		if timing is None:
+			return original_render(self, context, request)
+		timing._template_depth += 1
+		start = time.perf_counter()
+		try:
+			return original_render(self, context, request)
+		finally:
+			timing._template_depth -= 1
+			if timing._template_depth == 0:
+				timing.template_time += time.perf_counter() - start
+
+	render._timed = True
+	Template.render = render
+
+
+class RequestTimingMiddleware:
+	"""Record query count, DB time, template time and view time per request.
+
+	Results are sent back as a ``Server-Timing`` header and logged on the
+	``pbcuk.timing`` logger. Disabled (and removed from the stack) unless
+	``REQUEST_TIMING_ENABLED`` is set.
+	"""
+
+	def __init__(self, get_response):
+		if not getattr(settings, "REQUEST_TIMING_ENABLED", False):
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		_instrument_template_rendering()
+
+	def __call__(self, request):
+		timing = RequestTiming()
+		token = _current_timing.set(timing)
+		start = time.perf_counter()
+		try:
+			with ExitStack() as stack:
+				for alias in connections:
+					stack.enter_context(connections[alias].execute_wrapper(timing.record_query))
+				response = self.get_response(request)
+		finally:
+			_current_timing.reset(token)
+		view_time = time.perf_counter() - start
+
+		response["Server-Timing"] = ", ".join([
+			f'db;dur={timing.db_time * 1000:.1f};desc="{timing.query_count} queries"',
+			f"tpl;dur={timing.template_time * 1000:.1f}",
+			f"view;dur={view_time * 1000:.1f}",
+		])
+		match = getattr(request, "resolver_match", None)
+		logger.info(
+			"request_timing method=%s path=%s view=%s status=%s queries=%d db_ms=%.1f tpl_ms=%.1f view_ms=%.1f",
+			request.method,
+			request.path,
+			match.view_name if match else "-",
+			response.status_code,
+			timing.query_count,
+			timing.db_time * 1000,
+			timing.template_time * 1000,
+			view_time * 1000,
+			extra={
+				"method": request.method,
+				"path": request.path,
+				"view": match.view_name if match else None,
+				"status": response.status_code,
+				"queries": timing.query_count,
+				"db_ms": round(timing.db_time * 1000, 1),
+				"tpl_ms": round(timing.template_time * 1000, 1),
+				"view_ms": round(view_time * 1000, 1),
+			},
+		)
+		return response
+
+
+class MetricsMiddleware:
+	"""Count requests and observe latency per resolved view for ``/metrics``."""
+
+	async_capable = True
+	sync_capable = True
+
+	def __init__(self, get_response):
+		if not getattr(settings, "METRICS_ENABLED", True):
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		start = time.perf_counter()
+		response = self.get_response(request)
+		self._observe(request, response, start)
+		return response
+
+	async def __acall__(self, request):
+		start = time.perf_counter()
+		response = await self.get_response(request)
+		self._observe(request, response, start)
+		return response
+
+	def _observe(self, request, response, start):
+		from .metrics import HTTP_REQUESTS, HTTP_REQUEST_DURATION
+
+		match = getattr(request, "resolver_match", None)
+		# Label by view name rather than path to keep label cardinality bounded
+		view = match.view_name if match else "<unresolved>"
+		HTTP_REQUEST_DURATION.labels(view).observe(time.perf_counter() - start)
+		HTTP_REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+	"""WhiteNoise that can sit in an async middleware stack.
+
+	WhiteNoise is sync-only, so under ASGI Django would run it, and wait on
+	everything below it, in a thread for every request. Only the static file
+	lookup and response need sync code; other requests stay on the event loop.
+	"""
+
+	async_capable = True
+	sync_capable = True
+
+	def __init__(self, get_response=None, settings=settings):
+		super().__init__(get_response, settings)
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		return super().__call__(request)
+
+	async def __acall__(self, request):
+		if self.autorefresh:
+			static_file = await sync_to_async(self.find_file)(request.path_info)
+		else:
+			static_file = self.files.get(request.path_info)
+		if static_file is not None:
+			return await sync_to_async(self.serve)(static_file, request)
+		return await self.get_response(request)
+
+
+class NPlusOneDetectionMiddleware:
+	"""In DEBUG, warn when one request runs the same query shape repeatedly.
+
+	The threshold comes from ``N_PLUS_ONE_THRESHOLD``; set ``N_PLUS_ONE_RAISE``
+	to turn the warning into an exception (useful when clicking through the
+	site locally).
+	"""
+
+	def __init__(self, get_response):
+		if not (settings.DEBUG and getattr(settings, "N_PLUS_ONE_DETECTION", True)):
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		self.threshold = getattr(settings, "N_PLUS_ONE_THRESHOLD", 5)
+		self.raise_on_detect = getattr(settings, "N_PLUS_ONE_RAISE", False)
+
+	def __call__(self, request):
+		from .queries import record_query_shapes
+
+		with record_query_shapes() as recorder:
+			response = self.get_response(request)
+		repeated = recorder.repeated(self.threshold)
+		if repeated:
+			match = getattr(request, "resolver_match", None)
+			details = "; ".join(f"{n}x {shape[:200]}" for shape, n in repeated)
+			message = f"Possible N+1 in {match.view_name if match else request.path}: {details}"
+			if self.raise_on_detect:
+				raise AssertionError(message)
+			logger.warning(message)
+		return response
+
+
+class ProfilingMiddleware:
+	"""Profile individual requests on demand for staff (see ``core.profiling``).
+
+	Only installed when ``PROFILING_ENABLED`` is set; other requests pay for two
+	dictionary lookups.
+	"""
+
+	def __init__(self, get_response):
+		if not getattr(settings, "PROFILING_ENABLED", False):
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+
+	def __call__(self, request):
+		token = request.META.get("HTTP_X_PROFILE_TOKEN")
+		flag = request.GET.get("_profile")
+		if token is None and flag is None:
+			return self.get_response(request)
+
+		from django.contrib.auth import get_user_model
+		from .profiling import profile_request, user_id_from_token
+
+		allowed = False
+		if token is not None:
+			user_id = user_id_from_token(token)
+			allowed = bool(user_id and get_user_model().objects.filter(pk=user_id, is_staff=True, is_active=True).exists())
+		elif request.user.is_authenticated and request.user.is_staff:
+			allowed = True
+		if not allowed:
+			return self.get_response(request)
+		mode = request.META.get("HTTP_X_PROFILE_MODE") or flag or "cprofile"
+		return profile_request(request, self.get_response, mode)
+
+
+class ReplicaStickinessMiddleware:
+	"""Pin a session to the primary database for a short while after it writes.
+
+	Only installed when a ``replica`` database is configured (see ``core.replica``).
+	"""
+
+	async_capable = True
+	sync_capable = True
+
+	def __init__(self, get_response):
+		from .replica import replica_configured
+
+		if not replica_configured():
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		self.sticky_seconds = getattr(settings, "REPLICA_STICKY_SECONDS", 10)
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		from .replica import STICKY_SESSION_KEY, track_app_writes
+
+		with track_app_writes() as wrote:
+			response = self.get_response(request)
+		session = self._session_to_pin(request, wrote)
+		if session is not None:
+			session[STICKY_SESSION_KEY] = time.time() + self.sticky_seconds
+		return response
+
+	async def __acall__(self, request):
+		from .replica import STICKY_SESSION_KEY, track_app_writes
+
+		# ORM calls made through sync_to_async run in a copy of this context and append to the same list
+		with track_app_writes() as wrote:
+			response = await self.get_response(request)
+		session = self._session_to_pin(request, wrote)
+		if session is not None:
+			await session.aset(STICKY_SESSION_KEY, time.time() + self.sticky_seconds)
+		return response
+
+	def _session_to_pin(self, request, wrote):
+		if wrote or request.method not in ("GET", "HEAD", "OPTIONS", "TRACE"):
+			session = getattr(request, "session", None)
+			# Skip sessionless callers such as webhooks rather than creating a session for them
+			if session is not None and session.session_key:
+				return session
+		return None
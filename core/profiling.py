@@ -0,0 +1,126 @@
+"""On-demand request profiling for staff.
+
+A request is profiled when it carries either a valid ``X-Profile-Token``
+header (a signed, short-lived token minted on the staff profiles page) or the
+``?_profile=`` query flag from a logged-in staff user. ``_profile=sample``
+(or the same value in ``X-Profile-Mode``) uses the stack sampler; anything
+else uses cProfile.
+
+Profiles land in ``PROFILING_DIR`` and only the newest ``PROFILING_KEEP``
+are kept:
+
+* cProfile runs write ``.prof`` (pstats; opens in snakeviz or
+  ``python -m pstats``) plus a ``.txt`` summary.
+* Sampler runs write ``.folded`` collapsed stacks, which flamegraph.pl and
+  speedscope can load directly.
+"""
+import cProfile
+import io
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.text import slugify
+
+TOKEN_SALT = "core.profiling"
+TOKEN_MAX_AGE = 60 * 60  # seconds
+PROFILE_NAME_RE = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9]{6}-[a-z0-9-]+-(cprofile|sample)\.(prof|txt|folded)$")
+
+
+def profile_dir() -> Path:
+	return Path(getattr(settings, "PROFILING_DIR", Path(settings.BASE_DIR) / "profiles"))
+
+
+def make_token(user) -> str:
+	return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def user_id_from_token(token: str):
+	try:
+		return int(signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=TOKEN_MAX_AGE))
+	except (signing.BadSignature, ValueError):
+		return None
+
+
+class StackSampler:
+	"""Sample one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+	def __init__(self, thread_id: int, interval: float = 0.002):
+		self.thread_id = thread_id
+		self.interval = interval
+		self.stacks = Counter()
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			names = []
+			while frame is not None:
+				code = frame.f_code
+				names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{frame.f_lineno}")
+				frame = frame.f_back
+			if names:
+				self.stacks[";".join(reversed(names))] += 1
+
+	def start(self):
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		self._thread.join()
+
+	def folded(self) -> str:
+		return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _base_name(request, mode: str) -> str:
+	match = getattr(request, "resolver_match", None)
+	label = slugify((match.view_name if match else request.path).replace(":", "-"))[:60] or "root"
+	now = timezone.now()
+	return f"{now:%Y%m%dT%H%M%S}-{now:%f}-{label}-{mode}"
+
+
+def _rotate(directory: Path, keep: int):
+	runs = sorted({p.stem for p in directory.iterdir() if PROFILE_NAME_RE.match(p.name)}, reverse=True)
+	for stem in runs[keep:]:
+		for path in directory.glob(f"{stem}.*"):
+			path.unlink(missing_ok=True)
+
+
+def profile_request(request, get_response, mode: str):
+	"""Run ``get_response(request)`` under the chosen profiler and save the result."""
+	directory = profile_dir()
+	directory.mkdir(parents=True, exist_ok=True)
+	start = time.perf_counter()
+	if mode == "sample":
+		sampler = StackSampler(threading.get_ident())
+		sampler.start()
+		try:
+			response = get_response(request)
+		finally:
+			sampler.stop()
+		base = _base_name(request, mode)
+		(directory / f"{base}.folded").write_text(sampler.folded())
+	else:
+		mode = "cprofile"
+		profiler = cProfile.Profile()
+		try:
+			response = profiler.runcall(get_response, request)
+		finally:
+			base = _base_name(request, mode)
+			profiler.dump_stats(directory / f"{base}.prof")
+			summary = io.StringIO()
+			summary.write(f"{request.method} {request.get_full_path()}\n\n")
+			pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(60)
+			(directory / f"{base}.txt").write_text(summary.getvalue())
+	_rotate(directory, int(getattr(settings, "PROFILING_KEEP", 50)))
+	response["X-Profile-Id"] = base
+	response["X-Profile-Duration-Ms"] = f"{(time.perf_counter() - start) * 1000:.1f}"
+	return response
@@ -0,0 +1,54 @@
+"""Query shape recording used to spot N+1 patterns.
+
+A query's *shape* is its SQL with literals and ``IN (...)`` lists collapsed,
+so ``SELECT ... WHERE id = 1`` and ``... WHERE id = 2`` count as the same
+statement. The same shape executing many times in one request is almost
+always a missing ``select_related``/``prefetch_related``.
+"""
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:%s|\?|'[^']*'|-?\d+(?:\.\d+)?)\s*,?)+\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b-?\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+	shape = _IN_LIST.sub("IN (...)", sql)
+	shape = _STRING.sub("?", shape)
+	shape = _NUMBER.sub("?", shape)
+	return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryShapeRecorder:
+	"""``connection.execute_wrapper`` callable that tallies queries by shape."""
+
+	def __init__(self):
+		self.shapes = Counter()
+		self.samples = {}  # shape -> (sql, params) of its first execution
+		self.count = 0
+
+	def __call__(self, execute, sql, params, many, context):
+		self.count += 1
+		shape = normalize_sql(sql)
+		self.shapes[shape] += 1
+		if not many:
+			self.samples.setdefault(shape, (sql, params))
+		return execute(sql, params, many, context)
+
+	def repeated(self, threshold: int):
+		"""Return ``[(shape, count), ...]`` for shapes executed at least ``threshold`` times."""
+		return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+@contextmanager
+def record_query_shapes():
+	"""Record every query on every configured database for the duration of the block."""
+	recorder = QueryShapeRecorder()
+	with ExitStack() as stack:
+		for alias in connections:
+			stack.enter_context(connections[alias].execute_wrapper(recorder))
+		yield recorder
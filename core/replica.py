@@ -0,0 +1,174 @@
+"""Read-replica routing for read-only views.
+
+Views wrapped in ``@read_from_replica`` read app data (``REPLICA_APPS``) from
+the ``replica`` database alias; everything else, and every write, goes to
+``default``. Sessions and auth always stay on the primary.
+
+Read-your-writes: when a request writes app data (or uses an unsafe method),
+``ReplicaStickinessMiddleware`` pins the session to the primary for
+``REPLICA_STICKY_SECONDS`` so the next page shows the change even if the
+replica lags.
+
+If the replica cannot be reached it is marked down for
+``REPLICA_HEALTH_CHECK_INTERVAL`` seconds and reads go to the primary; a view
+that fails on the replica mid-request is retried once on the primary.
+
+Cache versions are bumped when the primary commits, before the replica has
+the change, so anything cached under them must be built inside ``primary()``.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger("pbcuk.db")
+
+REPLICA_ALIAS = "replica"
+STICKY_SESSION_KEY = "_db_primary_until"
+
+_use_replica = ContextVar("use_replica", default=False)
+_wrote = ContextVar("wrote_app_data", default=None)
+
+_health_lock = threading.Lock()
+_replica_down_until = 0.0
+
+
+def replica_configured() -> bool:
+	return REPLICA_ALIAS in settings.DATABASES
+
+
+def _replica_apps():
+	return getattr(settings, "REPLICA_APPS", {"core", "quotes", "accounts"})
+
+
+def mark_replica_down():
+	global _replica_down_until
+	with _health_lock:
+		_replica_down_until = time.monotonic() + getattr(settings, "REPLICA_HEALTH_CHECK_INTERVAL", 30)
+	logger.warning("replica unavailable; reading from primary for %ss", getattr(settings, "REPLICA_HEALTH_CHECK_INTERVAL", 30))
+
+
+def replica_available() -> bool:
+	"""Connect to the replica unless it failed recently; the result is cached per process."""
+	if not replica_configured() or time.monotonic() < _replica_down_until:
+		return False
+	try:
+		connections[REPLICA_ALIAS].ensure_connection()
+	except DatabaseError:
+		mark_replica_down()
+		return False
+	return True
+
+
+@contextmanager
+def primary():
+	"""Read app data from the primary inside the block, even in a ``@read_from_replica`` view."""
+	token = _use_replica.set(False)
+	try:
+		yield
+	finally:
+		_use_replica.reset(token)
+
+
+@contextmanager
+def track_app_writes():
+	"""Collect the labels of app models written to during the block."""
+	wrote = []
+	token = _wrote.set(wrote)
+	try:
+		yield wrote
+	finally:
+		_wrote.reset(token)
+
+
+def is_sticky(request) -> bool:
+	session = getattr(request, "session", None)
+	return bool(session is not None and session.get(STICKY_SESSION_KEY, 0) > time.time())
+
+
+async def ais_sticky(request) -> bool:
+	session = getattr(request, "session", None)
+	return bool(session is not None and await session.aget(STICKY_SESSION_KEY, 0) > time.time())
+
+
+class ReplicaRouter:
+	"""Send reads of app models to the replica inside ``@read_from_replica`` views."""
+
+	def db_for_read(self, model, **hints):
+		if _use_replica.get() and model._meta.app_label in _replica_apps():
+			return REPLICA_ALIAS
+		return None
+
+	def db_for_write(self, model, **hints):
+		wrote = _wrote.get()
+		if wrote is not None and model._meta.app_label in _replica_apps():
+			wrote.append(model._meta.label)
+		return "default"
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# Both aliases hold the same data; objects read from either may be related
+		return True
+
+
+def read_from_replica(view_func):
+	"""Serve safe requests from the replica unless the session is pinned to the primary."""
+	if iscoroutinefunction(view_func):
+		return _aread_from_replica(view_func)
+
+	@wraps(view_func)
+	def _wrapped(request, *args, **kwargs):
+		if request.method not in ("GET", "HEAD") or is_sticky(request) or not replica_available():
+			return view_func(request, *args, **kwargs)
+		token = _use_replica.set(True)
+		try:
+			return view_func(request, *args, **kwargs)
+		except DatabaseError:
+			if connections[REPLICA_ALIAS].is_usable():
+				raise
+			mark_replica_down()
+			_use_replica.reset(token)
+			token = None
+			return view_func(request, *args, **kwargs)
+		finally:
+			if token is not None:
+				_use_replica.reset(token)
+
+	return _wrapped
+
+
+def _replica_usable() -> bool:
+	# Called through sync_to_async so it checks the connection the ORM thread actually used
+	return connections[REPLICA_ALIAS].is_usable()
+
+
+def _aread_from_replica(view_func):
+	@wraps(view_func)
+	async def _wrapped(request, *args, **kwargs):
+		if (
+			request.method not in ("GET", "HEAD")
+			or not replica_configured()
+			or await ais_sticky(request)
+			or not await sync_to_async(replica_available)()
+		):
+			return await view_func(request, *args, **kwargs)
+		# The ORM's worker thread runs with a copy of this context, so it sees the flag
+		token = _use_replica.set(True)
+		try:
+			return await view_func(request, *args, **kwargs)
+		except DatabaseError:
+			if await sync_to_async(_replica_usable)():
+				raise
+			mark_replica_down()
+			_use_replica.reset(token)
+			token = None
+			return await view_func(request, *args, **kwargs)
+		finally:
+			if token is not None:
+				_use_replica.reset(token)
+
+	return _wrapped
@@ -0,0 +1,22 @@
+"""Async counterparts of ``django.shortcuts`` for the async public views.
+
+Template rendering is synchronous, so anything a template or context processor
+could load lazily (the user, the session) is fetched with the async API before
+``render`` runs; querysets are evaluated by the view itself.
+"""
+from django.http import Http404
+from django.shortcuts import render
+
+
+async def aget_object_or_404(queryset, **kwargs):
+	try:
+		return await queryset.aget(**kwargs)
+	except queryset.model.DoesNotExist:
+		raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+
+async def arender(request, template_name, context=None, **kwargs):
+	# Base templates read request.user and the messages context processor reads the session
+	request.user = await request.auser()
+	await request.session.akeys()
+	return render(request, template_name, context, **kwargs)
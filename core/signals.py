@@ -0,0 +1,9 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import bump_on_commit
+from .models import CompanyDetails
+
+
+@receiver([post_save, post_delete], sender=CompanyDetails)
+def company_details_changed(sender, instance, **kwargs):
+	bump_on_commit("company")
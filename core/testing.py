@@ -0,0 +1,88 @@
+"""Shared fixtures for query-budget tests."""
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.utils import timezone
+from quotes.models import Quote, QuoteItem, QuoteAcceptance, Invoice, InvoicePayment, InvoiceEvent, ProspectiveClient
+from core.models import CompanyDetails
+from .queries import record_query_shapes
+
+# A query shape repeated this many times in one request is treated as an N+1
+REPEATED_QUERY_THRESHOLD = 5
+
+
+def seed_data(scale: int = 1, items_per_quote: int = 6, prefix: str = "") -> dict:
+	"""Create a realistic slice of quotes, invoices and payments.
+
+	``scale`` multiplies the number of rows so tests can compare query counts at
+	two sizes: a view whose count grows with ``scale`` has an N+1.
+	"""
+	customer = User.objects.filter(username="customer").first() or User.objects.create_user(
+		"customer", "customer@example.com", "pw", first_name="Casey", last_name="Customer"
+	)
+	staff = User.objects.filter(username="staff").first() or User.objects.create_superuser(
+		"staff", "staff@example.com", "pw"
+	)
+	if not CompanyDetails.objects.exists():
+		CompanyDetails.objects.create(name="Prebuilt Computers UK", city="London", country="UK", email="support@example.com")
+	now = timezone.now()
+	public_quotes, invoices = [], []
+	for i in range(4 * scale):
+		client = ProspectiveClient.objects.create(name=f"Client {prefix}{i}", email=f"client{prefix}{i}@example.com")
+		quote = Quote.objects.create(
+			title=f"Gaming PC {prefix}{i}",
+			client=client,
+			is_public=True,
+			status=Quote.SENT,
+			valid_until=timezone.localdate() + timedelta(days=30),
+		)
+		QuoteItem.objects.bulk_create(
+			QuoteItem(quote=quote, description=f"Part {n}", quantity=1 + n % 2, unit_price=Decimal("49.99"), vat_rate=Decimal("20.00"))
+			for n in range(items_per_quote)
+		)
+		if i % 2:
+			quote.reserve(f"session-{prefix}{i}")
+		public_quotes.append(quote)
+	for i in range(3 * scale):
+		quote = Quote.objects.create(title=f"Workstation {prefix}{i}", status=Quote.ACCEPTED)
+		QuoteItem.objects.bulk_create(
+			QuoteItem(quote=quote, description=f"Component {n}", unit_price=Decimal("120.00")) for n in range(items_per_quote)
+		)
+		QuoteAcceptance.objects.create(
+			quote=quote, full_name="Casey Customer", email="customer@example.com", phone="0123",
+			address_line1="1 High Street", city="Leeds", postcode="LS1 1AA",
+		)
+		invoice = Invoice.create_from_quote(quote, user=customer)
+		invoice.assigned_to = staff
+		invoice.save(update_fields=["assigned_to"])
+		InvoicePayment.objects.create(invoice=invoice, method="card", amount=Decimal("10.00"), status=InvoicePayment.COMPLETED, provider="stripe", provider_reference=f"cs_{prefix}{i}")
+		InvoicePayment.objects.create(invoice=invoice, method="card", amount=Decimal("5.00"), status=InvoicePayment.FAILED, provider="stripe")
+		InvoiceEvent.objects.create(invoice=invoice, type=InvoiceEvent.STOCK_OK, message="Stock confirmed")
+		InvoiceEvent.objects.create(invoice=invoice, type=InvoiceEvent.BUILD_SCHEDULED, message="Build booked")
+		invoices.append(invoice)
+	paid = invoices[0]
+	paid.mark_paid()
+	return {
+		"customer": customer,
+		"staff": staff,
+		"public_quote": public_quotes[0],
+		"reserved_quote": public_quotes[1],
+		"invoice": invoices[-1],
+		"paid_invoice": paid,
+		"now": now,
+	}
+
+
+@contextmanager
+def assert_query_budget(testcase, budget: int, label: str = ""):
+	"""Fail if the block runs more than ``budget`` queries or repeats a query shape."""
+	with record_query_shapes() as recorder:
+		yield recorder
+	report = "\n".join(f"  {n}x {shape}" for shape, n in recorder.shapes.most_common())
+	testcase.assertLessEqual(
+		recorder.count, budget,
+		f"{label} ran {recorder.count} queries (budget {budget}):\n{report}",
+	)
+	repeated = recorder.repeated(REPEATED_QUERY_THRESHOLD)
+	testcase.assertFalse(repeated, f"{label} repeated query shapes (likely N+1):\n{report}")
@@ -3,4 +3,8 @@ from . import views
 
 urlpatterns = [
     path("", views.index, name="home"),
+    path("metrics", views.metrics, name="metrics"),
+    path("reports/sales/", views.sales_report, name="sales_report"),
+    path("profiles/", views.profiles, name="profiles"),
+    path("profiles/<str:name>", views.profile_file, name="profile_file"),
 ]
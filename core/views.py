@@ -1,20 +1,27 @@
 from django.shortcuts import render
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Q
+from django.db.models import Count, Q
 from quotes.models import Quote
+from .replica import read_from_replica
+from .shortcuts import arender
 
 
-def index(request):
-
+@read_from_replica
+async def index(request):
 	# Ensure a session exists for tracking and reservation ownership
 	if not request.session.session_key:
-		request.session.save()
+		await request.session.asave()
 	session_key = request.session.session_key
 
 	# Visited quotes
-	visited_tokens = request.session.get('visited_quote_tokens', [])
-	visited = list(Quote.objects.filter(token__in=visited_tokens)) if visited_tokens else []
+	visited_tokens = await request.session.aget('visited_quote_tokens', [])
+	visited = [q async for q in Quote.objects.filter(token__in=visited_tokens)] if visited_tokens else []
 	visited_public = [q for q in visited if q.is_public]
 	visited_private = [q for q in visited if not q.is_public]
 
@@ -22,20 +29,26 @@ def index(request):
 	cutoff = timezone.now() - timedelta(minutes=Quote.RESERVATION_DURATION)
 
 	# Public browse list: hide quotes reserved by other sessions (but keep mine visible)
-	public_quotes = (
-		Quote.objects.filter(is_public=True)
+	public_quotes = [
+		q async for q in Quote.objects.filter(is_public=True)
 		.exclude(Q(reservation_started_at__gte=cutoff) & ~Q(reservation_session_key=session_key))
 		.order_by('-created_at')
-	)
+	]
 
 	# Badge counts for all public quotes (regardless of visibility), split by availability
-	all_public_qs = Quote.objects.filter(is_public=True)
-	public_reserved_count = all_public_qs.filter(reservation_started_at__gte=cutoff).count()
-	public_available_count = all_public_qs.exclude(reservation_started_at__gte=cutoff).count()
-	reserved_my = Quote.objects.filter(
-		reservation_session_key=session_key,
-		reservation_started_at__gte=cutoff,
-	).order_by('-reservation_started_at')
+	reserved_q = Q(reservation_started_at__gte=cutoff)
+	badge_counts = await Quote.objects.filter(is_public=True).aaggregate(
+		reserved=Count('pk', filter=reserved_q),
+		available=Count('pk', filter=~reserved_q | Q(reservation_started_at__isnull=True)),
+	)
+	public_reserved_count = badge_counts['reserved']
+	public_available_count = badge_counts['available']
+	reserved_my = [
+		q async for q in Quote.objects.filter(
+			reservation_session_key=session_key,
+			reservation_started_at__gte=cutoff,
+		).order_by('-reservation_started_at')
+	]
 
 	context = {
 		'quotes': public_quotes,
@@ -45,6 +58,67 @@ def index(request):
 		'public_reserved_count': public_reserved_count,
 		'public_available_count': public_available_count,
 	}
-	return render(request, 'core/home.html', context)
+	return await arender(request, 'core/home.html', context)
+
+
+def metrics(request):
+	token = getattr(settings, 'METRICS_TOKEN', '')
+	auth = request.headers.get('Authorization', '')
+	token_ok = bool(token) and auth.startswith('Bearer ') and constant_time_compare(auth[7:], token)
+	if not (token_ok or (request.user.is_authenticated and request.user.is_staff)):
+		return HttpResponseForbidden('Forbidden')
+	from .metrics import render as render_metrics
+	body, content_type = render_metrics()
+	return HttpResponse(body, content_type=content_type)
+
+
+@staff_member_required
+def sales_report(request):
+	from quotes.reporting import aged_debt, monthly
+	try:
+		months = min(max(int(request.GET.get('months', 12)), 1), 36)
+	except ValueError:
+		months = 12
+	debt = aged_debt()
+	context = {
+		**admin.site.each_context(request),
+		'title': 'Sales report',
+		'months': months,
+		'monthly': monthly(months),
+		'aged_debt': debt,
+		'debt_count': sum(bucket['count'] for bucket in debt),
+		'debt_total': sum(bucket['total'] for bucket in debt),
+	}
+	return render(request, 'core/sales_report.html', context)
+
+
+@staff_member_required
+def profiles(request):
+	from .profiling import PROFILE_NAME_RE, make_token, profile_dir
+	directory = profile_dir()
+	runs = {}
+	if directory.is_dir():
+		for path in directory.iterdir():
+			if PROFILE_NAME_RE.match(path.name):
+				run = runs.setdefault(path.stem, {'id': path.stem, 'files': [], 'size': 0})
+				run['files'].append(path.name)
+				run['size'] += path.stat().st_size
+	context = {
+		**admin.site.each_context(request),
+		'title': 'Request profiles',
+		'runs': sorted(runs.values(), key=lambda r: r['id'], reverse=True),
+		'token': make_token(request.user),
+		'enabled': settings.PROFILING_ENABLED,
+	}
+	return render(request, 'core/profiles.html', context)
+
 
-# Create your views here.
+@staff_member_required
+def profile_file(request, name):
+	from .profiling import PROFILE_NAME_RE, profile_dir
+	path = profile_dir() / name
+	if not PROFILE_NAME_RE.match(name) or not path.is_file():
+		raise Http404
+	if name.endswith('.prof'):
+		return FileResponse(path.open('rb'), as_attachment=True, filename=name)
+	return FileResponse(path.open('rb'), content_type='text/plain; charset=utf-8')
@@ -0,0 +1,22 @@
+"""Gunicorn settings picked up automatically from the working directory.
+
+Command-line flags (see docker-compose.yml) still take precedence; this file
+only adds the hooks needed for Prometheus multiprocess metrics.
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    # Each worker writes metric values to mmap files here; start from a clean slate
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pbcuk.settings')
+# Read by settings to pick connection defaults that suit ASGI workers
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,25 @@
+"""Parse ``CACHE_URL`` into a Django ``CACHES`` entry.
+
+    locmem://                 per-process memory (development, tests)
+    file:///var/tmp/pbcuk     shared between workers on one host
+    redis://host:6379/0       shared between hosts (needs the ``redis`` package)
+
+Unknown schemes raise ``ImproperlyConfigured``.
+"""
+from urllib.parse import urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+def parse_cache_url(url, key_prefix='pbcuk'):
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme == 'locmem':
+        return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': parts.netloc or 'pbcuk', 'KEY_PREFIX': key_prefix}
+    if scheme == 'file':
+        if not parts.path:
+            raise ImproperlyConfigured('CACHE_URL: file cache needs a directory, e.g. file:///var/tmp/pbcuk-cache')
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': parts.path, 'KEY_PREFIX': key_prefix}
+    if scheme in ('redis', 'rediss'):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url, 'KEY_PREFIX': key_prefix}
+    raise ImproperlyConfigured(f'CACHE_URL: unsupported scheme {parts.scheme!r}; use locmem://, file:// or redis://')
@@ -0,0 +1,112 @@
+"""Reserving and accepting a public quote.
+
+``reserve`` takes the 15-minute reservation with one conditional UPDATE, so
+when several visitors open the accept page at once exactly one of them gets
+it. (Reading and then saving let each of them see a free quote and overwrite
+the others; the reservation race in ``run_load_test``.)
+
+``accept`` does the whole acceptance in one transaction with the quote row
+locked. It re-checks the reservation, inserts the acceptance and the invoice,
+and sets status, reservation and visibility in a single UPDATE. A failure
+anywhere leaves the quote as it was. The confirmation email and the PDF
+render run only once the transaction has committed.
+
+Both write quotes with ``QuerySet.update()``, which sends no signals, so they
+move ``updated_at`` and bump the cache versions themselves.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from core.cache import bump_on_commit
+from .models import Invoice, Quote
+
+ACQUIRED = "acquired"
+HELD = "held"
+CONFLICT = "conflict"
+EXPIRED = "expired"
+UNAVAILABLE = "unavailable"
+
+CLOSED_STATUSES = {Quote.ACCEPTED, Quote.DECLINED, Quote.EXPIRED}
+
+
+class AcceptanceRejected(Exception):
+	"""The visitor can't accept the quote; ``outcome`` is EXPIRED or UNAVAILABLE."""
+
+	def __init__(self, outcome: str, message: str):
+		super().__init__(message)
+		self.outcome = outcome
+
+
+def is_open(quote: Quote) -> bool:
+	expired = quote.valid_until and quote.valid_until < timezone.localdate()
+	return not expired and quote.status not in CLOSED_STATUSES
+
+
+def _quote_changed(quote_id) -> None:
+	bump_on_commit("quote", quote_id)
+	bump_on_commit("quotes")
+
+
+def reserve(quote: Quote, session_key: str) -> str:
+	"""Reserve ``quote`` for ``session_key`` unless another session holds it; returns the outcome.
+
+	``quote`` is updated in place to the reservation that is now in force.
+	"""
+	if quote.is_reservation_active and quote.reservation_session_key == session_key:
+		return HELD
+	now = timezone.now()
+	free = Q(reservation_started_at__isnull=True) | Q(reservation_started_at__lte=now - timedelta(minutes=Quote.RESERVATION_DURATION))
+	if Quote.objects.filter(free, pk=quote.pk).update(reservation_started_at=now, reservation_session_key=session_key, updated_at=now):
+		quote.reservation_started_at, quote.reservation_session_key = now, session_key
+		_quote_changed(quote.pk)
+		return ACQUIRED
+	# Someone else got there between our read and the UPDATE (or the copy we were given was stale)
+	quote.refresh_from_db(fields=["reservation_started_at", "reservation_session_key"])
+	owned = quote.is_reservation_active and quote.reservation_session_key == session_key
+	return HELD if owned else CONFLICT
+
+
+def accept(quote: Quote, session_key: str, form, user=None) -> Invoice:
+	"""Record the acceptance in ``form`` and invoice it; raises AcceptanceRejected if the reservation is gone."""
+	with transaction.atomic():
+		quote = Quote.objects.select_for_update().get(pk=quote.pk)
+		if not is_open(quote):
+			raise AcceptanceRejected(UNAVAILABLE, "This quote is not available for acceptance.")
+		if not quote.is_reservation_active or quote.reservation_session_key != session_key:
+			raise AcceptanceRejected(EXPIRED, "Your reservation expired. Please start acceptance again.")
+
+		acceptance = form.save(commit=False)
+		acceptance.quote = quote
+		acceptance.save()
+
+		now = timezone.now()
+		closed = {
+			"status": Quote.ACCEPTED,
+			"reservation_started_at": None,
+			"reservation_session_key": None,
+			"is_public": False,  # an invoiced quote is private
+			"updated_at": now,
+		}
+		Quote.objects.filter(pk=quote.pk).update(**closed)
+		for name, value in closed.items():
+			setattr(quote, name, value)
+		_quote_changed(quote.pk)
+
+		invoice = Invoice.objects.filter(quote=quote).first() or Invoice.create_from_quote(quote, user=user)
+		transaction.on_commit(lambda: _after_acceptance(invoice), robust=True)
+	return invoice
+
+
+def _after_acceptance(invoice: Invoice) -> None:
+	invoice._notify_customer(
+		f"Quote {invoice.quote.reference} accepted",
+		f"Thank you for accepting quote {invoice.quote.reference}. Invoice {invoice.number} "
+		f"for £{invoice.total} has been issued; you can pay it from your account.",
+	)
+	try:
+		from .pdf import cached_invoice_pdf
+	except ImportError:
+		return
+	# Render now, so the thanks page's PDF link is served from the cache
+	cached_invoice_pdf(invoice.pk, invoice.quote_id)
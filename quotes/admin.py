@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import ProspectiveClient, Quote, QuoteItem, QuoteAcceptance, Invoice, InvoicePayment, InvoiceEvent
+from django.urls import reverse
+from .models import ArchivedInvoice, ArchivedQuote, ProspectiveClient, Quote, QuoteItem, QuoteAcceptance, Invoice, InvoicePayment, InvoiceEvent
+from .exports import EXPORTS, csv_response
+from .payments import summarize_payments
 
 
 @admin.register(ProspectiveClient)
@@ -23,12 +26,26 @@ def _format_mmss(seconds: int) -> str:
 
 @admin.register(Quote)
 class QuoteAdmin(admin.ModelAdmin):
-	list_display = ("reference", "title", "status", "delivery_display", "not_vat_registered", "is_public", "created_at", "valid_until", "reservation_badge")
+	list_display = ("reference", "title", "status", "delivery_display", "not_vat_registered", "is_public", "created_at", "valid_until", "reservation_badge", "view_count", "accept_start_count")
 	list_filter = ("status", "not_vat_registered", "is_public", "created_at", "valid_until")
 	search_fields = ("reference", "title", "notes")
 	inlines = [QuoteItemInline]
 	readonly_fields = ("subtotal", "delivery_price", "vat_amount", "grand_total")
-	actions = ("release_reservation",)
+	actions = ("release_reservation", "export_items_csv")
+
+	def get_queryset(self, request):
+		# Counters live in QuoteStats; join it so the columns cost no extra queries
+		return super().get_queryset(request).select_related("stats")
+
+	@admin.display(description="Views", ordering="stats__views")
+	def view_count(self, obj):
+		stats = getattr(obj, "stats", None)
+		return stats.views if stats else 0
+
+	@admin.display(description="Accept starts", ordering="stats__accept_starts")
+	def accept_start_count(self, obj):
+		stats = getattr(obj, "stats", None)
+		return stats.accept_starts if stats else 0
 
 	@admin.action(description="Release reservation (clear lock)")
 	def release_reservation(self, request, queryset):
@@ -39,6 +56,11 @@ class QuoteAdmin(admin.ModelAdmin):
 				count += 1
 		self.message_user(request, f"Released reservation on {count} quote(s).")
 
+	@admin.action(description="Export line items as CSV")
+	def export_items_csv(self, request, queryset):
+		rows = EXPORTS["quote_items"].queryset(queryset=QuoteItem.objects.filter(quote__in=queryset.values("pk")))
+		return csv_response(request, "quote_items", rows)
+
 	def reservation_badge(self, obj):
 		if obj.is_reservation_active:
 			return format_html(
@@ -63,16 +85,24 @@ class QuoteAdmin(admin.ModelAdmin):
 @admin.register(QuoteAcceptance)
 class QuoteAcceptanceAdmin(admin.ModelAdmin):
 	list_display = ("quote", "accepted_at", "full_name", "email")
+	list_select_related = ("quote",)
 	search_fields = ("quote__reference", "full_name", "email")
+	list_filter = ("accepted_at",)
+	actions = ("export_csv",)
+
+	@admin.action(description="Export selected acceptances as CSV")
+	def export_csv(self, request, queryset):
+		return csv_response(request, "acceptances", EXPORTS["acceptances"].queryset(queryset=queryset))
 
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
 	list_display = ("number", "quote", "client_name", "client_email", "total", "status", "assigned_to", "created_at", "paid_at")
+	list_select_related = ("quote", "assigned_to")
 	search_fields = ("number", "quote__reference", "client_name", "client_email", "assigned_to__username", "assigned_to__first_name", "assigned_to__last_name")
 	list_filter = ("status", "created_at", "paid_at", "assigned_to")
-	readonly_fields = ("quote", "number", "subtotal", "delivery_price", "vat_amount", "total", "client_name", "client_email", "created_at", "paid_at")
-	actions = ("mark_as_paid", "confirm_items_in_stock_now", "mark_bank_transfer_received",)
+	readonly_fields = ("quote", "number", "subtotal", "delivery_price", "vat_amount", "total", "paid_so_far", "outstanding", "client_name", "client_email", "created_at", "paid_at")
+	actions = ("mark_as_paid", "confirm_items_in_stock_now", "mark_bank_transfer_received", "export_csv", "export_payments_csv")
 
 	@admin.action(description="Mark selected invoices paid")
 	def mark_as_paid(self, request, queryset):
@@ -83,6 +113,15 @@ class InvoiceAdmin(admin.ModelAdmin):
 				count += 1
 		self.message_user(request, f"Marked {count} invoice(s) as paid.")
 
+	@admin.action(description="Export selected invoices as CSV")
+	def export_csv(self, request, queryset):
+		return csv_response(request, "invoices", EXPORTS["invoices"].queryset(queryset=queryset))
+
+	@admin.action(description="Export payments on selected invoices as CSV")
+	def export_payments_csv(self, request, queryset):
+		rows = EXPORTS["payments"].queryset(queryset=InvoicePayment.objects.filter(invoice__in=queryset.values("pk")))
+		return csv_response(request, "payments", rows)
+
 	class PaymentInline(admin.TabularInline):
 		model = InvoicePayment
 		extra = 0
@@ -95,6 +134,22 @@ class InvoiceAdmin(admin.ModelAdmin):
 
 	inlines = [PaymentInline, EventInline]
 
+	def get_object(self, request, object_id, from_field=None):
+		obj = super().get_object(request, object_id, from_field)
+		if obj is not None:
+			obj.payment_summary = summarize_payments(obj)
+		return obj
+
+	@admin.display(description="Paid so far")
+	def paid_so_far(self, obj):
+		summary = getattr(obj, "payment_summary", None)
+		return summary.total_completed if summary else "-"
+
+	@admin.display(description="Outstanding")
+	def outstanding(self, obj):
+		summary = getattr(obj, "payment_summary", None)
+		return summary.outstanding if summary else "-"
+
 	@admin.action(description="Confirm items in stock (now)")
 	def confirm_items_in_stock_now(self, request, queryset):
 		count = 0
@@ -107,14 +162,11 @@ class InvoiceAdmin(admin.ModelAdmin):
 
 	@admin.action(description="Mark bank transfer received (full outstanding)")
 	def mark_bank_transfer_received(self, request, queryset):
-		from decimal import Decimal
 		count = 0
-		for inv in queryset:
+		for inv in queryset.prefetch_related("payments"):
 			if inv.status == Invoice.PAID:
 				continue
-			# Calculate outstanding based on completed payments
-			total_completed = sum((p.amount for p in inv.payments.filter(status=InvoicePayment.COMPLETED)), start=Decimal('0'))
-			outstanding = inv.total - total_completed
+			outstanding = summarize_payments(inv).outstanding
 			if outstanding <= 0:
 				continue
 			InvoicePayment.objects.create(
@@ -132,6 +184,48 @@ class InvoiceAdmin(admin.ModelAdmin):
 @admin.register(InvoiceEvent)
 class InvoiceEventAdmin(admin.ModelAdmin):
 	list_display = ("invoice", "type", "message", "created_at")
+	list_select_related = ("invoice", "invoice__quote")
 	list_filter = ("type", "created_at")
 	search_fields = ("invoice__number", "message")
 	readonly_fields = ("invoice", "type", "message", "created_at")
+
+
+@admin.register(ArchivedInvoice)
+class ArchivedInvoiceAdmin(admin.ModelAdmin):
+	list_display = ("number", "quote_reference", "client_email", "total", "created_at", "paid_at", "archived_at", "pdf_link")
+	search_fields = ("number", "quote_reference", "client_email")
+	list_filter = ("archived_at",)
+	exclude = ("data",)
+	readonly_fields = ("number", "quote_reference", "user", "client_email", "total", "created_at", "paid_at", "archived_at", "pdf_link")
+
+	def get_queryset(self, request):
+		# The compressed payload is only needed to render the PDF, which has its own view
+		return super().get_queryset(request).defer("data")
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+	@admin.display(description="PDF")
+	def pdf_link(self, obj):
+		return format_html('<a href="{}" target="_blank" rel="noopener">PDF</a>', reverse("quotes:invoice_pdf", args=[obj.number]))
+
+
+@admin.register(ArchivedQuote)
+class ArchivedQuoteAdmin(admin.ModelAdmin):
+	list_display = ("reference", "title", "status", "created_at", "archived_at")
+	search_fields = ("reference", "title")
+	list_filter = ("status", "archived_at")
+	exclude = ("data",)
+	readonly_fields = ("reference", "title", "status", "created_at", "archived_at")
+
+	def get_queryset(self, request):
+		return super().get_queryset(request).defer("data")
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
@@ -0,0 +1,170 @@
+"""Moving settled invoices out of the live tables.
+
+An invoice is settled once it is paid and shipped. ``archive_batch`` copies
+each settled invoice, with its quote, items, acceptance, payments and events,
+into one ``ArchivedInvoice`` row as compressed JSON. It then deletes the quote,
+which cascades to the rest, all in one transaction. The daily summaries are
+suspended meanwhile, so the sales report keeps the archived figures.
+
+Quotes that were never accepted go the same way once nothing has touched them
+since the cutoff: ``archive_quote_batch`` keeps each as an ``ArchivedQuote`` row
+with its items and stats. Both run inside ``archiving()``, which the per-row
+signal handlers check: deleting a quote already bumps its cache version, so the
+items cascading with it need not touch the parent or bump it again.
+
+``restore`` rebuilds unsaved, read-only model instances from the archive, with
+the related rows already in the prefetch caches. Code that reads
+``invoice.quote.items.all()``, ``invoice.payments.all()`` or
+``invoice.events.all()`` (the portal template, ``summarize_payments``, the PDF)
+then works unchanged and runs no queries.
+"""
+import json
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from . import reporting
+from .models import ArchivedInvoice, ArchivedQuote, Invoice, InvoiceEvent, InvoicePayment, Quote, QuoteAcceptance, QuoteItem
+
+_archiving = ContextVar("archiving", default=False)
+
+
+@contextmanager
+def archiving():
+	"""Mark deletes made inside the block as archive moves (see ``is_archiving``)."""
+	token = _archiving.set(True)
+	try:
+		yield
+	finally:
+		_archiving.reset(token)
+
+
+def is_archiving() -> bool:
+	return _archiving.get()
+
+
+def settled_before(cutoff: datetime):
+	"""Paid and shipped invoices whose payment and shipping both predate ``cutoff``."""
+	return Invoice.objects.filter(
+		status=Invoice.PAID,
+		paid_at__lt=cutoff,
+		shipping_date__lt=timezone.localtime(cutoff).date(),
+	)
+
+
+def unaccepted_before(cutoff: datetime):
+	"""Quotes never accepted or invoiced, created and last changed before ``cutoff``."""
+	return Quote.objects.filter(
+		created_at__lt=cutoff,
+		updated_at__lt=cutoff,
+		invoice__isnull=True,
+		acceptance__isnull=True,
+	).exclude(status=Quote.ACCEPTED)
+
+
+def _fields(instance) -> dict:
+	return {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields}
+
+
+def _instance(model, values: dict):
+	fields = {field.attname: field for field in model._meta.concrete_fields}
+	instance = model(**{name: fields[name].to_python(value) for name, value in values.items() if name in fields})
+	instance._state.adding = False
+	return instance
+
+
+def serialize(invoice: Invoice) -> bytes:
+	quote = invoice.quote
+	payload = {
+		"invoice": _fields(invoice),
+		"quote": _fields(quote),
+		"items": [_fields(item) for item in quote.items.all()],
+		"acceptance": _fields(quote.acceptance) if hasattr(quote, "acceptance") else None,
+		"payments": [_fields(payment) for payment in invoice.payments.all()],
+		"events": [_fields(event) for event in invoice.events.all()],
+	}
+	return zlib.compress(json.dumps(payload, cls=DjangoJSONEncoder).encode())
+
+
+def serialize_quote(quote: Quote) -> bytes:
+	payload = {
+		"quote": _fields(quote),
+		"items": [_fields(item) for item in quote.items.all()],
+		"stats": _fields(quote.stats) if hasattr(quote, "stats") else None,
+	}
+	return zlib.compress(json.dumps(payload, cls=DjangoJSONEncoder).encode())
+
+
+def restore(archived: ArchivedInvoice) -> Invoice:
+	payload = json.loads(zlib.decompress(archived.data))
+	quote = _instance(Quote, payload["quote"])
+	quote._prefetched_objects_cache = {"items": [_instance(QuoteItem, item) for item in payload["items"]]}
+	acceptance = _instance(QuoteAcceptance, payload["acceptance"]) if payload["acceptance"] else None
+	# Cache "no acceptance" too, so reading it doesn't query the (now empty) live table
+	quote._state.fields_cache["acceptance"] = acceptance
+	if acceptance:
+		acceptance.quote = quote
+	invoice = _instance(Invoice, payload["invoice"])
+	invoice.quote = quote
+	payments = [_instance(InvoicePayment, payment) for payment in payload["payments"]]
+	events = [_instance(InvoiceEvent, event) for event in payload["events"]]
+	for row in (*payments, *events):
+		row.invoice = invoice
+	invoice._prefetched_objects_cache = {"payments": payments, "events": events}
+	invoice.is_archived = True
+	return invoice
+
+
+def archive_batch(invoice_ids) -> int:
+	"""Archive whichever of ``invoice_ids`` are still there; returns how many were archived."""
+	with transaction.atomic(), reporting.suspended(), archiving():
+		locked = list(Invoice.objects.select_for_update().filter(pk__in=invoice_ids, status=Invoice.PAID).values_list("pk", flat=True))
+		invoices = list(
+			Invoice.objects.filter(pk__in=locked)
+			.select_related("quote", "quote__acceptance")
+			.prefetch_related("quote__items", "payments", "events")
+		)
+		ArchivedInvoice.objects.bulk_create([
+			ArchivedInvoice(
+				number=invoice.number,
+				quote_reference=invoice.quote.reference,
+				user_id=invoice.user_id,
+				client_email=invoice.client_email,
+				total=invoice.total,
+				created_at=invoice.created_at,
+				paid_at=invoice.paid_at,
+				data=serialize(invoice),
+			)
+			for invoice in invoices
+		])
+		Quote.objects.filter(pk__in=[invoice.quote_id for invoice in invoices]).delete()
+	return len(invoices)
+
+
+def archive_quote_batch(quote_ids, cutoff: datetime) -> int:
+	"""Archive whichever of ``quote_ids`` are still unaccepted and untouched since ``cutoff``."""
+	with transaction.atomic(), archiving():
+		# Checked again under the lock: one may have been accepted or edited since it was listed
+		locked = list(unaccepted_before(cutoff).select_for_update(of=("self",)).filter(pk__in=quote_ids).values_list("pk", flat=True))
+		quotes = list(Quote.objects.filter(pk__in=locked).select_related("stats").prefetch_related("items"))
+		ArchivedQuote.objects.bulk_create([
+			ArchivedQuote(
+				reference=quote.reference,
+				title=quote.title,
+				status=quote.status,
+				created_at=quote.created_at,
+				data=serialize_quote(quote),
+			)
+			for quote in quotes
+		])
+		Quote.objects.filter(pk__in=locked).delete()
+	return len(quotes)
+
+
+def cutoff_for(days: int) -> datetime:
+	"""Local midnight ``days`` days ago."""
+	day = timezone.localdate() - timedelta(days=days)
+	return timezone.make_aware(datetime.combine(day, time.min))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from .stats import has_atomic_counters
+
+
+@register(Tags.caches, deploy=True)
+def stats_cache_check(app_configs, **kwargs):
+	backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+	if not has_atomic_counters(backend):
+		return [Error(
+			f"Quote view counters need atomic cache increments, which {backend.rsplit('.', 1)[-1]} does not provide.",
+			hint="Set CACHE_URL to redis://; concurrent hits are lost otherwise (see quotes/stats.py).",
+			id="quotes.E001",
+		)]
+	return []
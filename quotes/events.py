@@ -0,0 +1,99 @@
+"""Server-sent events for quote reservation and status changes.
+
+Open quote pages subscribe to ``/q/events/?tokens=<uuid>,<uuid>`` and patch
+their badges in place instead of reloading when a countdown reaches zero.
+
+A stream does not query on every tick: it watches the quotes' cache versions,
+which ``signals`` bump on every save (``reserve`` and ``clear_reservation``
+included), and reloads the rows only when one moves. Expiry needs no write at
+all; it is worked out from the reservation start time the stream already holds.
+"""
+import asyncio
+import json
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from core.cache import get_versions
+from .models import Quote
+
+STATE_FIELDS = ("token", "status", "reservation_started_at", "reservation_session_key")
+KEEPALIVE_SECONDS = 15
+# How long the browser waits before reconnecting once a stream ends
+RETRY_MILLISECONDS = 3000
+
+
+def parse_tokens(raw: str) -> list[uuid.UUID]:
+	"""Valid, de-duplicated quote tokens from a comma-separated list, capped at QUOTE_EVENTS_MAX_TOKENS."""
+	tokens = []
+	for part in raw.split(","):
+		try:
+			token = uuid.UUID(part.strip())
+		except ValueError:
+			continue
+		if token not in tokens:
+			tokens.append(token)
+	return tokens[: settings.QUOTE_EVENTS_MAX_TOKENS]
+
+
+async def load_quotes(tokens) -> dict[str, Quote]:
+	return {str(q.token): q async for q in Quote.objects.filter(token__in=tokens).only(*STATE_FIELDS)}
+
+
+def quote_state(quote: Quote, session_key: str | None) -> dict:
+	"""What a badge needs to render ``quote`` for the visitor holding ``session_key``."""
+	active = quote.is_reservation_active
+	return {
+		"token": str(quote.token),
+		"status": quote.status,
+		"status_display": quote.get_status_display(),
+		"reserved": active,
+		"expires_at": quote.reservation_expires_at.isoformat() if active else None,
+		"owned": bool(active and session_key and quote.reservation_session_key == session_key),
+	}
+
+
+def event_name(old: dict | None, new: dict, quote: Quote) -> str:
+	if old is None:
+		return "snapshot"
+	if old["status"] != new["status"]:
+		return "status"
+	if new["reserved"]:
+		return "reserved"
+	# Cleared on acceptance or by staff, or simply ran out of time
+	return "expired" if quote.reservation_started_at else "released"
+
+
+def format_event(name: str, data: dict) -> str:
+	return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+async def quote_event_stream(quotes: dict[str, Quote], session_key: str | None):
+	"""Yield SSE chunks: a snapshot per quote, then one event per change until QUOTE_EVENTS_MAX_SECONDS."""
+	deps = [("quote", q.pk) for q in quotes.values()]
+	tokens = list(quotes)
+	versions = await sync_to_async(get_versions)(deps)
+	states = {}
+	yield f"retry: {RETRY_MILLISECONDS}\n\n"
+	started = last_sent = time.monotonic()
+	while True:
+		chunks = []
+		for token, quote in quotes.items():
+			state = quote_state(quote, session_key)
+			if states.get(token) != state:
+				chunks.append(format_event(event_name(states.get(token), state, quote), state))
+				states[token] = state
+		now = time.monotonic()
+		if chunks:
+			yield "".join(chunks)
+			last_sent = now
+		elif now - last_sent >= KEEPALIVE_SECONDS:
+			yield ": keepalive\n\n"
+			last_sent = now
+		if now - started >= settings.QUOTE_EVENTS_MAX_SECONDS:
+			return
+		await asyncio.sleep(settings.QUOTE_EVENTS_POLL_SECONDS)
+		current = await sync_to_async(get_versions)(deps)
+		if current != versions:
+			versions = current
+			quotes = await load_quotes(tokens)
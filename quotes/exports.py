@@ -0,0 +1,155 @@
+"""CSV exports for the accountant.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` and written
+one at a time into a ``StreamingHttpResponse`` (or a file), so memory stays
+flat however many rows match. Under ASGI the response gets an async generator
+that pulls each chunk in a worker thread: Django would otherwise buffer a
+synchronous iterator completely before sending it.
+
+Every export filters on a date column with its own index (and optionally a
+status), and orders by that column so the index also serves the sort.
+"""
+import csv
+from asgiref.sync import sync_to_async
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .models import Invoice, InvoicePayment, QuoteAcceptance, QuoteItem
+
+CHUNK_SIZE = 2000
+# Spreadsheets run text starting with these as a formula; such cells get a leading apostrophe
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+@dataclass(frozen=True)
+class Export:
+	model: type
+	columns: tuple[tuple[str, str], ...]  # (header, values_list lookup)
+	date_field: str
+	status_field: str | None = None
+
+	@property
+	def statuses(self) -> list[str]:
+		if not self.status_field:
+			return []
+		*path, name = self.status_field.split("__")
+		model = self.model
+		for step in path:
+			model = model._meta.get_field(step).related_model
+		return [value for value, _ in model._meta.get_field(name).choices]
+
+	def queryset(self, start: date | None = None, end: date | None = None, status: str | None = None, queryset: QuerySet | None = None) -> QuerySet:
+		queryset = self.model._default_manager.all() if queryset is None else queryset
+		# Compare against local-midnight datetimes rather than __date, which would hide the column from its index
+		if start:
+			queryset = queryset.filter(**{f"{self.date_field}__gte": _midnight(start)})
+		if end:
+			queryset = queryset.filter(**{f"{self.date_field}__lt": _midnight(end + timedelta(days=1))})
+		if status:
+			queryset = queryset.filter(**{self.status_field: status})
+		return queryset.order_by(self.date_field, "pk").values_list(*(lookup for _, lookup in self.columns))
+
+	@property
+	def header(self) -> list[str]:
+		return [header for header, _ in self.columns]
+
+
+EXPORTS = {
+	"invoices": Export(
+		Invoice,
+		(
+			("Number", "number"), ("Issued", "created_at"), ("Quote", "quote__reference"),
+			("Client", "client_name"), ("Email", "client_email"), ("Subtotal", "subtotal"),
+			("Delivery", "delivery_price"), ("VAT", "vat_amount"), ("Total", "total"),
+			("Status", "status"), ("Paid at", "paid_at"),
+		),
+		"created_at",
+		"status",
+	),
+	"payments": Export(
+		InvoicePayment,
+		(
+			("Payment", "pk"), ("Invoice", "invoice__number"), ("Received", "created_at"),
+			("Method", "method"), ("Provider", "provider"), ("Reference", "provider_reference"),
+			("Amount", "amount"), ("Status", "status"),
+		),
+		"created_at",
+		"status",
+	),
+	"acceptances": Export(
+		QuoteAcceptance,
+		(
+			("Quote", "quote__reference"), ("Accepted at", "accepted_at"), ("Name", "full_name"),
+			("Company", "company"), ("Email", "email"), ("Phone", "phone"),
+			("Address 1", "address_line1"), ("Address 2", "address_line2"), ("City", "city"), ("Postcode", "postcode"),
+		),
+		"accepted_at",
+	),
+	"quote_items": Export(
+		QuoteItem,
+		(
+			("Quote", "quote__reference"), ("Quote created", "quote__created_at"), ("Quote status", "quote__status"),
+			("Description", "description"), ("Quantity", "quantity"), ("Unit price", "unit_price"), ("VAT rate", "vat_rate"),
+		),
+		"quote__created_at",
+		"quote__status",
+	),
+}
+
+
+def _midnight(day: date) -> datetime:
+	return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _cell(value):
+	if isinstance(value, datetime):
+		return timezone.localtime(value).isoformat(timespec="seconds")
+	if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+		return f"'{value}"
+	return "" if value is None else value
+
+
+class _Echo:
+	"""A file-like object whose write returns the line, so csv.writer can feed a generator."""
+
+	def write(self, value):
+		return value
+
+
+def csv_lines(export: Export, rows, chunk_size: int = CHUNK_SIZE):
+	writer = csv.writer(_Echo())
+	yield writer.writerow(export.header)
+	for row in rows.iterator(chunk_size=chunk_size):
+		yield writer.writerow([_cell(value) for value in row])
+
+
+async def acsv_lines(export: Export, rows, chunk_size: int = CHUNK_SIZE):
+	writer = csv.writer(_Echo())
+	yield writer.writerow(export.header)
+	# Not aiterator(): for values_list querysets it runs the query on the event loop
+	iterator = rows.iterator(chunk_size=chunk_size)
+	while chunk := await sync_to_async(list)(islice(iterator, chunk_size)):
+		yield "".join(writer.writerow([_cell(value) for value in row]) for row in chunk)
+
+
+def write_csv(fh, export: Export, rows, chunk_size: int = CHUNK_SIZE) -> int:
+	"""Write ``rows`` to ``fh``; returns the number of data rows."""
+	count = 0
+	for count, line in enumerate(csv_lines(export, rows, chunk_size)):
+		fh.write(line)
+	return count
+
+
+def csv_response(request, name: str, rows) -> StreamingHttpResponse:
+	export = EXPORTS[name]
+	# Serving a synchronous iterator under ASGI makes Django read it all into memory first
+	lines = csv_lines(export, rows) if "wsgi.version" in request.META else acsv_lines(export, rows)
+	filename = f"{name}-{timezone.localdate():%Y%m%d}.csv"
+	return StreamingHttpResponse(
+		lines,
+		content_type="text/csv; charset=utf-8",
+		headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+	)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from quotes.archive import archive_batch, archive_quote_batch, cutoff_for, settled_before, unaccepted_before
+
+
+class Command(BaseCommand):
+	help = (
+		"Move paid and shipped invoices older than --days, with their quotes, items, acceptances, payments "
+		"and events, into ArchivedInvoice, then quotes never accepted and unchanged for as long into "
+		"ArchivedQuote. Each batch is its own transaction, so the command can be stopped and rerun at any point."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--days", type=int, default=730, help="Archive invoices paid and shipped, and unaccepted quotes last changed, before this many days ago")
+		parser.add_argument("--batch-size", type=int, default=200)
+		parser.add_argument("--dry-run", action="store_true", help="Only count the invoices and quotes that would be archived")
+
+	def handle(self, *args, **opts):
+		cutoff = cutoff_for(opts["days"])
+		passes = [
+			("invoice(s)", settled_before(cutoff), archive_batch),
+			("unaccepted quote(s)", unaccepted_before(cutoff), lambda batch: archive_quote_batch(batch, cutoff)),
+		]
+		for label, candidates, archive in passes:
+			candidates = candidates.order_by("pk").values_list("pk", flat=True)
+			if opts["dry_run"]:
+				self.stdout.write(f"{candidates.count()} {label} would be archived")
+			else:
+				self._archive(label, candidates, archive, opts)
+
+	def _archive(self, label, candidates, archive, opts):
+		archived = last_pk = 0
+		while True:
+			# Keyset over pk so a row that cannot be archived is not picked up again forever
+			batch = list(candidates.filter(pk__gt=last_pk)[: opts["batch_size"]])
+			if not batch:
+				break
+			archived += archive(batch)
+			last_pk = batch[-1]
+			if opts["verbosity"] > 1:
+				self.stdout.write(f"Archived {archived} {label} so far")
+		self.stdout.write(f"Archived {archived} {label}")
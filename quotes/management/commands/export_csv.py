@@ -0,0 +1,33 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from quotes.exports import CHUNK_SIZE, EXPORTS, write_csv
+
+
+class Command(BaseCommand):
+	help = (
+		"Stream invoices, payments, quote acceptances or quote line items to CSV, "
+		"optionally limited to a date range (inclusive, local time) and a status."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("export", choices=sorted(EXPORTS))
+		parser.add_argument("--since", type=date.fromisoformat, help="First day to include (YYYY-MM-DD)")
+		parser.add_argument("--until", type=date.fromisoformat, help="Last day to include (YYYY-MM-DD)")
+		parser.add_argument("--status", help="Only rows with this status (quote status for line items)")
+		parser.add_argument("--output", help="Write to this file instead of stdout")
+		parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+	def handle(self, *args, **opts):
+		export = EXPORTS[opts["export"]]
+		if opts["status"] and opts["status"] not in export.statuses:
+			choices = ", ".join(export.statuses) or "none"
+			raise CommandError(f"--status for {opts['export']} must be one of: {choices}")
+		if opts["since"] and opts["until"] and opts["since"] > opts["until"]:
+			raise CommandError("--since is after --until")
+		rows = export.queryset(opts["since"], opts["until"], opts["status"])
+		if opts["output"]:
+			with open(opts["output"], "w", newline="", encoding="utf-8") as fh:
+				count = write_csv(fh, export, rows, opts["chunk_size"])
+			self.stderr.write(f"Wrote {count} row(s) to {opts['output']}")
+		else:
+			write_csv(self.stdout, export, rows, opts["chunk_size"])
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from quotes.stats import flush
+
+
+class Command(BaseCommand):
+	help = (
+		"Move buffered quote view/accept-start counts from the cache into QuoteStats. "
+		"Run every minute or so from cron, or with --every to loop."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--every", type=float, default=0, help="Keep running, flushing every N seconds")
+
+	def handle(self, *args, **opts):
+		while True:
+			updated = flush()
+			if opts["verbosity"] > 1 or (updated and not opts["every"]):
+				self.stdout.write(f"Flushed counts for {updated} quote(s)")
+			if not opts["every"]:
+				return
+			time.sleep(opts["every"])
@@ -0,0 +1,28 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from quotes.reporting import rebuild
+
+
+def _date(value):
+	try:
+		return date.fromisoformat(value)
+	except ValueError:
+		raise CommandError(f"Not a YYYY-MM-DD date: {value}")
+
+
+class Command(BaseCommand):
+	help = (
+		"Recompute the DailySummary rows behind the sales report from invoices, payments and events. "
+		"Needed after bulk imports or other writes that bypass model signals; "
+		"without --since/--until every day is rebuilt."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--since", type=_date, help="First day to rebuild (YYYY-MM-DD)")
+		parser.add_argument("--until", type=_date, help="Last day to rebuild (YYYY-MM-DD)")
+
+	def handle(self, *args, **opts):
+		if opts["since"] and opts["until"] and opts["since"] > opts["until"]:
+			raise CommandError("--since is after --until")
+		days = rebuild(opts["since"], opts["until"])
+		self.stdout.write(f"Rebuilt {days} daily summary row(s)")
@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from quotes.sync import InvalidCursor, changes
+
+
+class Command(BaseCommand):
+	help = (
+		"Write invoices, payments and invoice events changed since the last run as JSON lines, "
+		'one record per line with a "type" key. The resume cursor is read from and saved back to --cursor-file.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument("--cursor-file", help="File holding the cursor; created on the first run")
+		parser.add_argument("--cursor", default="", help="Start from this cursor instead of --cursor-file")
+		parser.add_argument("--output", help="Write to this file instead of stdout")
+		parser.add_argument("--page-size", type=int)
+
+	def handle(self, *args, **opts):
+		cursor_file = Path(opts["cursor_file"]) if opts["cursor_file"] else None
+		cursor = opts["cursor"] or (cursor_file.read_text().strip() if cursor_file and cursor_file.exists() else "")
+		out = open(opts["output"], "w", encoding="utf-8") if opts["output"] else self.stdout
+		written = 0
+		try:
+			while True:
+				try:
+					page = changes(cursor, opts["page_size"])
+				except InvalidCursor as exc:
+					raise CommandError(str(exc))
+				for kind in ("invoices", "payments", "events"):
+					for row in page[kind]:
+						out.write(json.dumps({"type": kind[:-1], **row}, cls=DjangoJSONEncoder) + "\n")
+						written += 1
+				cursor = page["cursor"]
+				if not page["has_more"]:
+					break
+		finally:
+			if out is not self.stdout:
+				out.close()
+		# Only advance the saved cursor once everything up to it has been written
+		if cursor_file:
+			cursor_file.write_text(cursor + "\n")
+		self.stderr.write(f"Wrote {written} change(s)")
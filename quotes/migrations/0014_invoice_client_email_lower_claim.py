@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def claim_orphan_invoices(apps, schema_editor):
+    # Attach existing orphan invoices to active users with a matching email
+    Invoice = apps.get_model("quotes", "Invoice")
+    User = apps.get_model("auth", "User")
+    for user in User.objects.filter(is_active=True).exclude(email="").only("id", "email").iterator():
+        (
+            Invoice.objects.alias(client_email_lower=django.db.models.functions.text.Lower("client_email"))
+            .filter(user__isnull=True, client_email_lower=user.email.lower())
+            .update(user=user)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0013_invoice_assigned_to"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(django.db.models.functions.text.Lower("client_email"), name="invoice_client_email_lower"),
+        ),
+        migrations.RunPython(claim_orphan_invoices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("quotes", "0014_invoice_client_email_lower_claim"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(fields=["user", "-created_at", "-id"], name="invoice_user_created_idx"),
+        ),
+    ]
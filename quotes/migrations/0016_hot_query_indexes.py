@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0015_invoice_user_created_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', '-created_at'], name='invoice_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceevent',
+            index=models.Index(fields=['invoice', 'created_at'], name='event_invoice_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoicepayment',
+            index=models.Index(fields=['invoice', 'status'], name='payment_invoice_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoicepayment',
+            index=models.Index(condition=models.Q(('provider_reference', ''), _negated=True), fields=['provider_reference'], name='payment_provider_ref_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quote',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-created_at'], name='quote_public_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quote',
+            index=models.Index(fields=['reservation_session_key', 'reservation_started_at'], name='quote_reservation_idx'),
+        ),
+    ]
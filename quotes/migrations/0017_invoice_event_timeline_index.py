@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0016_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoiceevent',
+            index=models.Index(fields=['invoice', 'id'], name='event_invoice_id_idx'),
+        ),
+    ]
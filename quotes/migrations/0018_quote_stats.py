@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0017_invoice_event_timeline_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuoteStats',
+            fields=[
+                ('quote', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='quotes.quote')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('accept_starts', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'quote stats',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0018_quote_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('invoices_issued', models.IntegerField(default=0)),
+                ('net_invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('delivery_invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vat_invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('gross_invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('unpaid_count', models.IntegerField(default=0)),
+                ('unpaid_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('invoices_paid', models.IntegerField(default=0)),
+                ('payments_received', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'daily summaries',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
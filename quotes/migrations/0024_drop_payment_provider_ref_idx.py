@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0023_reference_counter'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='invoicepayment',
+            name='payment_provider_ref_idx',
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Lower
 from django.contrib.auth.models import User
 from decimal import Decimal, ROUND_HALF_UP
 from django.utils import timezone
@@ -6,6 +8,7 @@ from datetime import timedelta
 import uuid
 from django.core.mail import send_mail
 from django.conf import settings
+from core.metrics import PAYMENTS_APPLIED
 
 
 class ProspectiveClient(models.Model):
@@ -18,8 +21,25 @@ class ProspectiveClient(models.Model):
 		return self.company or self.name
 
 
+class ReferenceCounter(models.Model):
+	"""The last number handed out for one reference prefix on one day (see ``quotes.numbering``)."""
+
+	prefix = models.CharField(max_length=10)
+	day = models.DateField()
+	last = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=["prefix", "day"], name="reference_counter_prefix_day_uniq"),
+		]
+
+	def __str__(self):
+		return f"{self.prefix}-{self.day:%Y%m%d}: {self.last}"
+
+
 def _generate_code(prefix: str) -> str:
-	return f"{prefix}-{timezone.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
+	from .numbering import next_code
+	return next_code(prefix)
 
 
 class Quote(models.Model):
@@ -57,6 +77,16 @@ class Quote(models.Model):
 
 	class Meta:
 		ordering = ["-created_at"]
+		indexes = [
+			# Public browse list and badge counts on the home page. Partial rather than
+			# (is_public, created_at): public quotes are a small slice and SQLite only
+			# matches a bare boolean filter against an index's WHERE clause.
+			models.Index(fields=["-created_at"], condition=Q(is_public=True), name="quote_public_created_idx"),
+			# "My reservations" lookups by session
+			models.Index(fields=["reservation_session_key", "reservation_started_at"], name="quote_reservation_idx"),
+			# Date-range CSV exports of line items (quotes.exports)
+			models.Index(fields=["created_at"], name="quote_created_idx"),
+		]
 
 	def __str__(self):
 		return f"{self.reference} — {self.title}"
@@ -147,10 +177,78 @@ class QuoteAcceptance(models.Model):
 	postcode = models.CharField(max_length=20)
 	notes = models.TextField(blank=True)
 
+	class Meta:
+		indexes = [
+			# Date-range CSV exports (quotes.exports)
+			models.Index(fields=["accepted_at"], name="acceptance_accepted_idx"),
+		]
+
 	def __str__(self):
 		return f"Acceptance for {self.quote.reference}"
 
 
+class QuoteStats(models.Model):
+	"""Per-quote counters, updated in bulk from the cache by ``flush_quote_stats`` (see ``quotes.stats``)."""
+
+	quote = models.OneToOneField(Quote, related_name="stats", on_delete=models.CASCADE, primary_key=True)
+	views = models.PositiveBigIntegerField(default=0)
+	accept_starts = models.PositiveBigIntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		verbose_name_plural = "quote stats"
+
+	def __str__(self):
+		return f"Stats for {self.quote_id}"
+
+
+class DailySummary(models.Model):
+	"""Invoice and payment figures for one day, kept current by ``quotes.reporting``.
+
+	Issue-date figures (``invoices_issued`` to ``unpaid_total``) are dated by the
+	invoice's ``created_at``; ``payments_received`` by the payment's and
+	``invoices_paid`` by the paid event's.
+	"""
+
+	date = models.DateField(unique=True)
+	invoices_issued = models.IntegerField(default=0)
+	net_invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	delivery_invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	vat_invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	gross_invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	# Invoices issued this day that are still unpaid, and what is still owed on them
+	# (total less completed payments): the aged-debt buckets
+	unpaid_count = models.IntegerField(default=0)
+	unpaid_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	invoices_paid = models.IntegerField(default=0)
+	payments_received = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+	class Meta:
+		ordering = ["-date"]
+		verbose_name_plural = "daily summaries"
+
+	def __str__(self):
+		return f"Summary for {self.date}"
+
+
+class InvoiceQuerySet(models.QuerySet):
+	def with_payment_totals(self):
+		"""Annotate ``paid_so_far`` and ``outstanding`` from completed payments in the same query."""
+		completed = (
+			InvoicePayment.objects.filter(invoice=OuterRef("pk"), status=InvoicePayment.COMPLETED)
+			.order_by()
+			.values("invoice")
+			.annotate(total=Sum("amount"))
+			.values("total")
+		)
+		money = DecimalField(max_digits=10, decimal_places=2)
+		return self.annotate(
+			paid_so_far=Coalesce(Subquery(completed, output_field=money), Value(Decimal("0.00")), output_field=money),
+		).annotate(
+			outstanding=ExpressionWrapper(F("total") - F("paid_so_far"), output_field=money),
+		)
+
+
 class Invoice(models.Model):
 	UNPAID = "unpaid"
 	PAID = "paid"
@@ -173,20 +271,60 @@ class Invoice(models.Model):
 	total = models.DecimalField(max_digits=10, decimal_places=2)
 	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=UNPAID)
 	paid_at = models.DateTimeField(null=True, blank=True)
+	updated_at = models.DateTimeField(auto_now=True)
 
 	# Build/fulfillment progress
 	items_in_stock_at = models.DateTimeField(null=True, blank=True)
 	build_date = models.DateField(null=True, blank=True)
 	shipping_date = models.DateField(null=True, blank=True)
 
+	objects = InvoiceQuerySet.as_manager()
+
+	# True on read-only instances rebuilt from an ArchivedInvoice (see quotes.archive)
+	is_archived = False
+
+	class Meta:
+		indexes = [
+			models.Index(Lower("client_email"), name="invoice_client_email_lower"),
+			models.Index(fields=["user", "-created_at", "-id"], name="invoice_user_created_idx"),
+			models.Index(fields=["status", "-created_at"], name="invoice_status_created_idx"),
+			# Date-range CSV exports without a status filter (quotes.exports)
+			models.Index(fields=["created_at"], name="invoice_created_idx"),
+			# Keyset scans for the bookkeeping sync feed (quotes.sync)
+			models.Index(fields=["updated_at", "id"], name="invoice_updated_idx"),
+		]
+
 	def __str__(self):
 		return self.number or f"Invoice for {self.quote.reference}"
 
 	def save(self, *args, **kwargs):
 		if not self.number:
 			self.number = _generate_code('INV')
+		if kwargs.get("update_fields"):
+			# auto_now only reaches the row if it is listed; the sync feed depends on it
+			kwargs["update_fields"] = {*kwargs["update_fields"], "updated_at"}
+		if self.pk is None and self.user_id is None and self.client_email:
+			# Link new invoices to an existing verified account with the same email. Emails
+			# aren't unique on User: with several matches, leave it for staff to assign.
+			matches = list(
+				User.objects.alias(email_lower=Lower("email"))
+				.filter(email_lower=self.client_email.lower(), is_active=True)[:2]
+			)
+			if len(matches) == 1:
+				self.user = matches[0]
 		return super().save(*args, **kwargs)
 
+	@classmethod
+	def claim_for_user(cls, user: User) -> int:
+		"""Attach orphan invoices whose client email matches the user's email."""
+		if not user.email:
+			return 0
+		return (
+			cls.objects.alias(client_email_lower=Lower("client_email"))
+			.filter(user__isnull=True, client_email_lower=user.email.lower())
+			.update(user=user, updated_at=timezone.now())
+		)
+
 	def mark_paid(self):
 		if self.status != self.PAID:
 			self.status = self.PAID
@@ -196,6 +334,8 @@ class Invoice(models.Model):
 
 	@classmethod
 	def create_from_quote(cls, quote: Quote, user: User | None = None):
+		# subtotal, vat_amount and grand_total each walk the items; load them once
+		models.prefetch_related_objects([quote], "items")
 		acceptance = getattr(quote, "acceptance", None)
 		invoice = cls(
 			quote=quote,
@@ -265,6 +405,13 @@ class InvoiceEvent(models.Model):
 	message = models.CharField(max_length=255, blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
 
+	class Meta:
+		indexes = [
+			models.Index(fields=["invoice", "created_at"], name="event_invoice_created_idx"),
+			# Timeline polling: new events for one invoice after the last id the client has
+			models.Index(fields=["invoice", "id"], name="event_invoice_id_idx"),
+		]
+
 	def __str__(self):
 		return f"{self.type} @ {self.created_at:%Y-%m-%d %H:%M}"
 
@@ -300,16 +447,91 @@ class InvoicePayment(models.Model):
 	provider = models.CharField(max_length=50, blank=True)  # gateway identifier
 	provider_reference = models.CharField(max_length=100, blank=True)  # external payment id
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [
+			# Completed-payment sums per invoice; gateway reference lookups are per invoice too
+			models.Index(fields=["invoice", "status"], name="payment_invoice_status_idx"),
+			# Date-range CSV exports (quotes.exports)
+			models.Index(fields=["created_at"], name="payment_created_idx"),
+			models.Index(fields=["updated_at", "id"], name="payment_updated_idx"),
+		]
 
 	def __str__(self):
 		return f"Payment {self.id} for {self.invoice.number}"
 
 	def save(self, *args, **kwargs):
-		new = self.pk is None
+		update_fields = kwargs.get("update_fields")
+		if update_fields:
+			kwargs["update_fields"] = {*update_fields, "updated_at"}
+		# Count a payment as applied once, when it becomes completed
+		status_saved = update_fields is None or "status" in update_fields
+		completing = self.status == self.COMPLETED and (
+			self._state.adding
+			or (status_saved and not type(self).objects.filter(pk=self.pk, status=self.COMPLETED).exists())
+		)
 		res = super().save(*args, **kwargs)
+		if completing:
+			PAYMENTS_APPLIED.labels(self.provider or self.method or "unspecified").inc()
 		# Auto-mark invoice paid if total of completed payments >= invoice total
 		if self.status == self.COMPLETED:
-			total_completed = sum(p.amount for p in self.invoice.payments.filter(status=self.COMPLETED))
+			total_completed = self.invoice.payments.filter(status=self.COMPLETED).aggregate(total=Sum("amount"))["total"] or Decimal("0")
 			if total_completed >= self.invoice.total and self.invoice.status != Invoice.PAID:
 				self.invoice.mark_paid()
 		return res
+
+
+class ArchivedInvoice(models.Model):
+	"""A settled invoice moved out of the live tables by ``archive_invoices``.
+
+	``data`` is the zlib-compressed JSON of the invoice with its quote, items,
+	acceptance, payments and events; ``quotes.archive.restore`` turns it back into
+	unsaved model instances for the portal and the PDF. The other columns are
+	only there to find it.
+	"""
+
+	number = models.CharField(max_length=40, unique=True)
+	quote_reference = models.CharField(max_length=30, db_index=True)
+	user = models.ForeignKey(User, related_name="archived_invoices", null=True, blank=True, on_delete=models.SET_NULL)
+	client_email = models.EmailField(blank=True)
+	total = models.DecimalField(max_digits=10, decimal_places=2)
+	created_at = models.DateTimeField()
+	paid_at = models.DateTimeField(null=True, blank=True)
+	archived_at = models.DateTimeField(auto_now_add=True)
+	data = models.BinaryField()
+
+	class Meta:
+		ordering = ["-created_at"]
+		indexes = [
+			models.Index(fields=["user", "-created_at"], name="archived_user_created_idx"),
+		]
+
+	def __str__(self):
+		return self.number
+
+	def restore(self) -> Invoice:
+		from .archive import restore
+		return restore(self)
+
+
+class ArchivedQuote(models.Model):
+	"""A quote that was never accepted, moved out of the live tables by ``archive_invoices``.
+
+	``data`` is the zlib-compressed JSON of the quote with its items and stats.
+	Nothing reads it back in the app; it is kept for the record and found by
+	reference in the admin.
+	"""
+
+	reference = models.CharField(max_length=30, unique=True)
+	title = models.CharField(max_length=200)
+	status = models.CharField(max_length=20, choices=Quote.STATUS_CHOICES)
+	created_at = models.DateTimeField()
+	archived_at = models.DateTimeField(auto_now_add=True)
+	data = models.BinaryField()
+
+	class Meta:
+		ordering = ["-created_at"]
+
+	def __str__(self):
+		return f"{self.reference} — {self.title}"
@@ -0,0 +1,95 @@
+"""Sequential quote references and invoice numbers: ``Q-YYYYMMDD-NNNN``, ``INV-YYYYMMDD-NNNN``.
+
+Numbers come from a ``ReferenceCounter`` row per prefix and day. A process
+reserves a block of ``REFERENCE_BLOCK_SIZES[prefix]`` numbers with one UPDATE
+in a short transaction (hi/lo), then hands them out from memory, so the row is
+locked once per block rather than once per save.
+
+Blocks trade strictness for throughput. Numbers left in a block when a process
+exits are never used, and two processes interleave their blocks. A block size
+of 1 (the default for invoices) keeps numbers gapless and in issue order.
+
+A reservation made inside a caller's transaction would be rolled back with it
+while the process kept the rest of the block. Those handed-out numbers could
+then be reserved again elsewhere. Most saves do run inside ``atomic()`` (the
+admin, acceptance), so on PostgreSQL the block is reserved on a connection of
+its own that commits straight away, and the caller never holds the counter
+row's lock. SQLite cannot do that: the caller's transaction already holds the
+database's write lock, which the second connection would wait on. There, only
+a cached number is used inside ``atomic()``, or exactly one is reserved as
+part of the caller's transaction; it commits or rolls back with the row that
+uses it. A rolled-back caller leaves a gap in the PostgreSQL case instead.
+"""
+import threading
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ReferenceCounter
+
+_blocks = {}  # (prefix, day) -> [next number, last number reserved]
+_lock = threading.Lock()
+
+
+def _reserve(prefix: str, day, count: int) -> int:
+	"""Reserve ``count`` numbers for ``prefix`` on ``day``; returns the last one."""
+	db = router.db_for_write(ReferenceCounter)
+	counters = ReferenceCounter.objects.using(db).filter(prefix=prefix, day=day)
+	with transaction.atomic(using=db):
+		if not counters.update(last=F("last") + count):
+			try:
+				with transaction.atomic(using=db):
+					ReferenceCounter.objects.using(db).create(prefix=prefix, day=day, last=count)
+				return count
+			except IntegrityError:
+				# Another process created the day's counter first
+				counters.update(last=F("last") + count)
+		# The UPDATE holds the row lock, so this reads our own increment
+		return counters.values_list("last", flat=True).get()
+
+
+def _reserve_apart(db: str, prefix: str, day, count: int) -> int:
+	"""Like ``_reserve``, on a separate connection that commits whatever the caller's transaction does."""
+	connection = connections.create_connection(db)
+	qn = connection.ops.quote_name
+	table = qn(ReferenceCounter._meta.db_table)
+	try:
+		with connection.cursor() as cursor:
+			cursor.execute(
+				f"INSERT INTO {table} ({qn('prefix')}, {qn('day')}, {qn('last')}) VALUES (%s, %s, %s) "
+				f"ON CONFLICT ({qn('prefix')}, {qn('day')}) DO UPDATE SET {qn('last')} = {table}.{qn('last')} + EXCLUDED.{qn('last')} "
+				f"RETURNING {qn('last')}",
+				[prefix, day, count],
+			)
+			return cursor.fetchone()[0]
+	finally:
+		connection.close()
+
+
+def next_number(prefix: str, day=None) -> int:
+	day = day or timezone.localdate()
+	key = (prefix, day)
+	with _lock:
+		block = _blocks.get(key)
+		if block and block[0] <= block[1]:
+			block[0] += 1
+			return block[0] - 1
+	# Never wait on the counter row while holding _lock: the row may be locked by another
+	# thread's open transaction, which could itself be waiting for _lock
+	size = settings.REFERENCE_BLOCK_SIZES.get(prefix, 1)
+	db = router.db_for_write(ReferenceCounter)
+	connection = transaction.get_connection(db)
+	if size <= 1 or (connection.in_atomic_block and connection.vendor != "postgresql"):
+		return _reserve(prefix, day, 1)
+	last = _reserve_apart(db, prefix, day, size) if connection.in_atomic_block else _reserve(prefix, day, size)
+	with _lock:
+		# Blocks for earlier days will not be used again
+		for stale in [k for k in _blocks if k[0] == prefix and k != key]:
+			del _blocks[stale]
+		_blocks[key] = [last - size + 2, last]
+	return last - size + 1
+
+
+def next_code(prefix: str) -> str:
+	day = timezone.localdate()
+	return f"{prefix}-{day:%Y%m%d}-{next_number(prefix, day):04d}"
@@ -6,49 +6,27 @@ from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from reportlab.lib.units import mm
 from pathlib import Path
-from core.models import CompanyDetails
+from core.company import company_profile
+from core.metrics import INVOICE_PDF_RENDER
+from .payments import summarize_payments
 
 HEADER_HEIGHT = 40
 FOOTER_HEIGHT = 30
 
-def _company():
-    cd = CompanyDetails.get()
-    if cd:
-        lines = [l for l in [cd.address_line1, cd.address_line2, cd.city, cd.postcode, cd.country] if l]
-        return {
-            'name': cd.name,
-            'lines': lines or [cd.city, cd.country] if (cd.city or cd.country) else [],
-            'email': cd.email or getattr(settings, 'COMPANY_EMAIL', ''),
-            'phone': cd.phone or getattr(settings, 'COMPANY_PHONE', ''),
-            'vat': cd.vat_number or getattr(settings, 'COMPANY_VAT_NUMBER', ''),
-            'logo_path': Path(cd.logo_path) if cd.logo_path else Path(getattr(settings, 'COMPANY_LOGO_PATH', Path(settings.BASE_DIR) / 'static' / 'logo.png')),
-        }
-    # Fallback to settings
-    return {
-        'name': getattr(settings, 'COMPANY_NAME', 'Prebuilt Computers UK'),
-        'lines': getattr(settings, 'COMPANY_ADDRESS_LINES', ['123 Tech Park', 'Innovation Way', 'London, UK']),
-        'email': getattr(settings, 'COMPANY_EMAIL', 'support@prebuiltcomputers.uk'),
-        'phone': getattr(settings, 'COMPANY_PHONE', '+44 (0)20 0000 0000'),
-        'vat': getattr(settings, 'COMPANY_VAT_NUMBER', 'GB000000000'),
-        'logo_path': Path(getattr(settings, 'COMPANY_LOGO_PATH', Path(settings.BASE_DIR) / 'static' / 'logo.png')),
-    }
-
-
-def _draw_header(c, invoice):
-    comp = _company()
+def _draw_header(c, invoice, comp):
     c.setFillColor(colors.black)
     y = A4[1] - 25
     # Logo if exists
-    logo = comp['logo_path']
+    logo = comp.logo_path
     if logo.exists():
         try:
             c.drawImage(str(logo), 30, y - 35, width=80, height=30, preserveAspectRatio=True, mask='auto')
         except Exception:
             pass
     c.setFont('Helvetica-Bold', 16)
-    c.drawString(120, y - 10, comp['name'])
+    c.drawString(120, y - 10, comp.name)
     c.setFont('Helvetica', 9)
-    for i, line in enumerate(comp['lines']):
+    for i, line in enumerate(comp.lines):
         c.drawString(120, y - 25 - (i * 11), line)
     c.setFont('Helvetica-Bold', 20)
     c.drawRightString(A4[0] - 30, y - 10, 'INVOICE')
@@ -56,15 +34,14 @@ def _draw_header(c, invoice):
     c.drawRightString(A4[0] - 30, y - 30, invoice.number)
 
 
-def _draw_footer(c, page_num):
-    comp = _company()
+def _draw_footer(c, page_num, comp):
     c.setStrokeColor(colors.grey)
     c.setLineWidth(0.5)
     c.line(30, FOOTER_HEIGHT + 5, A4[0] - 30, FOOTER_HEIGHT + 5)
     c.setFont('Helvetica', 8)
     footer_y = FOOTER_HEIGHT - 2
     c.setFillColor(colors.grey)
-    c.drawString(30, footer_y, f"VAT: {comp['vat']}  •  Email: {comp['email']}  •  Tel: {comp['phone']}")
+    c.drawString(30, footer_y, f"VAT: {comp.vat}  •  Email: {comp.email}  •  Tel: {comp.phone}")
     c.drawRightString(A4[0] - 30, footer_y, f"Page {page_num}")
 
 
@@ -88,6 +65,7 @@ def _draw_stamp(c, invoice):
     c.restoreState()
 
 
+@INVOICE_PDF_RENDER.time()
 def generate_invoice_pdf(invoice):
     buffer = io.BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
@@ -96,10 +74,11 @@ def generate_invoice_pdf(invoice):
         c.setTitle(f"Invoice {invoice.number}")
     except Exception:
         pass
+    # Company details are drawn on every page; load them once per document
+    comp = company_profile()
     # Add author/subject metadata for better viewer display/searchability
     try:
-        comp = _company()
-        c.setAuthor(comp.get('name') or 'Prebuilt Computers UK')
+        c.setAuthor(comp.name or 'Prebuilt Computers UK')
     except Exception:
         try:
             c.setAuthor('Prebuilt Computers UK')
@@ -111,7 +90,7 @@ def generate_invoice_pdf(invoice):
         pass
     page_num = 1
 
-    _draw_header(c, invoice)
+    _draw_header(c, invoice, comp)
 
     width, height = A4
     left = 30
@@ -191,10 +170,10 @@ def generate_invoice_pdf(invoice):
     c.setFont('Helvetica', 8)
     for item in invoice.quote.items.all():
         if y_items < 90:
-            _draw_footer(c, page_num)
+            _draw_footer(c, page_num, comp)
             c.showPage()
             page_num += 1
-            _draw_header(c, invoice)
+            _draw_header(c, invoice, comp)
             y_items = height - 120
             c.setFont('Helvetica-Bold', 10)
             c.drawString(left, y_items, 'Items (cont.)')
@@ -234,7 +213,7 @@ def generate_invoice_pdf(invoice):
     c.setFont('Helvetica-Bold', 10)
     c.drawString(left, y_pay, 'Payments')
     y_pay -= 14
-    payments = invoice.payments.all().order_by('created_at')
+    payments = summarize_payments(invoice).payments
     if payments:
         c.setFont('Helvetica', 8)
         pay_table_width = right - left
@@ -253,10 +232,10 @@ def generate_invoice_pdf(invoice):
         c.setFont('Helvetica', 8)
         for pay in payments:
             if y_pay < 70:
-                _draw_footer(c, page_num)
+                _draw_footer(c, page_num, comp)
                 c.showPage()
                 page_num += 1
-                _draw_header(c, invoice)
+                _draw_header(c, invoice, comp)
                 c.setFont('Helvetica-Bold', 10)
                 c.drawString(left, A4[1] - 120, 'Payments (cont.)')
                 y_pay = A4[1] - 135
@@ -287,10 +266,26 @@ def generate_invoice_pdf(invoice):
     # Paid stamp
     _draw_stamp(c, invoice)
 
-    _draw_footer(c, page_num)
+    _draw_footer(c, page_num, comp)
 
     c.showPage()
     c.save()
     pdf_bytes = buffer.getvalue()
     buffer.close()
     return pdf_bytes
+
+
+def cached_invoice_pdf(invoice_id, quote_id):
+    """The invoice PDF, rendered once per version of the invoice (payments, events), its quote and the company details."""
+    from core.cache import get_or_set
+    from .models import Invoice
+
+    def render():
+        full = (
+            Invoice.objects.select_related("quote", "quote__acceptance")
+            .prefetch_related("quote__items", "payments")
+            .get(pk=invoice_id)
+        )
+        return generate_invoice_pdf(full)
+
+    return get_or_set("invoice-pdf", [("invoice", invoice_id), ("quote", quote_id), ("company",)], render)
@@ -0,0 +1,242 @@
+"""Daily summary rows behind the staff sales report.
+
+Each invoice, payment and invoice event contributes fixed amounts to one
+``DailySummary`` row. The signals in ``quotes.signals`` take a row's
+contribution before a save (from the database) and after it, and add the
+difference with a single ``UPDATE ... SET x = x + delta``, so concurrent writers
+never overwrite each other and a rolled-back write takes its change with it.
+A delete subtracts the deleted row's own contribution, which keeps cascades
+consistent too.
+
+``unpaid_total`` is what is still owed on unpaid invoices. An unpaid invoice
+contributes its total less the completed payments already made on it; each
+completed payment made while the invoice is unpaid takes its amount off the
+invoice's issue day. Paid invoices and their payments add nothing to it.
+
+Writes that skip signals (``bulk_create``, ``QuerySet.update``, raw SQL) are
+not counted; ``rebuild_daily_summaries`` recomputes a date range from scratch.
+Archiving (``quotes.archive``) deletes rows with the summaries ``suspended`` so
+that history keeps its figures; ``rebuild`` reads those back from the archive.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from .models import ArchivedInvoice, DailySummary, Invoice, InvoiceEvent, InvoicePayment
+
+FIGURES = (
+	"invoices_issued", "net_invoiced", "delivery_invoiced", "vat_invoiced", "gross_invoiced",
+	"unpaid_count", "unpaid_total", "invoices_paid", "payments_received",
+)
+_suspended = ContextVar("summaries_suspended", default=False)
+
+# Ages in days, inclusive; None leaves the bucket open-ended
+AGE_BUCKETS = [("0–30 days", 0, 30), ("31–60 days", 31, 60), ("61–90 days", 61, 90), ("Over 90 days", 91, None)]
+
+
+def _completed_payments(invoice_id) -> Decimal:
+	payments = InvoicePayment.objects.filter(invoice_id=invoice_id, status=InvoicePayment.COMPLETED)
+	return payments.aggregate(total=Sum("amount", default=Decimal("0")))["total"]
+
+
+def _invoice_figures(row):
+	unpaid = row["status"] == Invoice.UNPAID
+	return {timezone.localdate(row["created_at"]): {
+		"invoices_issued": 1,
+		"net_invoiced": row["subtotal"],
+		"delivery_invoiced": row["delivery_price"],
+		"vat_invoiced": row["vat_amount"],
+		"gross_invoiced": row["total"],
+		"unpaid_count": int(unpaid),
+		"unpaid_total": row["total"] - _completed_payments(row["id"]) if unpaid else Decimal("0"),
+	}}
+
+
+def _payment_figures(row):
+	completed = row["status"] == InvoicePayment.COMPLETED
+	figures = {timezone.localdate(row["created_at"]): {"payments_received": row["amount"] if completed else Decimal("0")}}
+	if completed and row["invoice__status"] == Invoice.UNPAID:
+		issued = timezone.localdate(row["invoice__created_at"])
+		figures.setdefault(issued, {})["unpaid_total"] = -row["amount"]
+	return figures
+
+
+def _event_figures(row):
+	return {timezone.localdate(row["created_at"]): {"invoices_paid": int(row["type"] == InvoiceEvent.PAID)}}
+
+
+# model -> (fields the contribution depends on, function of those fields -> {day: figures})
+SOURCES = {
+	Invoice: (("id", "created_at", "subtotal", "delivery_price", "vat_amount", "total", "status"), _invoice_figures),
+	InvoicePayment: (("created_at", "amount", "status", "invoice__status", "invoice__created_at"), _payment_figures),
+	InvoiceEvent: (("created_at", "type"), _event_figures),
+}
+
+
+@contextmanager
+def suspended():
+	"""Leave the summary rows alone for writes made inside the block."""
+	token = _suspended.set(True)
+	try:
+		yield
+	finally:
+		_suspended.reset(token)
+
+
+def is_suspended() -> bool:
+	return _suspended.get()
+
+
+def contribution(instance, from_db=False) -> dict[date, dict]:
+	"""``{day: {figure: amount}}`` for ``instance`` as it is now, or as stored when ``from_db``."""
+	fields, figures = SOURCES[type(instance)]
+	if from_db:
+		row = type(instance)._base_manager.filter(pk=instance.pk).values(*fields).first()
+		if row is None:
+			return {}
+	else:
+		row = {name: _value(instance, name) for name in fields}
+	return figures(row)
+
+
+def _value(instance, name):
+	for part in name.split("__"):
+		instance = getattr(instance, part)
+	return instance
+
+
+def affects_summary(instance, update_fields) -> bool:
+	"""False when a save cannot change the instance's contribution, so it needs no lookups."""
+	fields = SOURCES[type(instance)][0]
+	return update_fields is None or not set(update_fields).isdisjoint(fields)
+
+
+def difference(after: dict, before: dict) -> dict[date, dict]:
+	changes = defaultdict(lambda: defaultdict(int))
+	for sign, side in ((1, after), (-1, before)):
+		for day, values in side.items():
+			for name, amount in values.items():
+				changes[day][name] += sign * amount
+	return {day: {k: v for k, v in values.items() if v} for day, values in changes.items()}
+
+
+def apply(changes: dict[date, dict]) -> None:
+	"""Add ``changes`` to the summary rows, creating rows for new days."""
+	for day, values in changes.items():
+		if not values:
+			continue
+		increments = {name: F(name) + amount for name, amount in values.items()}
+		if DailySummary.objects.filter(date=day).update(**increments):
+			continue
+		try:
+			with transaction.atomic():
+				DailySummary.objects.create(date=day, **values)
+		except IntegrityError:
+			# Another writer created the day's row first
+			DailySummary.objects.filter(date=day).update(**increments)
+
+
+def rebuild(start: date | None = None, end: date | None = None) -> int:
+	"""Recompute the rows for ``start``..``end`` (inclusive, either open) from the source tables."""
+
+	def in_range(queryset):
+		if start:
+			queryset = queryset.filter(created_at__date__gte=start)
+		if end:
+			queryset = queryset.filter(created_at__date__lte=end)
+		return queryset.annotate(day=TruncDate("created_at")).values("day").order_by()
+
+	rows = defaultdict(dict)
+	unpaid = Q(status=Invoice.UNPAID)
+	for row in in_range(Invoice.objects).annotate(
+		invoices_issued=Count("pk"),
+		net_invoiced=Sum("subtotal"),
+		delivery_invoiced=Sum("delivery_price"),
+		vat_invoiced=Sum("vat_amount"),
+		gross_invoiced=Sum("total"),
+		unpaid_count=Count("pk", filter=unpaid),
+		unpaid_total=Sum("total", filter=unpaid, default=0),
+	):
+		rows[row.pop("day")].update(row)
+	# Completed payments on unpaid invoices reduce what is owed on the invoice's issue day
+	owed = InvoicePayment.objects.filter(status=InvoicePayment.COMPLETED, invoice__status=Invoice.UNPAID)
+	if start:
+		owed = owed.filter(invoice__created_at__date__gte=start)
+	if end:
+		owed = owed.filter(invoice__created_at__date__lte=end)
+	for row in owed.annotate(day=TruncDate("invoice__created_at")).values("day").order_by().annotate(paid=Sum("amount")):
+		rows[row["day"]]["unpaid_total"] -= row["paid"]
+	for row in in_range(InvoicePayment.objects.filter(status=InvoicePayment.COMPLETED)).annotate(payments_received=Sum("amount")):
+		rows[row.pop("day")].update(row)
+	for row in in_range(InvoiceEvent.objects.filter(type=InvoiceEvent.PAID)).annotate(invoices_paid=Count("pk")):
+		rows[row.pop("day")].update(row)
+	_add_archived(rows, start, end)
+
+	with transaction.atomic():
+		existing = DailySummary.objects.all()
+		if start:
+			existing = existing.filter(date__gte=start)
+		if end:
+			existing = existing.filter(date__lte=end)
+		existing.delete()
+		DailySummary.objects.bulk_create(
+			[DailySummary(date=day, **values) for day, values in sorted(rows.items())], batch_size=500
+		)
+	return len(rows)
+
+
+def _add_archived(rows, start, end):
+	"""Add archived invoices' contributions to ``rows``, for days within ``start``..``end``."""
+	from .archive import restore  # imports this module
+	archived = ArchivedInvoice.objects.all()
+	# Payments and the paid event fall between issue and payment
+	if start:
+		archived = archived.filter(paid_at__date__gte=start)
+	if end:
+		archived = archived.filter(created_at__date__lte=end)
+	for record in archived.iterator(chunk_size=500):
+		invoice = restore(record)
+		for instance in (invoice, *invoice.payments.all(), *invoice.events.all()):
+			for day, values in contribution(instance).items():
+				if (start and day < start) or (end and day > end):
+					continue
+				totals = rows[day]
+				for name, amount in values.items():
+					totals[name] = totals.get(name, 0) + amount
+
+
+def monthly(months: int = 12, today: date | None = None) -> list[dict]:
+	"""Totals per calendar month, newest first, for the last ``months`` months including this one."""
+	today = today or timezone.localdate()
+	first = today.replace(day=1)
+	for _ in range(months - 1):
+		first = (first - timedelta(days=1)).replace(day=1)
+	rows = (
+		DailySummary.objects.filter(date__gte=first)
+		.annotate(month=TruncMonth("date")).values("month")
+		.annotate(**{name: Sum(name) for name in FIGURES})
+		.order_by("-month")
+	)
+	return [{**row, "revenue": row["net_invoiced"] + row["delivery_invoiced"]} for row in rows]
+
+
+def aged_debt(today: date | None = None) -> list[dict]:
+	"""Unpaid invoices grouped by age since issue, oldest bucket last."""
+	today = today or timezone.localdate()
+	aggregates = {}
+	for index, (label, youngest, oldest) in enumerate(AGE_BUCKETS):
+		when = Q(date__lte=today - timedelta(days=youngest))
+		if oldest is not None:
+			when &= Q(date__gte=today - timedelta(days=oldest))
+		aggregates[f"count_{index}"] = Sum("unpaid_count", filter=when, default=0)
+		aggregates[f"total_{index}"] = Sum("unpaid_total", filter=when, default=0)
+	totals = DailySummary.objects.filter(unpaid_count__gt=0).aggregate(**aggregates)
+	return [
+		{"label": label, "count": totals[f"count_{index}"], "total": totals[f"total_{index}"]}
+		for index, (label, _, _) in enumerate(AGE_BUCKETS)
+	]
@@ -0,0 +1,73 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from core.cache import bump_on_commit
+from . import archive, reporting
+from .models import Quote, QuoteItem, QuoteAcceptance, Invoice, InvoicePayment, InvoiceEvent
+
+
+@receiver([post_save, post_delete], sender=Quote)
+def quote_changed(sender, instance, **kwargs):
+	bump_on_commit("quote", instance.pk)
+	bump_on_commit("quotes")  # public lists and badge counts
+
+
+@receiver([post_save, post_delete], sender=QuoteItem)
+@receiver([post_save, post_delete], sender=QuoteAcceptance)
+def quote_part_changed(sender, instance, **kwargs):
+	if archive.is_archiving():
+		return  # the quote's own delete bumps it
+	bump_on_commit("quote", instance.quote_id)
+
+
+@receiver([post_save, post_delete], sender=QuoteItem)
+def quote_item_touches_quote(sender, instance, **kwargs):
+	# The public page's Last-Modified/ETag come from Quote.updated_at, so an item edit must move it.
+	# update() skips Quote signals; quote_part_changed above already bumps the cache version.
+	if archive.is_archiving():
+		return  # the quote is being deleted with it
+	Quote.objects.filter(pk=instance.quote_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+def invoice_changed(sender, instance, **kwargs):
+	bump_on_commit("invoice", instance.pk)
+
+
+@receiver([post_save, post_delete], sender=InvoicePayment)
+@receiver([post_save, post_delete], sender=InvoiceEvent)
+def invoice_part_changed(sender, instance, **kwargs):
+	if archive.is_archiving():
+		return  # the invoice's own delete bumps it
+	bump_on_commit("invoice", instance.invoice_id)
+
+
+@receiver(pre_save, sender=Invoice)
+@receiver(pre_save, sender=InvoicePayment)
+@receiver(pre_save, sender=InvoiceEvent)
+def summary_before_save(sender, instance, update_fields=None, **kwargs):
+	if reporting.is_suspended() or not reporting.affects_summary(instance, update_fields):
+		instance._summary_before = None
+	elif instance._state.adding:
+		instance._summary_before = {}
+	else:
+		instance._summary_before = reporting.contribution(instance, from_db=True)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=InvoicePayment)
+@receiver(post_save, sender=InvoiceEvent)
+def summary_after_save(sender, instance, **kwargs):
+	before = getattr(instance, "_summary_before", None)
+	if before is not None:
+		reporting.apply(reporting.difference(reporting.contribution(instance), before))
+	instance._summary_before = None
+
+
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=InvoicePayment)
+@receiver(post_delete, sender=InvoiceEvent)
+def summary_after_delete(sender, instance, **kwargs):
+	if reporting.is_suspended():
+		return
+	reporting.apply(reporting.difference({}, reporting.contribution(instance)))
@@ -0,0 +1,148 @@
+"""Buffered quote counters.
+
+Counting a view with a database write would turn the hottest read into a
+write, so hits are counted with atomic cache increments and moved into
+``QuoteStats`` in bulk by ``flush_quote_stats``.
+
+Cache layout (all under ``qstats:``):
+
+* ``qstats:<kind>:<quote id>``: the pending count for one counter.
+* ``qstats:mark:<quote id>``: set while a quote has pending counts, so it is
+  queued only once between flushes.
+* ``qstats:seq`` / ``qstats:seq:<n>``: an append-only queue of quote ids with
+  pending counts. The cache cannot list its keys, so this is how a flush
+  finds them.
+* ``qstats:flushed``: the last queue position a flush has consumed.
+* ``qstats:flushing``: held while a flush runs, so overlapping runs (cron and
+  ``--every``) don't take the same queue range twice.
+
+The backend must increment atomically, and be shared by all workers for the
+counts to be complete: Redis (or memcached). The file and database caches
+increment by reading and rewriting the value, so concurrent hits are lost;
+``check --deploy`` fails with quotes.E001 on them. Per-process locmem is atomic
+but each worker buffers its own counts.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import Quote, QuoteStats
+
+COUNTERS = ("views", "accept_starts")
+PREFIX = "qstats"
+# Pending counts should outlive any gap between flushes
+TIMEOUT = 7 * 24 * 60 * 60
+# Released when a flush finishes; the timeout only frees it after a crash
+FLUSH_LOCK_TIMEOUT = 5 * 60
+# Backends whose incr/decr/add are atomic
+ATOMIC_BACKENDS = ("RedisCache", "MemcacheCache", "PyLibMCCache", "LocMemCache")
+
+
+def _incr(key: str, delta: int = 1, timeout=TIMEOUT) -> int:
+	try:
+		return cache.incr(key, delta)
+	except ValueError:
+		if cache.add(key, delta, timeout):
+			return delta
+		return cache.incr(key, delta)
+
+
+def _enqueue(quote_id: int) -> int:
+	position = _incr(f"{PREFIX}:seq", timeout=None)
+	cache.set(f"{PREFIX}:seq:{position}", quote_id, TIMEOUT)
+	return position
+
+
+def record(kind: str, quote_id: int, delta: int = 1) -> None:
+	_incr(f"{PREFIX}:{kind}:{quote_id}", delta)
+	if cache.add(f"{PREFIX}:mark:{quote_id}", 1, TIMEOUT):
+		position = _enqueue(quote_id)
+		# A flush between taking the position and filling it moved past the empty slot (it
+		# advances the cursor before reading). The mark is still set, so queue the quote again;
+		# a quote queued twice is harmless, the second flush finds nothing pending.
+		if (cache.get(f"{PREFIX}:flushed") or 0) >= position:
+			_enqueue(quote_id)
+
+
+def record_view(quote_id: int) -> None:
+	record("views", quote_id)
+
+
+def record_accept_start(quote_id: int) -> None:
+	record("accept_starts", quote_id)
+
+
+def take_pending() -> dict[int, dict[str, int]]:
+	"""Remove and return the buffered counts as ``{quote_id: {counter: delta}}``."""
+	flushed = cache.get(f"{PREFIX}:flushed") or 0
+	end = cache.get(f"{PREFIX}:seq") or 0
+	# A queue behind the cursor means the cache lost it (restart, eviction) and it started again
+	start = flushed + 1 if end >= flushed else 1
+	if end < start:
+		return {}
+	# Move the cursor before reading, so a writer that fills a slot after the read sees it
+	# has been passed and queues again (see ``record``)
+	cache.set(f"{PREFIX}:flushed", end, None)
+	positions = [f"{PREFIX}:seq:{n}" for n in range(start, end + 1)]
+	quote_ids = set(cache.get_many(positions).values())
+	cache.delete_many(positions)
+
+	pending = {}
+	for quote_id in quote_ids:
+		# Unmark first: a hit from here on queues the quote again rather than being lost
+		cache.delete(f"{PREFIX}:mark:{quote_id}")
+		counts = {}
+		for kind in COUNTERS:
+			key = f"{PREFIX}:{kind}:{quote_id}"
+			value = cache.get(key) or 0
+			if value:
+				# decr, not delete: hits landing between the read and now stay buffered
+				cache.decr(key, value)
+				counts[kind] = value
+		if counts:
+			pending[quote_id] = counts
+	return pending
+
+
+def has_atomic_counters(backend: str) -> bool:
+	return backend.endswith(ATOMIC_BACKENDS)
+
+
+def flush() -> int:
+	"""Add the buffered counts to ``QuoteStats``; returns the number of quotes updated.
+
+	Returns 0 without doing anything while another flush is running.
+	"""
+	lock = f"{PREFIX}:flushing"
+	if not cache.add(lock, 1, FLUSH_LOCK_TIMEOUT):
+		return 0
+	try:
+		return _flush(take_pending())
+	finally:
+		cache.delete(lock)
+
+
+def _flush(pending) -> int:
+	if not pending:
+		return 0
+	try:
+		with transaction.atomic():
+			live = set(Quote.objects.filter(pk__in=pending).values_list("pk", flat=True))
+			existing = QuoteStats.objects.select_for_update().in_bulk(live)
+			new, now = [], timezone.now()
+			for quote_id in live:
+				stats = existing.get(quote_id)
+				if stats is None:
+					stats = QuoteStats(quote_id=quote_id)
+					new.append(stats)
+				for kind, delta in pending[quote_id].items():
+					setattr(stats, kind, getattr(stats, kind) + delta)
+				stats.updated_at = now  # bulk_update skips auto_now
+			QuoteStats.objects.bulk_create(new)
+			QuoteStats.objects.bulk_update(list(existing.values()), [*COUNTERS, "updated_at"])
+	except Exception:
+		# Put the counts back so the next flush retries them
+		for quote_id, counts in pending.items():
+			for kind, delta in counts.items():
+				record(kind, quote_id, delta)
+		raise
+	return len(live)
@@ -1,3 +1,710 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import uuid
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipIf, skipUnless
+from asgiref.sync import sync_to_async
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from core.testing import assert_query_budget, seed_data
+from . import acceptance
+from .events import event_name, parse_tokens, quote_state
+from .exports import EXPORTS
+from .reporting import FIGURES, aged_debt, monthly, rebuild
+from .models import ArchivedInvoice, ArchivedQuote, DailySummary, Invoice, InvoiceEvent, InvoicePayment, Quote, QuoteAcceptance, QuoteItem, QuoteStats, ReferenceCounter
 
-# Create your tests here.
+# Query budget for each admin changelist, keyed by "app_label.model"
+CHANGELIST_BUDGETS = {
+	"auth.user": 9,
+	"auth.group": 8,
+	"core.post": 10,
+	"core.companydetails": 9,
+	"quotes.prospectiveclient": 8,
+	"quotes.quote": 8,
+	"quotes.quoteacceptance": 8,
+	"quotes.invoice": 9,
+	"quotes.invoiceevent": 8,
+	"quotes.archivedinvoice": 8,
+	"quotes.archivedquote": 8,
+}
+
+
+class AdminChangelistQueryBudgetTests(TestCase):
+	"""Admin changelists stay within budget and do not issue a query per row."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.data = seed_data()
+
+	def _changelist_url(self, model):
+		return reverse(f"admin:{model._meta.app_label}_{model._meta.model_name}_changelist")
+
+	def _run(self, model):
+		key = f"{model._meta.app_label}.{model._meta.model_name}"
+		client = Client()
+		client.force_login(self.data["staff"])
+		with assert_query_budget(self, CHANGELIST_BUDGETS[key], key) as recorder:
+			response = client.get(self._changelist_url(model))
+		self.assertEqual(response.status_code, 200)
+		return recorder.count
+
+	def test_every_registered_model_has_a_budget(self):
+		registered = {f"{m._meta.app_label}.{m._meta.model_name}" for m in admin.site._registry}
+		self.assertEqual(registered, set(CHANGELIST_BUDGETS))
+
+	def test_changelist_budgets(self):
+		for model in admin.site._registry:
+			with self.subTest(model._meta.label):
+				self._run(model)
+
+	def test_changelist_counts_do_not_grow_with_data(self):
+		before = {model: self._run(model) for model in admin.site._registry}
+		seed_data(scale=3, prefix="more-")
+		after = {model: self._run(model) for model in admin.site._registry}
+		self.assertEqual(before, after)
+
+
+class QuoteDetailConditionalGetTests(TestCase):
+	"""The public quote page answers 304 until the quote, its items or the reservation change."""
+
+	def setUp(self):
+		cache.clear()
+		self.quote = Quote.objects.create(title="Gaming PC", is_public=True, status=Quote.SENT)
+		self.item = QuoteItem.objects.create(quote=self.quote, description="GPU", unit_price=Decimal("499.00"))
+		self.url = reverse("quotes:public_quote_detail", args=[self.quote.token])
+
+	def _etag(self):
+		response = self.client.get(self.url)
+		self.assertEqual(response.status_code, 200)
+		return response["ETag"]
+
+	def test_unchanged_page_is_not_modified(self):
+		etag = self._etag()
+		response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.content, b"")
+
+	def test_item_change_invalidates_etag_and_fragment(self):
+		etag = self._etag()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.item.description = "Faster GPU"
+			self.item.save()
+		response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, "Faster GPU")
+
+	def test_reservation_is_per_visitor(self):
+		etag = self._etag()
+		self.quote.reserve("someone-else")
+		response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, 'data-accept-state="blocked">')
+
+	def test_own_expired_reservation_shows_only_the_open_button(self):
+		self._etag()
+		self.quote.reserve(self.client.session.session_key)
+		Quote.objects.filter(pk=self.quote.pk).update(reservation_started_at=timezone.now() - timedelta(minutes=Quote.RESERVATION_DURATION + 1))
+		response = self.client.get(self.url)
+		self.assertFalse(response.context["reservation_owned_by_me"])
+		self.assertContains(response, 'data-accept-state="owned" hidden>')
+		self.assertContains(response, 'data-accept-state="open">')
+
+	def test_summary_fragment_is_built_from_the_primary(self):
+		from .views import _quote_summary_html
+		# A copy read from a lagging replica before the price change
+		stale = Quote.objects.get(pk=self.quote.pk)
+		stale.delivery_price = Decimal("99.00")
+		html = _quote_summary_html(stale)
+		self.assertNotIn("£99.00", html)
+		self.assertIn(str(self.quote.delivery_price), html)
+
+	def test_summary_fragment_is_reused(self):
+		self._etag()
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client_class().get(self.url)
+		self.assertContains(response, "GPU")
+		self.assertFalse([q for q in ctx.captured_queries if "quotes_quoteitem" in q["sql"]])
+
+
+@override_settings(QUOTE_EVENTS_POLL_SECONDS=0.01)
+class QuoteEventStreamTests(TestCase):
+	"""Open pages are told about reservation and status changes instead of reloading."""
+
+	def setUp(self):
+		cache.clear()
+		self.quote = Quote.objects.create(title="Gaming PC", is_public=True, status=Quote.SENT)
+
+	def _reserve(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			self.quote.reserve("someone-else")
+
+	async def test_snapshot_then_reservation_event(self):
+		response = await self.async_client.get(reverse("quotes:quote_events"), {"tokens": f"{self.quote.token},not-a-token"})
+		self.assertEqual(response["Content-Type"], "text/event-stream")
+		stream = aiter(response.streaming_content)
+		self.assertTrue((await anext(stream)).startswith(b"retry:"))
+		self.assertIn(b"event: snapshot", await anext(stream))
+		await sync_to_async(self._reserve)()
+		chunk = await anext(stream)
+		self.assertIn(b"event: reserved", chunk)
+		self.assertIn(b'"owned": false', chunk)
+		await response.streaming_content.aclose()
+
+	def test_wsgi_workers_decline_to_stream(self):
+		response = self.client.get(reverse("quotes:quote_events"), {"tokens": str(self.quote.token)})
+		self.assertEqual(response.status_code, 204)
+
+	async def test_unknown_or_missing_tokens(self):
+		self.assertEqual((await self.async_client.get(reverse("quotes:quote_events"))).status_code, 400)
+		missing = "00000000-0000-0000-0000-000000000000"
+		self.assertEqual((await self.async_client.get(reverse("quotes:quote_events"), {"tokens": missing})).status_code, 404)
+		self.assertEqual(parse_tokens(f"{missing}, {missing},x"), [uuid.UUID(missing)])
+
+	def test_expiry_and_release_need_no_reload(self):
+		idle = quote_state(self.quote, None)
+		self.quote.reservation_started_at = timezone.now()
+		reserved = quote_state(self.quote, None)
+		self.assertEqual(event_name(idle, reserved, self.quote), "reserved")
+		self.quote.reservation_started_at -= timedelta(minutes=Quote.RESERVATION_DURATION + 1)
+		self.assertEqual(event_name(reserved, quote_state(self.quote, None), self.quote), "expired")
+		self.quote.reservation_started_at = None
+		self.assertEqual(event_name(reserved, quote_state(self.quote, None), self.quote), "released")
+
+
+class QuoteStatsTests(TestCase):
+	"""Views and accept starts are counted in the cache and written to QuoteStats in bulk."""
+
+	def setUp(self):
+		cache.clear()
+		self.quotes = [Quote.objects.create(title=f"PC {i}", is_public=True, status=Quote.SENT, valid_until=timezone.localdate() + timedelta(days=7)) for i in range(2)]
+
+	def test_views_are_buffered_then_flushed(self):
+		from .stats import flush
+		url = reverse("quotes:public_quote_detail", args=[self.quotes[0].token])
+		for _ in range(3):
+			with CaptureQueriesContext(connection) as ctx:
+				self.client.get(url)
+			self.assertFalse([q for q in ctx.captured_queries if "quotes_quotestats" in q["sql"]])
+		self.client.get(reverse("quotes:public_quote_accept", args=[self.quotes[1].token]))
+		self.assertEqual(QuoteStats.objects.count(), 0)
+
+		with self.assertNumQueries(5):  # quotes, stats for update, insert, and the savepoint pair
+			self.assertEqual(flush(), 2)
+		self.assertEqual(QuoteStats.objects.get(quote=self.quotes[0]).views, 3)
+		self.assertEqual(QuoteStats.objects.get(quote=self.quotes[1]).accept_starts, 1)
+
+		self.client.get(url)
+		self.assertEqual(flush(), 1)
+		self.assertEqual(flush(), 0)
+		self.assertEqual(QuoteStats.objects.get(quote=self.quotes[0]).views, 4)
+
+	def test_overlapping_flushes_do_not_double_count(self):
+		from .stats import PREFIX, flush, record_view
+		record_view(self.quotes[0].pk)
+		cache.add(f"{PREFIX}:flushing", 1)  # another flush is running
+		self.assertEqual(flush(), 0)
+		cache.delete(f"{PREFIX}:flushing")
+		self.assertEqual(flush(), 1)
+		self.assertEqual(QuoteStats.objects.get(quote=self.quotes[0]).views, 1)
+
+	def test_flush_between_queue_steps_does_not_strand_counts(self):
+		from . import stats
+		real_set = cache.set
+
+		def set_after_a_flush(key, *args, **kwargs):
+			# The position is taken but its slot not yet written when another worker flushes
+			if key.startswith(f"{stats.PREFIX}:seq:") and not flushed_midway:
+				flushed_midway.append(stats.flush())
+			return real_set(key, *args, **kwargs)
+
+		flushed_midway = []
+		with mock.patch.object(stats.cache, "set", side_effect=set_after_a_flush):
+			stats.record_view(self.quotes[0].pk)
+		self.assertEqual(flushed_midway, [0])
+		self.assertEqual(stats.flush(), 1)
+		self.assertEqual(QuoteStats.objects.get(quote=self.quotes[0]).views, 1)
+
+	def test_deploy_check_requires_atomic_increments(self):
+		from .checks import stats_cache_check
+		with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/x"}}):
+			self.assertEqual([e.id for e in stats_cache_check(None)], ["quotes.E001"])
+		with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://x"}}):
+			self.assertEqual(stats_cache_check(None), [])
+
+	def test_admin_sorts_by_views(self):
+		from .stats import flush, record_view
+		for quote, views in zip(self.quotes, (1, 2)):
+			for _ in range(views):
+				record_view(quote.pk)
+		flush()
+		self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+		url = reverse("admin:quotes_quote_changelist")
+		column = str(self.client.get(url).context["cl"].list_display.index("view_count"))
+		for order, expected in ((column, self.quotes), (f"-{column}", self.quotes[::-1])):
+			with self.subTest(order):
+				response = self.client.get(url, {"o": order})
+				self.assertEqual(list(response.context["cl"].result_list), expected)
+
+
+class InvoicePaymentTests(TestCase):
+	"""Payment summaries for the portal, admin and PDF, and the applied-payments metric."""
+
+	def setUp(self):
+		quote = Quote.objects.create(title="Build")
+		QuoteItem.objects.create(quote=quote, description="Case", unit_price=Decimal("100.00"))
+		self.invoice = Invoice.create_from_quote(quote)
+
+	def test_summary_totals_and_card_fee(self):
+		from .payments import compute_stripe_fee, summarize_payments
+		for amount, status in (("30.00", InvoicePayment.COMPLETED), ("10.00", InvoicePayment.PENDING), ("5.00", InvoicePayment.FAILED), ("20.00", InvoicePayment.COMPLETED)):
+			InvoicePayment.objects.create(invoice=self.invoice, method="bank-transfer", amount=Decimal(amount), status=status)
+		invoice = Invoice.objects.prefetch_related("payments").get(pk=self.invoice.pk)
+		with self.settings(STRIPE_PUBLIC_KEY="pk", STRIPE_SECRET_KEY="sk", STRIPE_FEE_PERCENT="2.9", STRIPE_FEE_FIXED="0.20", STRIPE_FEE_GROSS_UP=True), self.assertNumQueries(0):
+			summary = summarize_payments(invoice)
+		self.assertEqual([len(summary.completed), len(summary.pending), len(summary.failed)], [2, 1, 1])
+		self.assertEqual(summary.total_completed, Decimal("50.00"))
+		self.assertEqual(summary.outstanding, invoice.total - 50)
+		self.assertEqual(summary.stripe_fee, compute_stripe_fee(summary.outstanding))
+		self.assertEqual(summary.card_total, summary.outstanding + summary.stripe_fee)
+		self.assertTrue(summary.can_pay)
+		with self.settings(STRIPE_SECRET_KEY=""):
+			self.assertEqual(summarize_payments(invoice).stripe_fee, 0)
+
+		with self.settings(STRIPE_FEE_PERCENT="2.9", STRIPE_FEE_FIXED="0.20"):
+			# Grossed up: (100 + 0.20) / 0.971 - 100
+			self.assertEqual(compute_stripe_fee(Decimal("100.00")), Decimal("3.19"))
+			with self.settings(STRIPE_FEE_GROSS_UP=False):
+				self.assertEqual(compute_stripe_fee(Decimal("100.00")), Decimal("3.10"))
+			self.assertEqual(compute_stripe_fee(Decimal("0")), 0)
+
+	def _applied(self):
+		from prometheus_client import REGISTRY
+		return REGISTRY.get_sample_value("pbcuk_payments_applied_total", {"provider": "stripe"}) or 0
+
+	def test_applied_counted_once_when_completed(self):
+		before = self._applied()
+		payment = InvoicePayment.objects.create(invoice=self.invoice, method="card", provider="stripe", amount=Decimal("40.00"))
+		self.assertEqual(self._applied(), before)
+		payment.status = InvoicePayment.COMPLETED
+		payment.save(update_fields=["status"])
+		payment.save()
+		payment.save(update_fields=["provider_reference"])
+		InvoicePayment.objects.create(invoice=self.invoice, method="card", provider="stripe", amount=self.invoice.total - 40, status=InvoicePayment.COMPLETED)
+		self.assertEqual(self._applied(), before + 2)
+		self.invoice.refresh_from_db()
+		self.assertEqual(self.invoice.status, Invoice.PAID)
+
+
+class DailySummaryTests(TestCase):
+	"""Invoice, payment and event writes keep the daily summary rows in step with a full rebuild."""
+
+	def setUp(self):
+		self.quote = Quote.objects.create(title="Build", delivery_price=Decimal("20.00"))
+		QuoteItem.objects.create(quote=self.quote, description="Case", quantity=1, unit_price=Decimal("100.00"), vat_rate=Decimal("20.00"))
+
+	def _rows(self):
+		return list(DailySummary.objects.order_by("date").values("date", *FIGURES))
+
+	def test_writes_update_the_day_incrementally(self):
+		invoice = Invoice.create_from_quote(self.quote)
+		row = DailySummary.objects.get(date=timezone.localdate())
+		self.assertEqual((row.invoices_issued, row.unpaid_count, row.unpaid_total), (1, 1, invoice.total))
+		self.assertEqual(row.net_invoiced + row.delivery_invoiced + row.vat_invoiced, row.gross_invoiced)
+
+		InvoicePayment.objects.create(invoice=invoice, method="card", amount=invoice.total, status=InvoicePayment.COMPLETED)
+		row.refresh_from_db()
+		self.assertEqual((row.unpaid_count, row.unpaid_total, row.invoices_paid, row.payments_received), (0, 0, 1, invoice.total))
+
+		invoice.schedule_build(timezone.localdate())  # touches neither figures nor summary
+		incremental = self._rows()
+		rebuild()
+		self.assertEqual(self._rows(), incremental)
+
+		invoice.delete()
+		self.assertEqual(DailySummary.objects.filter(invoices_issued__gt=0).count(), 0)
+		self.assertEqual(DailySummary.objects.get().payments_received, 0)
+
+	def test_partly_paid_invoices_count_what_is_still_owed(self):
+		invoice = Invoice.create_from_quote(self.quote)
+		payment = InvoicePayment.objects.create(invoice=invoice, method="card", amount=Decimal("50.00"), status=InvoicePayment.COMPLETED)
+		InvoicePayment.objects.create(invoice=invoice, method="card", amount=Decimal("30.00"), status=InvoicePayment.PENDING)
+		today = DailySummary.objects.filter(date=timezone.localdate())
+		self.assertEqual(today.values_list("unpaid_count", "unpaid_total").get(), (1, invoice.total - 50))
+		incremental = self._rows()
+		rebuild()
+		self.assertEqual(self._rows(), incremental)
+
+		payment.delete()
+		self.assertEqual(today.values_list("unpaid_total", flat=True).get(), invoice.total)
+		InvoicePayment.objects.create(invoice=invoice, method="card", amount=invoice.total, status=InvoicePayment.COMPLETED)
+		self.assertEqual(today.values_list("unpaid_count", "unpaid_total").get(), (0, 0))
+		self.assertEqual(aged_debt()[0]["total"], 0)
+
+	def test_report_buckets_aged_debt(self):
+		today = timezone.localdate()
+		invoice = Invoice.create_from_quote(self.quote)
+		Invoice.objects.filter(pk=invoice.pk).update(created_at=timezone.now() - timedelta(days=45))
+		rebuild()
+		buckets = {bucket["label"]: bucket for bucket in aged_debt(today)}
+		self.assertEqual(buckets["31–60 days"]["count"], 1)
+		self.assertEqual(buckets["0–30 days"]["total"], 0)
+		self.assertEqual(sum(row["invoices_issued"] for row in monthly(3, today)), 1)
+
+		self.client.force_login(User.objects.create_user("staff", "staff@example.com", "pw", is_staff=True))
+		response = self.client.get(reverse("sales_report"), {"months": "3"})
+		self.assertContains(response, "31–60 days")
+		self.assertEqual(response.context["debt_total"], invoice.total)
+
+
+class CsvExportTests(TestCase):
+	"""Exports stream values_list rows in chunks, filtered by date range and status."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.invoices = []
+		for days_ago, status in ((40, Invoice.PAID), (5, Invoice.UNPAID), (1, Invoice.PAID)):
+			quote = Quote.objects.create(title=f"Build {days_ago}")
+			QuoteItem.objects.create(quote=quote, description="Case", unit_price=Decimal("50.00"))
+			invoice = Invoice.create_from_quote(quote)
+			Invoice.objects.filter(pk=invoice.pk).update(status=status, created_at=timezone.now() - timedelta(days=days_ago))
+			cls.invoices.append(invoice)
+		QuoteAcceptance.objects.create(quote=quote, full_name="Ann Smith", email="ann@example.com", phone="0", address_line1="1 High St", city="Leeds", postcode="LS1 1AA")
+		cls.staff = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+	def _export(self, *args):
+		out = io.StringIO()
+		call_command("export_csv", *args, stdout=out)
+		return list(csv.reader(io.StringIO(out.getvalue())))
+
+	def test_command_filters_by_date_and_status(self):
+		since = (timezone.localdate() - timedelta(days=10)).isoformat()
+		rows = self._export("invoices", "--since", since)
+		self.assertEqual(rows[0], EXPORTS["invoices"].header)
+		self.assertEqual([r[0] for r in rows[1:]], [self.invoices[1].number, self.invoices[2].number])
+		rows = self._export("invoices", "--since", since, "--status", Invoice.PAID)
+		self.assertEqual([r[0] for r in rows[1:]], [self.invoices[2].number])
+		self.assertEqual(len(self._export("quote_items")), 4)
+
+	def test_formula_like_text_is_escaped(self):
+		QuoteAcceptance.objects.filter(quote__reference=self.invoices[2].quote.reference).update(company='=HYPERLINK("http://x")', address_line2="@SUM(A1)", city="-1+1")
+		row = self._export("acceptances")[1]
+		self.assertEqual(row[3:9], ["'=HYPERLINK(\"http://x\")", "ann@example.com", "0", "1 High St", "'@SUM(A1)", "'-1+1"])
+
+	def test_date_filters_compare_the_raw_column(self):
+		sql = str(EXPORTS["payments"].queryset(timezone.localdate(), timezone.localdate()).query)
+		self.assertIn('"quotes_invoicepayment"."created_at" >=', sql)
+		self.assertNotIn("django_datetime_cast_date", sql)
+
+	def test_admin_action_streams_csv(self):
+		self.client.force_login(self.staff)
+		response = self.client.post(reverse("admin:quotes_invoice_changelist"), {
+			"action": "export_csv",
+			"_selected_action": [i.pk for i in self.invoices[:2]],
+		})
+		self.assertTrue(response.streaming)
+		self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+		lines = b"".join(response.streaming_content).decode().splitlines()
+		self.assertEqual(len(lines), 3)
+		self.assertTrue(lines[1].startswith(self.invoices[0].number))
+
+	async def test_admin_action_streams_asynchronously_under_asgi(self):
+		await self.async_client.aforce_login(self.staff)
+		response = await self.async_client.post(reverse("admin:quotes_quoteacceptance_changelist"), {
+			"action": "export_csv",
+			"select_across": "1",
+			"index": "0",
+			"_selected_action": ["0"],
+		})
+		self.assertTrue(response.is_async)
+		lines = b"".join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+		self.assertEqual(lines[0], ",".join(EXPORTS["acceptances"].header))
+		self.assertEqual([line.split(",")[2] for line in lines[1:]], ["Ann Smith"])
+
+
+@override_settings(SYNC_TOKEN="sync-secret", SYNC_SETTLE_SECONDS=0, SYNC_PAGE_SIZE=2)
+class SyncFeedTests(TestCase):
+	"""The bookkeeping feed pages through changes after an opaque cursor and returns only the delta."""
+
+	def setUp(self):
+		self.invoices = []
+		for n in range(3):
+			quote = Quote.objects.create(title=f"Build {n}")
+			QuoteItem.objects.create(quote=quote, description="Case", unit_price=Decimal("50.00"))
+			self.invoices.append(Invoice.create_from_quote(quote))
+
+	def _pull(self, cursor=""):
+		response = self.client.get(reverse("quotes:invoice_sync"), {"cursor": cursor}, HTTP_AUTHORIZATION="Bearer sync-secret")
+		self.assertEqual(response.status_code, 200)
+		return response.json()
+
+	def _pull_all(self, cursor=""):
+		seen = {"invoices": [], "payments": [], "events": []}
+		while True:
+			page = self._pull(cursor)
+			for kind in seen:
+				seen[kind] += [row["id"] for row in page[kind]]
+			cursor = page["cursor"]
+			if not page["has_more"]:
+				return seen, cursor
+
+	def test_pages_then_returns_only_the_delta(self):
+		seen, cursor = self._pull_all()
+		self.assertEqual(seen["invoices"], [i.pk for i in self.invoices])
+
+		self.invoices[0].mark_paid()
+		seen, cursor = self._pull_all(cursor)
+		self.assertEqual(seen["invoices"], [self.invoices[0].pk])
+		self.assertEqual(len(seen["events"]), 1)
+
+		seen, _ = self._pull_all(cursor)
+		self.assertEqual(seen, {"invoices": [], "payments": [], "events": []})
+
+	def test_requires_token_or_staff_and_a_valid_cursor(self):
+		self.assertEqual(self.client.get(reverse("quotes:invoice_sync")).status_code, 403)
+		response = self.client.get(reverse("quotes:invoice_sync"), {"cursor": "nope"}, HTTP_AUTHORIZATION="Bearer sync-secret")
+		self.assertEqual(response.status_code, 400)
+
+	def test_command_saves_the_cursor(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			cursor_file = Path(tmp) / "cursor"
+			out = io.StringIO()
+			call_command("sync_changes", "--cursor-file", str(cursor_file), stdout=out, stderr=io.StringIO())
+			self.assertEqual(len(out.getvalue().splitlines()), 3)
+			self.assertTrue(cursor_file.read_text().strip())
+			out = io.StringIO()
+			call_command("sync_changes", "--cursor-file", str(cursor_file), stdout=out, stderr=io.StringIO())
+			self.assertEqual(out.getvalue(), "")
+
+
+class ArchiveTests(TestCase):
+	"""Settled invoices move into compressed archive rows and stay readable from the portal and PDF."""
+
+	def setUp(self):
+		self.customer = User.objects.create_user("cust", "cust@example.com", "pw")
+		self.old, self.recent = [self._invoice(days_ago) for days_ago in (800, 10)]
+
+	def _invoice(self, days_ago):
+		quote = Quote.objects.create(title=f"Build {days_ago}")
+		QuoteItem.objects.create(quote=quote, description="Case", unit_price=Decimal("50.00"), vat_rate=Decimal("20.00"))
+		QuoteAcceptance.objects.create(quote=quote, full_name="Ann Smith", email="cust@example.com", phone="0", address_line1="1 High St", city="Leeds", postcode="LS1 1AA")
+		invoice = Invoice.create_from_quote(quote, user=self.customer)
+		InvoicePayment.objects.create(invoice=invoice, method="card", amount=invoice.total, status=InvoicePayment.COMPLETED)
+		invoice.refresh_from_db()
+		invoice.schedule_shipping(timezone.localdate())
+		then = timezone.now() - timedelta(days=days_ago)
+		Invoice.objects.filter(pk=invoice.pk).update(created_at=then, paid_at=then, shipping_date=then.date())
+		return invoice
+
+	def test_archives_settled_invoices_and_keeps_summaries(self):
+		rebuild()
+		summaries = list(DailySummary.objects.values_list("date", *FIGURES))
+		out = io.StringIO()
+		call_command("archive_invoices", "--days", "365", stdout=out)
+		self.assertIn("Archived 1 invoice(s)", out.getvalue())
+		self.assertFalse(Invoice.objects.filter(pk=self.old.pk).exists())
+		self.assertFalse(Quote.objects.filter(pk=self.old.quote_id).exists())
+		self.assertTrue(Invoice.objects.filter(pk=self.recent.pk).exists())
+		self.assertEqual(list(DailySummary.objects.values_list("date", *FIGURES)), summaries)
+		rebuild()
+		self.assertEqual(list(DailySummary.objects.values_list("date", *FIGURES)), summaries)
+
+		restored = ArchivedInvoice.objects.get(number=self.old.number).restore()
+		with self.assertNumQueries(0):
+			self.assertEqual([i.description for i in restored.quote.items.all()], ["Case"])
+			self.assertEqual(restored.quote.acceptance.full_name, "Ann Smith")
+			self.assertEqual(sum(p.amount for p in restored.payments.all()), self.old.total)
+
+	def test_archives_stale_unaccepted_quotes(self):
+		then = timezone.now() - timedelta(days=800)
+		stale, edited, accepted = [Quote.objects.create(title=title, status=status) for title, status in (("Stale", Quote.DECLINED), ("Edited", Quote.SENT), ("Accepted", Quote.ACCEPTED))]
+		QuoteItem.objects.create(quote=stale, description="Fan", unit_price=Decimal("9.00"))
+		Quote.objects.filter(pk__in=[stale.pk, edited.pk, accepted.pk]).update(created_at=then, updated_at=then)
+		Quote.objects.filter(pk=edited.pk).update(updated_at=timezone.now())
+
+		out = io.StringIO()
+		call_command("archive_invoices", "--days", "365", "--dry-run", stdout=out)
+		self.assertIn("1 unaccepted quote(s) would be archived", out.getvalue())
+		with CaptureQueriesContext(connection) as ctx:
+			call_command("archive_invoices", "--days", "365", stdout=out)
+		self.assertIn("Archived 1 unaccepted quote(s)", out.getvalue())
+		self.assertEqual(set(Quote.objects.values_list("title", flat=True)), {"Edited", "Accepted", "Build 10"})
+		archived = ArchivedQuote.objects.get()
+		self.assertEqual((archived.reference, archived.status), (stale.reference, Quote.DECLINED))
+		self.assertEqual([i["description"] for i in json.loads(zlib.decompress(archived.data))["items"]], ["Fan"])
+		# Items cascading with their quote don't touch it on the way out
+		self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "quotes_quote"')])
+
+	def test_portal_and_pdf_fall_back_to_the_archive(self):
+		call_command("archive_invoices", "--days", "365", stdout=io.StringIO())
+		self.client.force_login(self.customer)
+		response = self.client.get(reverse("accounts:invoice_detail", args=[self.old.number]))
+		self.assertContains(response, self.old.number)
+		self.assertNotContains(response, "data-timeline-url")
+		response = self.client.get(reverse("quotes:invoice_pdf", args=[self.old.number]))
+		self.assertEqual(response["Content-Type"], "application/pdf")
+		self.client.force_login(User.objects.create_user("other", "other@example.com", "pw"))
+		self.assertEqual(self.client.get(reverse("accounts:invoice_detail", args=[self.old.number])).status_code, 404)
+		self.assertEqual(self.client.get(reverse("quotes:invoice_pdf", args=[self.old.number])).status_code, 404)
+		self.client.logout()
+		self.assertEqual(self.client.get(reverse("quotes:invoice_pdf", args=[self.old.number])).status_code, 302)
+
+
+@mock.patch("quotes.pdf.generate_invoice_pdf", return_value=b"%PDF-1")
+class InvoicePdfAccessTests(TestCase):
+	"""Invoice numbers are sequential, so a PDF needs its owner, staff or a signed link."""
+
+	def setUp(self):
+		cache.clear()
+		self.customer = User.objects.create_user("cust", "cust@example.com", "pw")
+		quote = Quote.objects.create(title="Build")
+		QuoteItem.objects.create(quote=quote, description="Case", unit_price=Decimal("50.00"))
+		self.invoice = Invoice.create_from_quote(quote, user=self.customer)
+		self.url = reverse("quotes:invoice_pdf", args=[self.invoice.number])
+
+	def test_owner_and_staff_only(self, render):
+		self.assertRedirects(self.client.get(self.url), f"{reverse('accounts:login')}?next={self.url}", fetch_redirect_response=False)
+		self.client.force_login(User.objects.create_user("other", "other@example.com", "pw"))
+		self.assertEqual(self.client.get(self.url).status_code, 404)
+		for user in (self.customer, User.objects.create_user("staff", "staff@example.com", "pw", is_staff=True)):
+			self.client.force_login(user)
+			self.assertEqual(self.client.get(self.url)["Content-Type"], "application/pdf")
+
+	def test_signed_link_from_the_thanks_page(self, render):
+		from .views import invoice_pdf_url
+		# Accepted while logged in to an account the invoice isn't linked to
+		self.client.force_login(User.objects.create_user("other", "other@example.com", "pw"))
+		response = self.client.get(reverse("quotes:public_quote_thanks", args=[self.invoice.quote.token]))
+		link = invoice_pdf_url(self.invoice.number)
+		self.assertContains(response, link)
+		self.assertEqual(self.client.get(link)["Content-Type"], "application/pdf")
+		self.assertEqual(self.client.get(f"{self.url}?token=forged").status_code, 404)
+		# A token is only good for its own invoice
+		other = Invoice.create_from_quote(Quote.objects.create(title="Other"))
+		token = link.split("token=")[1]
+		self.assertEqual(self.client.get(reverse("quotes:invoice_pdf", args=[other.number]), {"token": token}).status_code, 404)
+
+
+# Blocks of 1 stay inside the test's transaction; larger ones would commit apart on PostgreSQL
+@override_settings(REFERENCE_BLOCK_SIZES={"Q": 1, "INV": 1})
+class ReferenceNumberingTests(TestCase):
+	"""References and invoice numbers count up per prefix and day."""
+
+	def test_sequential_per_prefix_and_day(self):
+		day = timezone.localdate()
+		quotes = [Quote.objects.create(title=f"Build {n}") for n in range(3)]
+		self.assertEqual([q.reference for q in quotes], [f"Q-{day:%Y%m%d}-{n:04d}" for n in (1, 2, 3)])
+		QuoteItem.objects.create(quote=quotes[0], description="Case", unit_price=Decimal("50.00"))
+		self.assertEqual(Invoice.create_from_quote(quotes[0]).number, f"INV-{day:%Y%m%d}-0001")
+		from .numbering import next_number
+		self.assertEqual(next_number("Q", day - timedelta(days=1)), 1)
+
+
+@override_settings(REFERENCE_BLOCK_SIZES={"Q": 5, "INV": 1})
+class ReferenceBlockTests(TransactionTestCase):
+	"""Outside a transaction a process reserves a block of numbers and hands them out from memory."""
+
+	def setUp(self):
+		from . import numbering
+		self.numbering = numbering
+		numbering._blocks.clear()
+		self.addCleanup(numbering._blocks.clear)
+
+	def test_hands_out_a_block_per_reservation(self):
+		first = self.numbering.next_number("Q")
+		with self.assertNumQueries(0):
+			rest = [self.numbering.next_number("Q") for _ in range(4)]
+		self.assertEqual([first, *rest], [1, 2, 3, 4, 5])
+		self.numbering._blocks.clear()  # another process
+		self.assertEqual(self.numbering.next_number("Q"), 6)
+		self.assertEqual(ReferenceCounter.objects.get(prefix="Q").last, 10)
+		self.assertEqual([self.numbering.next_number("INV") for _ in range(2)], [1, 2])
+		self.assertEqual(ReferenceCounter.objects.get(prefix="INV").last, 2)
+
+	@skipIf(connection.vendor == "postgresql", "PostgreSQL reserves the block on a separate connection")
+	def test_reserves_one_number_inside_a_transaction(self):
+		with self.assertRaises(RuntimeError), transaction.atomic():
+			self.assertEqual(self.numbering.next_number("Q"), 1)
+			raise RuntimeError
+		# Rolled back with the caller, and nothing was cached for it
+		self.assertEqual(self.numbering.next_number("Q"), 1)
+
+	def test_separate_reservation_commits_on_its_own(self):
+		day = timezone.localdate()
+		self.assertEqual([self.numbering._reserve_apart("default", "Q", day, 5) for _ in range(2)], [5, 10])
+		self.assertEqual(ReferenceCounter.objects.get(prefix="Q").last, 10)
+
+	@skipUnless(connection.vendor == "postgresql", "SQLite reserves one number inside the caller's transaction")
+	def test_reserves_a_block_apart_from_the_callers_transaction(self):
+		with self.assertRaises(RuntimeError), transaction.atomic():
+			self.assertEqual(self.numbering.next_number("Q"), 1)
+			raise RuntimeError
+		# The block outlived the rollback, so its numbers are never handed out twice
+		self.assertEqual(ReferenceCounter.objects.get(prefix="Q").last, 5)
+		self.assertEqual(self.numbering.next_number("Q"), 2)
+
+
+class AcceptanceServiceTests(TestCase):
+	"""Acceptance is all-or-nothing under the quote's row lock; the email waits for the commit."""
+
+	def setUp(self):
+		self.quote = Quote.objects.create(title="Build", is_public=True)
+		QuoteItem.objects.create(quote=self.quote, description="Case", unit_price=Decimal("50.00"))
+		self.data = {"full_name": "Ann Smith", "email": "ann@example.com", "phone": "0", "address_line1": "1 High St", "city": "Leeds", "postcode": "LS1 1AA"}
+
+	def _form(self):
+		from .forms import QuoteAcceptanceForm
+		form = QuoteAcceptanceForm(self.data)
+		self.assertTrue(form.is_valid(), form.errors)
+		return form
+
+	def test_only_one_session_gets_the_reservation(self):
+		stale = Quote.objects.get(pk=self.quote.pk)
+		self.assertEqual(acceptance.reserve(self.quote, "first"), acceptance.ACQUIRED)
+		self.assertEqual(acceptance.reserve(self.quote, "first"), acceptance.HELD)
+		# A copy read before the first reservation still loses
+		self.assertEqual(acceptance.reserve(stale, "second"), acceptance.CONFLICT)
+		self.assertEqual(stale.reservation_session_key, "first")
+
+	def test_accept_closes_the_quote_and_emails_after_commit(self):
+		acceptance.reserve(self.quote, "visitor")
+		with self.captureOnCommitCallbacks() as callbacks:
+			invoice = acceptance.accept(self.quote, "visitor", self._form())
+			self.assertEqual(len(mail.outbox), 0)
+		with mock.patch("quotes.pdf.cached_invoice_pdf") as warm:
+			for callback in callbacks:
+				callback()
+		warm.assert_called_once_with(invoice.pk, self.quote.pk)
+		self.assertEqual(mail.outbox[0].to, ["ann@example.com"])
+		self.quote.refresh_from_db()
+		self.assertEqual(self.quote.status, Quote.ACCEPTED)
+		self.assertFalse(self.quote.is_public)
+		self.assertIsNone(self.quote.reservation_session_key)
+		self.assertEqual(invoice.quote_id, self.quote.pk)
+
+	def test_failure_rolls_everything_back(self):
+		acceptance.reserve(self.quote, "visitor")
+		with mock.patch.object(Invoice, "create_from_quote", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+			acceptance.accept(self.quote, "visitor", self._form())
+		self.quote.refresh_from_db()
+		self.assertEqual(self.quote.status, Quote.DRAFT)
+		self.assertEqual(self.quote.reservation_session_key, "visitor")
+		self.assertFalse(QuoteAcceptance.objects.filter(quote=self.quote).exists())
+
+	def test_rejects_a_lapsed_reservation(self):
+		with self.assertRaises(acceptance.AcceptanceRejected) as caught:
+			acceptance.accept(self.quote, "visitor", self._form())
+		self.assertEqual(caught.exception.outcome, acceptance.EXPIRED)
+		self.assertFalse(QuoteAcceptance.objects.exists())
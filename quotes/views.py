@@ -1,14 +1,32 @@
+import hashlib
+from asgiref.sync import sync_to_async
+from datetime import datetime, timedelta
+from django.contrib.auth.views import redirect_to_login
+from django.core import signing
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.utils.crypto import constant_time_compare
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib import messages
-from .models import Quote, QuoteAcceptance, Invoice, InvoicePayment
-from django.http import HttpResponse, JsonResponse
+from .models import ArchivedInvoice, Quote, QuoteAcceptance, Invoice, InvoicePayment
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
+from . import acceptance
 from .forms import QuoteAcceptanceForm
+from core.metrics import QUOTE_RESERVATIONS, WEBHOOK_DURATION, WEBHOOK_REQUESTS
+from core.cache import get_or_set as cache_get_or_set
+from core.replica import read_from_replica
+from core.shortcuts import aget_object_or_404, arender
+from .events import load_quotes, parse_tokens, quote_event_stream
+from .stats import record_accept_start, record_view
+from .sync import InvalidCursor, changes
 
 
 def _ensure_session(request):
@@ -26,27 +44,90 @@ def _record_visit(request, quote: Quote):
 		request.session["visited_quote_tokens"] = tokens
 
 
-def public_quote_detail(request, token):
-	quote = get_object_or_404(Quote, token=token)
-	is_expired = quote.valid_until and quote.valid_until < timezone.localdate()
-	session_key = _ensure_session(request)
-	_record_visit(request, quote)
-	context = {
-		"quote": quote,
-		"items": quote.items.all(),
-		"is_expired": is_expired,
-		"reservation_active": quote.is_reservation_active,
-		"reservation_expires_at": quote.reservation_expires_at,
-		"reservation_seconds_remaining": quote.reservation_seconds_remaining,
-		"reservation_owned_by_me": bool(quote.reservation_session_key and quote.reservation_session_key == session_key),
-	}
-	return render(request, "quotes/quote_detail.html", context)
+async def _aensure_session(request):
+	if not request.session.session_key:
+		await request.session.asave()
+	return request.session.session_key
+
+
+async def _arecord_visit(request, quote: Quote):
+	tokens = await request.session.aget("visited_quote_tokens", [])
+	token_str = str(quote.token)
+	if token_str not in tokens:
+		tokens.append(token_str)
+		await request.session.aset("visited_quote_tokens", tokens)
+
+
+def _quote_detail_validators(quote: Quote, session_key: str, user_id, is_expired: bool):
+	"""ETag and Last-Modified for the public quote page as this visitor would see it.
+
+	``Quote.updated_at`` covers the quote and its items (item saves touch it, see
+	``signals``); reservations are saved with ``update_fields`` and expire without
+	a write, so their state is folded in separately.
+	"""
+	active = quote.is_reservation_active
+	owned = bool(active and quote.reservation_session_key == session_key)
+	parts = [
+		quote.pk, quote.updated_at.isoformat(), is_expired,
+		quote.reservation_started_at.isoformat() if quote.reservation_started_at else "", active, owned,
+		user_id or "",
+	]
+	etag = quote_etag(hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest())
+
+	changes = [quote.updated_at]
+	if quote.reservation_started_at:
+		changes.append(quote.reservation_started_at)
+		if not active:
+			changes.append(quote.reservation_expires_at)
+	if is_expired:
+		# The page flipped to "expired" at the first midnight past valid_until
+		changes.append(timezone.make_aware(datetime.combine(quote.valid_until + timedelta(days=1), datetime.min.time())))
+	return etag, max(changes)
+
+
+def _quote_summary_html(quote: Quote) -> str:
+	"""Items table and totals: identical for every visitor, so rendered once per quote version."""
+	def render_summary():
+		# ``quote`` may come from a lagging replica; get_or_set runs this on the primary.
+		# The table and the subtotal/VAT/total properties all read the items; load them once
+		current = Quote.objects.prefetch_related("items").get(pk=quote.pk)
+		return render_to_string("quotes/_quote_summary.html", {"quote": current, "items": current.items.all()})
+
+	return mark_safe(cache_get_or_set("quote-summary", [("quote", quote.pk)], render_summary))
+
+
+@read_from_replica
+async def public_quote_detail(request, token):
+	quote = await aget_object_or_404(Quote.objects.all(), token=token)
+	if request.method == "GET":
+		await sync_to_async(record_view)(quote.pk)
+	is_expired = bool(quote.valid_until and quote.valid_until < timezone.localdate())
+	session_key = await _aensure_session(request)
+	await _arecord_visit(request, quote)
+	user = await request.auser()
+
+	etag, last_modified = _quote_detail_validators(quote, session_key, user.pk, is_expired)
+	response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+	if response is None:
+		response = await arender(request, "quotes/quote_detail.html", {
+			"quote": quote,
+			"summary_html": await sync_to_async(_quote_summary_html)(quote),
+			"is_expired": is_expired,
+			"reservation_active": quote.is_reservation_active,
+			"reservation_expires_at": quote.reservation_expires_at,
+			"reservation_seconds_remaining": quote.reservation_seconds_remaining,
+			"reservation_owned_by_me": bool(quote.is_reservation_active and quote.reservation_session_key == session_key),
+		})
+	response["ETag"] = etag
+	response["Last-Modified"] = http_date(last_modified.timestamp())
+	# Revalidate every time: the reservation banner can change without the quote changing
+	patch_cache_control(response, private=True, no_cache=True)
+	return response
 
 
 def public_quote_accept(request, token):
 	quote = get_object_or_404(Quote, token=token)
-	is_expired = quote.valid_until and quote.valid_until < timezone.localdate()
-	if is_expired or quote.status in {Quote.ACCEPTED, Quote.DECLINED, Quote.EXPIRED}:
+	if not acceptance.is_open(quote):
 		messages.error(request, "This quote is not available for acceptance.")
 		return redirect("quotes:public_quote_detail", token=quote.token)
 
@@ -55,27 +136,28 @@ def public_quote_accept(request, token):
 
 	# Visiting the accept page triggers a reservation lock for 15 minutes
 	if request.method == "GET":
-		if quote.is_reservation_active and quote.reservation_session_key != session_key:
+		outcome = acceptance.reserve(quote, session_key)
+		QUOTE_RESERVATIONS.labels(outcome).inc()
+		if outcome == acceptance.CONFLICT:
 			messages.error(request, "This quote is currently reserved. Please try again soon.")
 			return redirect("quotes:public_quote_detail", token=quote.token)
-		if not quote.is_reservation_active:
-			quote.reserve(session_key)
+		if outcome == acceptance.ACQUIRED:
+			record_accept_start(quote.pk)
 
 	if request.method == "POST":
 		if not quote.is_reservation_active or quote.reservation_session_key != session_key:
+			QUOTE_RESERVATIONS.labels(acceptance.EXPIRED).inc()
 			messages.error(request, "Your reservation expired. Please start acceptance again.")
 			return redirect("quotes:public_quote_detail", token=quote.token)
 		form = QuoteAcceptanceForm(request.POST)
 		if form.is_valid():
-			acceptance = form.save(commit=False)
-			acceptance.quote = quote
-			acceptance.save()
-			quote.status = Quote.ACCEPTED
-			quote.clear_reservation()
-			quote.save(update_fields=["status"])
-			if not hasattr(quote, "invoice"):
-				user_for_invoice = request.user if request.user.is_authenticated else None
-				Invoice.create_from_quote(quote, user=user_for_invoice)
+			try:
+				acceptance.accept(quote, session_key, form, user=request.user if request.user.is_authenticated else None)
+			except acceptance.AcceptanceRejected as exc:
+				if exc.outcome == acceptance.EXPIRED:
+					QUOTE_RESERVATIONS.labels(exc.outcome).inc()
+				messages.error(request, str(exc))
+				return redirect("quotes:public_quote_detail", token=quote.token)
 			messages.success(request, "Thank you. Your acceptance has been recorded.")
 			return redirect("quotes:public_quote_thanks", token=quote.token)
 	else:
@@ -87,27 +169,87 @@ def public_quote_accept(request, token):
 		"reservation_active": quote.is_reservation_active,
 		"reservation_expires_at": quote.reservation_expires_at,
 		"reservation_seconds_remaining": quote.reservation_seconds_remaining,
-		"reservation_owned_by_me": bool(quote.reservation_session_key and quote.reservation_session_key == session_key),
+		"reservation_owned_by_me": bool(quote.is_reservation_active and quote.reservation_session_key == session_key),
 		"contact_fields": [form["full_name"], form["email"], form["phone"], form["company"]],
 		"address_fields": [form["address_line1"], form["address_line2"], form["city"], form["postcode"]],
 	})
 
 
-def public_quote_thanks(request, token):
-	quote = get_object_or_404(Quote, token=token)
+@read_from_replica
+async def public_quote_thanks(request, token):
+	quote = await aget_object_or_404(Quote.objects.select_related("invoice"), token=token)
 	invoice = getattr(quote, "invoice", None)
-	return render(request, "quotes/quote_thanks.html", {"quote": quote, "invoice": invoice})
+	return await arender(request, "quotes/quote_thanks.html", {
+		"quote": quote,
+		"invoice": invoice,
+		# The quote's token already identifies the visitor; let them open the PDF without an account
+		"invoice_pdf_url": invoice_pdf_url(invoice.number) if invoice else None,
+	})
+
+
+async def quote_events(request):
+	"""Server-sent reservation and status events for the quotes in ``?tokens=``."""
+	tokens = parse_tokens(request.GET.get("tokens", ""))
+	if not tokens:
+		return JsonResponse({"error": "tokens required"}, status=400)
+	if "wsgi.version" in request.META:
+		# A sync worker would be tied up for the whole stream. 204 tells EventSource not to
+		# reconnect; pages keep their local countdown.
+		return HttpResponse(status=204)
+	quotes = await load_quotes(tokens)
+	if not quotes:
+		raise Http404("No quotes found")
+	response = StreamingHttpResponse(quote_event_stream(quotes, request.session.session_key), content_type="text/event-stream")
+	response["Cache-Control"] = "no-cache"
+	response["X-Accel-Buffering"] = "no"  # let proxies pass events through as they are sent
+	return response
+
+
+PDF_TOKEN_SALT = "quotes.invoice-pdf"
+
+
+def invoice_pdf_url(number: str) -> str:
+	"""A PDF link that works without logging in, for the visitor who has just accepted the quote."""
+	token = signing.Signer(salt=PDF_TOKEN_SALT).sign(number).rsplit(":", 1)[1]
+	return f"{reverse('quotes:invoice_pdf', args=[number])}?token={token}"
 
 
+def _has_pdf_token(request, number: str) -> bool:
+	try:
+		signing.Signer(salt=PDF_TOKEN_SALT).unsign(f"{number}:{request.GET.get('token', '')}")
+	except signing.BadSignature:
+		return False
+	return True
+
+
+@read_from_replica
 def invoice_pdf(request, number):
-	invoice = get_object_or_404(Invoice, number=number)
+	# Invoice numbers are sequential, so the number alone must not give the customer's details away
+	invoice = Invoice.objects.only("pk", "number", "quote_id", "user_id").filter(number=number).first()
+	archived = None
+	if invoice is None:
+		archived = get_object_or_404(ArchivedInvoice.objects.only("pk", "number", "user_id"), number=number)
+	if not _has_pdf_token(request, number):
+		if not request.user.is_authenticated:
+			return redirect_to_login(request.get_full_path())
+		owner_id = (archived or invoice).user_id
+		if not (request.user.is_staff or request.user.pk == owner_id):
+			raise Http404("No Invoice matches the given query.")
 	try:
-		from .pdf import generate_invoice_pdf
+		from .pdf import cached_invoice_pdf, generate_invoice_pdf
 	except ImportError:
 		return HttpResponse("PDF generation library not installed.", status=501)
-	pdf_bytes = generate_invoice_pdf(invoice)
+
+	if archived is not None:
+		# Archived invoices never change; only the company details can
+		pdf_bytes = cache_get_or_set(
+			"invoice-pdf", [("archived-invoice", archived.pk), ("company",)],
+			lambda: generate_invoice_pdf(ArchivedInvoice.objects.get(pk=archived.pk).restore()),
+		)
+	else:
+		pdf_bytes = cached_invoice_pdf(invoice.pk, invoice.quote_id)
 	response = HttpResponse(pdf_bytes, content_type="application/pdf")
-	response["Content-Disposition"] = f"inline; filename={invoice.number}.pdf"
+	response["Content-Disposition"] = f"inline; filename={number}.pdf"
 	return response
 
 
@@ -144,6 +286,20 @@ def invoice_add_payment(request, number):
 	return JsonResponse({"status": "ok", "payment_id": payment.id, "invoice_status": invoice.status})
 
 
+def invoice_sync(request):
+	"""Invoices, payments and events changed since ``?cursor=`` (see ``quotes.sync``)."""
+	token = settings.SYNC_TOKEN
+	auth = request.headers.get("Authorization", "")
+	token_ok = bool(token) and auth.startswith("Bearer ") and constant_time_compare(auth[7:], token)
+	if not (token_ok or (request.user.is_authenticated and request.user.is_staff)):
+		return JsonResponse({"error": "forbidden"}, status=403)
+	try:
+		page = changes(request.GET.get("cursor", ""))
+	except InvalidCursor as exc:
+		return JsonResponse({"error": str(exc)}, status=400)
+	return JsonResponse(page)
+
+
 @csrf_exempt
 @require_POST
 def invoice_webhook(request):
@@ -152,6 +308,17 @@ def invoice_webhook(request):
 	Expected JSON body keys:
 	  invoice_number, method, amount, status (optional), provider, provider_reference
 	"""
+	with WEBHOOK_DURATION.labels("invoice").time():
+		try:
+			response = _handle_invoice_webhook(request)
+		except Http404:
+			WEBHOOK_REQUESTS.labels("invoice", "404").inc()
+			raise
+	WEBHOOK_REQUESTS.labels("invoice", str(response.status_code)).inc()
+	return response
+
+
+def _handle_invoice_webhook(request):
 	secret = request.headers.get("X-Webhook-Secret") or request.META.get("HTTP_X_WEBHOOK_SECRET")
 	if not secret or secret != getattr(settings, "PAYMENT_WEBHOOK_SECRET", ""):
 		return JsonResponse({"error": "Forbidden"}, status=403)
@@ -0,0 +1,52 @@
+(function(){
+  // Long-polls the invoice timeline and adds new events to the top of the list
+  var WAIT_SECONDS = 25;
+  function pad(n){return n<10?"0"+n:String(n)}
+  function format(iso){
+    var d=new Date(iso);
+    return d.getFullYear()+"-"+pad(d.getMonth()+1)+"-"+pad(d.getDate())+" "+pad(d.getHours())+":"+pad(d.getMinutes());
+  }
+
+  function start(){
+    var box=document.querySelector('[data-timeline-url]');
+    if(!box) return;
+    var list=box.querySelector('[data-timeline-events]');
+    var url=box.getAttribute('data-timeline-url');
+    var lastId=parseInt(box.getAttribute('data-last-id'),10)||0;
+    var failures=0;
+
+    function add(event){
+      var empty=list.querySelector('[data-timeline-empty]');
+      if(empty) empty.remove();
+      var li=document.createElement('li');
+      li.textContent='• '+format(event.created_at)+' — '+event.label+(event.message ? ': '+event.message : '');
+      list.insertBefore(li, list.firstChild);
+    }
+
+    function poll(){
+      if(document.visibilityState!=='visible'){
+        document.addEventListener('visibilitychange', poll, {once:true});
+        return;
+      }
+      fetch(url+'?since='+lastId+'&wait='+WAIT_SECONDS, {credentials:'same-origin', headers:{'Accept':'application/json'}})
+        .then(function(r){ if(!r.ok) throw new Error(r.status); return r.json(); })
+        .then(function(data){
+          failures=0;
+          data.events.forEach(add);
+          lastId=data.last_id;
+          // A server that cannot hold the request answers at once; don't spin
+          setTimeout(poll, data.events.length ? 0 : 5000);
+        })
+        .catch(function(){
+          failures=Math.min(failures+1, 6);
+          setTimeout(poll, 1000*Math.pow(2, failures));
+        });
+    }
+    poll();
+  }
+  if(document.readyState==='loading'){
+    document.addEventListener('DOMContentLoaded', start);
+  } else {
+    start();
+  }
+})();
@@ -1,5 +1,4 @@
 (function(){
-  var didReload = false;
   function pad(n){return n<10?"0"+n:String(n)}
   function format(ms){
     if(ms<0) ms=0;
@@ -8,6 +7,8 @@
     var s=total%60;
     return pad(m)+":"+pad(s);
   }
+
+  // Timers only change once a second; expiry is shown in place and confirmed by the event stream
   function tick(){
     var now=Date.now();
     document.querySelectorAll('[data-expires]').forEach(function(el){
@@ -15,19 +16,65 @@
       if(!until) return;
       var left = until - now;
       el.textContent = format(left);
-      if(left<=0){
-        el.classList.add('expired');
-        if(!didReload && el.getAttribute('data-refresh-when-expired') === 'true' && document.visibilityState === 'visible'){
-          didReload = true;
-          setTimeout(function(){ location.reload(); }, 300);
-        }
+      if(left<=0) el.classList.add('expired');
+    });
+  }
+
+  function badge(expiresAt){
+    var outer=document.createElement('span');
+    outer.className='badge reserved';
+    outer.appendChild(document.createTextNode('Reserved · '));
+    var timer=document.createElement('span');
+    timer.className='countdown';
+    timer.setAttribute('data-expires', expiresAt);
+    outer.appendChild(timer);
+    return outer;
+  }
+
+  function apply(state){
+    document.querySelectorAll('[data-quote-token="'+state.token+'"]').forEach(function(el){
+      el.replaceChildren();
+      if(state.reserved) el.appendChild(badge(state.expires_at));
+    });
+    document.querySelectorAll('[data-quote-status="'+state.token+'"]').forEach(function(el){
+      el.textContent = state.status_display;
+    });
+    document.querySelectorAll('[data-quote-accept="'+state.token+'"]').forEach(function(el){
+      if(state.status==='accepted' || state.status==='declined' || state.status==='expired'){
+        el.hidden = true;
+        return;
       }
+      var current = state.owned ? 'owned' : (state.reserved ? 'blocked' : 'open');
+      el.querySelectorAll('[data-accept-state]').forEach(function(option){
+        option.hidden = option.getAttribute('data-accept-state') !== current;
+      });
+    });
+    tick();
+  }
+
+  function subscribe(){
+    var url=document.body.getAttribute('data-quote-events-url');
+    if(!url || !window.EventSource) return;
+    var tokens=[];
+    document.querySelectorAll('[data-quote-token]').forEach(function(el){
+      var token=el.getAttribute('data-quote-token');
+      if(tokens.indexOf(token)===-1) tokens.push(token);
+    });
+    if(!tokens.length) return;
+    var source=new EventSource(url+'?tokens='+encodeURIComponent(tokens.join(',')));
+    ['snapshot','reserved','released','expired','status'].forEach(function(name){
+      source.addEventListener(name, function(e){ apply(JSON.parse(e.data)); });
     });
-    requestAnimationFrame(tick);
+  }
+
+  function start(){
+    tick();
+    setInterval(tick, 1000);
+    subscribe();
   }
   if(document.readyState==='loading'){
-    document.addEventListener('DOMContentLoaded', tick);
+    document.addEventListener('DOMContentLoaded', start);
   } else {
-    tick();
+    start();
   }
-})();
\ No newline at end of file
+})();